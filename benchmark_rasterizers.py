@@ -0,0 +1,63 @@
+import argparse
+import glob
+import time
+
+from PyPDF2 import PdfFileReader
+
+from datasets.rasterizers import RASTERIZERS, create_rasterizer
+from utils.rect import Rect
+
+
+def benchmark_rasterizer(rasterizer, pages, clip_fraction=None):
+    """Returns mean time of rendering of page in ms.
+
+    If clip_fraction is specified, then only central part of page of this fraction of width and height is rendered.
+    """
+    start_time = time.perf_counter()
+    for pdf_file_path, page_number, (width, height) in pages:
+        clip_rect = None
+        if clip_fraction is not None:
+            margin_x = round(width * (1 - clip_fraction) / 2)
+            margin_y = round(height * (1 - clip_fraction) / 2)
+            clip_rect = Rect(margin_x, margin_y, width - margin_x, height - margin_y)
+        rasterizer.render_page(pdf_file_path, page_number, size=(width, height), clip_rect=clip_rect)
+    return 1000 * (time.perf_counter() - start_time) / max(len(pages), 1)
+
+def get_pages(pdf_files_pathes):
+    """Returns PDF file path, page number and size in points of each page."""
+    pages = []
+    for pdf_file_path in pdf_files_pathes:
+        with open(pdf_file_path, 'rb') as pdf_file:
+            reader = PdfFileReader(pdf_file)
+            for page_index in range(reader.getNumPages()):
+                media_box = reader.getPage(page_index).mediaBox
+                size = (round(media_box[2] - media_box[0]), round(media_box[3] - media_box[1]))
+                pages.append((pdf_file_path, page_index + 1, size))
+    return pages
+
+def main(args):
+    pdf_files_pathes = sorted(
+        glob.glob('datasets/ICDAR/dummy_data/*.pdf') + glob.glob('datasets/FinTabNet/dummy_data/pdf/**/*.pdf', recursive=True))
+    pages = get_pages(pdf_files_pathes)
+    print(f'{len(pages)} pages of {len(pdf_files_pathes)} PDF files.')
+    print('|Rasterizer|Page, ms|Clip rect, ms|')
+    print('|-|-|-|')
+    for name in args.rasterizers:
+        rasterizer = create_rasterizer(name)
+        # Warm up.
+        benchmark_rasterizer(rasterizer, pages[:1])
+        page_time = min(benchmark_rasterizer(rasterizer, pages) for _ in range(args.repeats))
+        clip_time = min(benchmark_rasterizer(rasterizer, pages, args.clip_fraction) for _ in range(args.repeats))
+        print(f'|{name}|{page_time:.1f}|{clip_time:.1f}|', flush=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Measures time of rendering of pages of dummy_data PDF files of dataset builders.")
+    parser.add_argument('--rasterizers', default=RASTERIZERS, nargs='+', choices=RASTERIZERS,
+        help='Rasterizers to measure.')
+    parser.add_argument('--clip_fraction', default=0.5, type=float,
+        help='Fraction of page width and height of rendered clip rect.')
+    parser.add_argument('--repeats', default=3, type=int,
+        help='Number of measurements, the best of which is reported.')
+
+    main(parser.parse_args())
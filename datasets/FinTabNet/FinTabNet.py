@@ -1,21 +1,24 @@
 """FinTabNet table recognition dataset."""
 
 from abc import abstractmethod
+from collections import defaultdict
 import xml.etree.ElementTree as ET
 import io
 import json
 
 import tensorflow_datasets as tfds
 import tensorflow as tf
-import pdf2image
 from PyPDF2 import PdfFileReader
 import numpy as np
 
-from table.markup_table import Cell, Table
+from table.markup_table import Cell, Table, MARKUP_TABLE_ROW_SIZE
 from utils.rect import Rect
 from utils.interval import Interval
 from table.grid_structure import GridStructureBuilder
 from split.evaluation import load_model
+from utils.parallel import map_method
+from datasets.rasterizers import PDF2IMAGE_RASTERIZER
+from datasets.raster_cache import create_cached_rasterizer, DEFAULT_MAX_CACHE_SIZE
 from utils.visualization import create_markup_text_image, create_split_result_image
 
 
@@ -41,9 +44,38 @@ class MarkupError(Exception):
   pass
 
 
+# Earlier versions store pickled markup tables. They are supported, so that
+# datasets built before can be loaded (see convert_pickled_markup_tables),
+# but can't be generated.
+_COLUMNAR_MARKUP_TABLE_VERSION = '1.1.0'
+
+
 class FinTabNetBase(tfds.core.GeneratorBasedBuilder):
   """Base DatasetBuilder for FinTabNet datasets."""
 
+  def __init__(self, workers_count=1, rasterizer_name=PDF2IMAGE_RASTERIZER, raster_cache_folder_path=None,
+               max_raster_cache_size=DEFAULT_MAX_CACHE_SIZE, **kwargs):
+    """Examples are generated by workers_count processes, if it's greater than 1.
+
+    Generated examples and their order don't depend on workers_count.
+    Pages are rendered by rasterizer with specified name (see datasets.rasterizers).
+    Images depend on rasterizer, while dataset version doesn't, so dataset built
+    with non-default rasterizer should be kept in a separate data_dir.
+    If raster_cache_folder_path is set, then rendered pages are cached there
+    (see datasets.raster_cache), and may be reused by other builders.
+    """
+    super().__init__(**kwargs)
+    self._workers_count = workers_count
+    self._rasterizer_state = dict(
+      rasterizer_name=rasterizer_name,
+      raster_cache_folder_path=raster_cache_folder_path,
+      max_raster_cache_size=max_raster_cache_size)
+    self._rasterizer = create_cached_rasterizer(rasterizer_name, raster_cache_folder_path, max_raster_cache_size)
+
+  def __getstate__(self):
+    # Builder is pickled to worker processes, which don't spawn workers themselves.
+    return dict(super().__getstate__(), workers_count=1, **self._rasterizer_state)
+
   def _info(self) -> tfds.core.DatasetInfo:
     """Returns the dataset metadata."""
 
@@ -76,43 +108,94 @@ class FinTabNetBase(tfds.core.GeneratorBasedBuilder):
     }
 
   def _generate_examples(self, jsonl_file_name):
-    """Yields examples for specified split."""
-
-    with tf.io.gfile.GFile(jsonl_file_name, 'r') as f:
-      for line in f:
-        sample = json.loads(line)
-        table_id = sample['table_id']
-
-        pdf_file_name = jsonl_file_name.parent / 'pdf' / sample['filename']
-        pdf_height, pdf_width = self._get_pdf_file_shape(pdf_file_name)
-
-        try:
-          cells, rows_count, cols_count = self._get_markup_cells(
-            pdf_height, 
-            sample['html']['structure']['tokens'], 
-            sample['html']['cells'])
-          self._check_no_empty_column(cols_count, cells)
-          self._check_no_empty_row(rows_count, cells)
-          self._check_text_from_adjacent_columns_do_not_intersect(cols_count, cells)
-          self._check_text_from_adjacent_rows_do_not_intersect(rows_count, cells)
-          
-          table_rect = self._get_bounding_rect(cells)
-          table = Table(table_id, table_rect, cells)
-          table_image = self._get_table_image(pdf_file_name, table_rect)
-
-          # Uncomment to debug.
-          #if table_id == 4261:
-          #  create_split_result_image(
-          #    table_image, table.create_horz_split_points_mask(), 
-          #    table.create_vert_split_points_mask()).save('{}_split_points.png'.format(table_id))
-          #  create_markup_text_image(table_image, table).save('{}_markup_text.png'.format(table_id))
-          yield table_id, self._get_single_example_dict(table_image, table)
-
-        except MarkupError:
-          continue
-        except Exception:
-          print('\nException raised while processing table={}\n'.format(table_id))
-          raise
+    """Yields examples for specified split.
+
+    Tables are grouped by PDF page, so that each page is parsed and rendered
+    once. Pages are ordered by their first table in JSONL file, tables
+    of each page are in the file order. Saved time depends on number of
+    tables per page and cost of rendering: dummy data (23 tables on 17
+    pages) is built with 17 parses and 10 renders instead of 39 and 16,
+    but in the same time, which is dominated by other work.
+    """
+
+    pdf_folder_path = jsonl_file_name.parent / 'pdf'
+    pages = (
+      (pdf_folder_path / filename, lines)
+      for filename, lines in self._read_lines_by_page(jsonl_file_name))
+    for examples in map_method(self, '_generate_page_examples', pages, self._workers_count):
+      yield from examples
+
+  def _read_lines_by_page(self, jsonl_file_name):
+    """Yields PDF file name and JSONL lines of its tables for each page.
+
+    Only offsets of lines are kept in memory, lines of each page are read when it's yielded.
+    """
+    lines_offsets = defaultdict(list)
+    with tf.io.gfile.GFile(jsonl_file_name, 'rb') as f:
+      while True:
+        offset = f.tell()
+        line = f.readline()
+        if not line:
+          break
+        lines_offsets[json.loads(line)['filename']].append(offset)
+
+      for filename, offsets in lines_offsets.items():
+        lines = []
+        for offset in offsets:
+          f.seek(offset)
+          lines.append(f.readline())
+        yield filename, lines
+
+  def _generate_page_examples(self, pdf_file_name_and_lines):
+    """Returns list of keys and examples for tables at JSONL lines of PDF page.
+
+    Tables with invalid markup are skipped.
+    """
+
+    pdf_file_name, lines = pdf_file_name_and_lines
+    pdf_height, pdf_width = self._get_pdf_file_shape(pdf_file_name)
+    # Page with several tables is rendered once for the first table with valid markup.
+    page = None
+    examples = []
+    for line in lines:
+      sample = json.loads(line)
+      table_id = sample['table_id']
+
+      try:
+        cells, rows_count, cols_count = self._get_markup_cells(
+          pdf_height, 
+          sample['html']['structure']['tokens'], 
+          sample['html']['cells'])
+        self._check_no_empty_column(cols_count, cells)
+        self._check_no_empty_row(rows_count, cells)
+        self._check_text_from_adjacent_columns_do_not_intersect(cols_count, cells)
+        self._check_text_from_adjacent_rows_do_not_intersect(rows_count, cells)
+        
+        table_rect = self._get_bounding_rect(cells)
+        table = Table(table_id, table_rect, cells)
+        if len(lines) == 1:
+          # The only table of page is rendered without the rest of page.
+          table_image = self._rasterizer.render_page(
+            pdf_file_name, 1, size=(pdf_width, pdf_height), clip_rect=table_rect)
+        else:
+          if page is None:
+            page = self._rasterizer.render_page(pdf_file_name, 1, size=(pdf_width, pdf_height))
+          table_image = page.crop(table_rect.as_tuple())
+
+        # Uncomment to debug.
+        #if table_id == 4261:
+        #  create_split_result_image(
+        #    table_image, table.create_horz_split_points_mask(), 
+        #    table.create_vert_split_points_mask()).save('{}_split_points.png'.format(table_id))
+        #  create_markup_text_image(table_image, table).save('{}_markup_text.png'.format(table_id))
+        examples.append((table_id, self._get_single_example_dict(table_image, table)))
+
+      except MarkupError:
+        continue
+      except Exception:
+        print('\nException raised while processing table={}\n'.format(table_id))
+        raise
+    return examples
 
   @abstractmethod
   def _get_single_example_dict(self, table_image, markup_table):
@@ -137,11 +220,6 @@ class FinTabNetBase(tfds.core.GeneratorBasedBuilder):
 
     return Rect(left, top, right, bottom)
 
-  def _get_table_image(self, pdf_file_name, table_rect):
-    pdf_height, pdf_width = self._get_pdf_file_shape(pdf_file_name)
-    page = pdf2image.convert_from_path(pdf_file_name, size=(pdf_width, pdf_height))[0]
-    return page.crop(table_rect.as_tuple())
-
   def _get_markup_cells(self, page_height, html_tokens, cells_annotations):
     table_tree = ET.fromstring(''.join(html_tokens))
     rows_count = len(table_tree)
@@ -238,13 +316,22 @@ class FinTabNetBase(tfds.core.GeneratorBasedBuilder):
     imgByteArr = imgByteArr.getvalue()
     return imgByteArr
 
+  def _get_markup_table_feature(self):
+    """Returns feature of ground truth table, pickled in versions before columnar encoding."""
+    if self.version < _COLUMNAR_MARKUP_TABLE_VERSION:
+      return tfds.features.Tensor(shape=(), dtype=tf.string)
+    return tfds.features.Tensor(shape=(None, MARKUP_TABLE_ROW_SIZE), dtype=tf.int32, encoding='zlib')
+
 
 class FinTabNetSplit(FinTabNetBase):
   """DatasetBuilder for training SPLIT model."""
 
-  VERSION = tfds.core.Version('1.0.0')
+  VERSION = tfds.core.Version('1.2.0')
+  SUPPORTED_VERSIONS = [tfds.core.Version('1.0.0')]
   RELEASE_NOTES = {
-      '1.0.0': 'Initial release.'
+      '1.0.0': 'Initial release.',
+      '1.1.0': 'Columnar encoding of markup table.',
+      '1.2.0': 'Examples are grouped by PDF page.'
   }
 
   def _get_features_dict(self):
@@ -253,7 +340,7 @@ class FinTabNetSplit(FinTabNetBase):
       'horz_split_points_mask': tfds.features.Tensor(shape=(None,), dtype=tf.bool),
       'vert_split_points_mask': tfds.features.Tensor(shape=(None,), dtype=tf.bool),
       # Ground truth table
-      'markup_table': tfds.features.Tensor(shape=(), dtype=tf.string)
+      'markup_table': self._get_markup_table_feature()
     })
 
   def _get_single_example_dict(self, table_image, markup_table):
@@ -272,10 +359,13 @@ class FinTabNetSplit(FinTabNetBase):
 class FinTabNetMerge(FinTabNetBase):
   """DatasetBuilder for training MERGE model."""
 
-  VERSION = tfds.core.Version('1.0.1')
+  VERSION = tfds.core.Version('1.2.0')
+  SUPPORTED_VERSIONS = [tfds.core.Version('1.0.1')]
   RELEASE_NOTES = {
       '1.0.0': 'Initial release.',
-      '1.0.1': 'Updated split model checkpoint and creation of merge masks.'
+      '1.0.1': 'Updated split model checkpoint and creation of merge masks.',
+      '1.1.0': 'Columnar encoding of markup table.',
+      '1.2.0': 'Examples are grouped by PDF page.'
   }
 
   def __init__(self, split_checkpoint_path='checkpoints/split_fin_tab_net.ckpt', **kwargs):
@@ -284,6 +374,9 @@ class FinTabNetMerge(FinTabNetBase):
     # Lazy initialization
     self._split_model = None
 
+  def __getstate__(self):
+    return dict(super().__getstate__(), split_checkpoint_path=self._split_checkpoint_path)
+
   def _get_features_dict(self):
     return tfds.features.FeaturesDict({
       'image': tfds.features.Image(shape=(None, None, 3)),
@@ -296,7 +389,7 @@ class FinTabNetMerge(FinTabNetBase):
       'merge_right_mask': tfds.features.Tensor(shape=(None, None), dtype=tf.bool, encoding='zlib'),
       'merge_down_mask': tfds.features.Tensor(shape=(None, None), dtype=tf.bool, encoding='zlib'),
       # Ground truth table
-      'markup_table': tfds.features.Tensor(shape=(), dtype=tf.string)
+      'markup_table': self._get_markup_table_feature()
     })
 
   def _get_single_example_dict(self, table_image, markup_table):
@@ -1,6 +1,7 @@
 """ICDAR 2013 table recognition dataset."""
 
 from abc import abstractmethod
+from collections import defaultdict
 import xml.etree.ElementTree as ET
 import io
 import os
@@ -10,13 +11,15 @@ from itertools import chain
 
 import tensorflow_datasets as tfds
 import tensorflow as tf
-import pdf2image
 import PIL
 
-from table.markup_table import Cell, Table
+from table.markup_table import Cell, Table, MARKUP_TABLE_ROW_SIZE
 from utils.rect import Rect
 from table.grid_structure import GridStructureBuilder
 import split.evaluation
+from utils.parallel import map_method
+from datasets.rasterizers import PDF2IMAGE_RASTERIZER
+from datasets.raster_cache import create_cached_rasterizer, DEFAULT_MAX_CACHE_SIZE
 
 
 # TODO(ICDAR): Markdown description  that will appear on the catalog page.
@@ -43,9 +46,38 @@ _FILES_TO_IGNORE = [
 ]
 
 
+# Earlier versions store pickled markup tables. They are supported, so that
+# datasets built before can be loaded (see convert_pickled_markup_tables),
+# but can't be generated.
+_COLUMNAR_MARKUP_TABLE_VERSION = '1.1.0'
+
+
 class IcdarBase(tfds.core.GeneratorBasedBuilder):
   """Base DatasetBuilder for ICDAR datasets."""
 
+  def __init__(self, workers_count=1, rasterizer_name=PDF2IMAGE_RASTERIZER, raster_cache_folder_path=None,
+               max_raster_cache_size=DEFAULT_MAX_CACHE_SIZE, **kwargs):
+    """PDF files are processed by workers_count processes, if it's greater than 1.
+
+    Generated examples and their order don't depend on workers_count.
+    Pages are rendered by rasterizer with specified name (see datasets.rasterizers).
+    Images depend on rasterizer, while dataset version doesn't, so dataset built
+    with non-default rasterizer should be kept in a separate data_dir.
+    If raster_cache_folder_path is set, then rendered pages are cached there
+    (see datasets.raster_cache), and may be reused by other builders.
+    """
+    super().__init__(**kwargs)
+    self._workers_count = workers_count
+    self._rasterizer_state = dict(
+      rasterizer_name=rasterizer_name,
+      raster_cache_folder_path=raster_cache_folder_path,
+      max_raster_cache_size=max_raster_cache_size)
+    self._rasterizer = create_cached_rasterizer(rasterizer_name, raster_cache_folder_path, max_raster_cache_size)
+
+  def __getstate__(self):
+    # Builder is pickled to worker processes, which don't spawn workers themselves.
+    return dict(super().__getstate__(), workers_count=1, **self._rasterizer_state)
+
   def _info(self) -> tfds.core.DatasetInfo:
     """Returns the dataset metadata."""
 
@@ -85,41 +117,59 @@ class IcdarBase(tfds.core.GeneratorBasedBuilder):
   def _generate_examples(self, path):
     """Yields examples."""
 
+    pdf_file_pathes = []
     for pdf_file_path in glob.glob(os.path.join(path, '**/*.pdf'), recursive=True):
       pdf_file_path = pathlib.Path(pdf_file_path)
-      parent_folder_name = pdf_file_path.parts[-2]
-      stem = pdf_file_path.stem
-      if [parent_folder_name, stem] in _FILES_TO_IGNORE:
-        continue
-      
-      region_file_path = pdf_file_path.with_name(stem + '-reg.xml')
-      structure_file_path = pdf_file_path.with_name(stem + '-str.xml')
-
-      pages = pdf2image.convert_from_path(pdf_file_path, dpi=72)
-      for page_number, table in self._generate_tables(pages, region_file_path, structure_file_path):
-        key = '{}-{}-{}'.format(parent_folder_name, stem, table.id)
-        page = pages[page_number]
-        table_image = page.crop(table.rect.as_tuple())
-        yield key, self._get_single_example_dict(table_image, table)
+      if [pdf_file_path.parts[-2], pdf_file_path.stem] not in _FILES_TO_IGNORE:
+        pdf_file_pathes.append(pdf_file_path)
+
+    for examples in map_method(self, '_generate_file_examples', pdf_file_pathes, self._workers_count):
+      yield from examples
+
+  def _generate_file_examples(self, pdf_file_path):
+    """Returns list of keys and examples for tables in PDF file."""
+
+    parent_folder_name = pdf_file_path.parts[-2]
+    stem = pdf_file_path.stem
+    region_file_path = pdf_file_path.with_name(stem + '-reg.xml')
+    structure_file_path = pdf_file_path.with_name(stem + '-str.xml')
+
+    examples = {}
+    for index, page, table in self._generate_tables(pdf_file_path, region_file_path, structure_file_path):
+      key = '{}-{}-{}'.format(parent_folder_name, stem, table.id)
+      table_image = page.crop(table.rect.as_tuple())
+      examples[index] = (key, self._get_single_example_dict(table_image, table))
+    return [examples[index] for index in sorted(examples)]
 
   @abstractmethod
   def _get_single_example_dict(self, table_image, markup_table):
     """Returns dict with nessary inputs for the model."""
     pass
 
-  def _generate_tables(self, pages, region_file_path, structure_file_path):
+  def _generate_tables(self, pdf_file_path, region_file_path, structure_file_path):
+    """Yields indices of tables in region file, tables and images of their pages.
+
+    Tables are grouped by page, so that only pages referenced by region file
+    are rendered, each once, one page at a time.
+    """
     regions_tree = ET.parse(region_file_path)
     structures_tree = ET.parse(structure_file_path)
-    for table_node, table_structure_node in zip(regions_tree.getroot(), structures_tree.getroot()):
-      table_id = int(table_node.get('id'))
-      region_node = table_node.find('region')
-      page_number = int(region_node.get('page')) - 1
-      page_width, page_height = pages[page_number].size
-      table_rect = self._get_bounding_box(page_width, page_height, region_node)
-      cells_node = table_structure_node.find('region')
-      cells = [self._get_cell(page_width, page_height, node) for node in cells_node]
-
-      yield page_number, Table(table_id, table_rect, cells)
+    pages_tables = defaultdict(list)
+    for index, (table_node, table_structure_node) in enumerate(
+        zip(regions_tree.getroot(), structures_tree.getroot())):
+      page_number = int(table_node.find('region').get('page'))
+      pages_tables[page_number].append((index, table_node, table_structure_node))
+
+    for page_number, tables in pages_tables.items():
+      page = self._rasterizer.render_page(pdf_file_path, page_number, dpi=72)
+      page_width, page_height = page.size
+      for index, table_node, table_structure_node in tables:
+        table_id = int(table_node.get('id'))
+        table_rect = self._get_bounding_box(page_width, page_height, table_node.find('region'))
+        cells_node = table_structure_node.find('region')
+        cells = [self._get_cell(page_width, page_height, node) for node in cells_node]
+
+        yield index, page, Table(table_id, table_rect, cells)
 
   def _get_bounding_box(self, page_width, page_height, xml_node):
     bounding_box_node = xml_node.find('bounding-box')
@@ -151,14 +201,22 @@ class IcdarBase(tfds.core.GeneratorBasedBuilder):
     imgByteArr = imgByteArr.getvalue()
     return imgByteArr
 
+  def _get_markup_table_feature(self):
+    """Returns feature of ground truth table, pickled in versions before columnar encoding."""
+    if self.version < _COLUMNAR_MARKUP_TABLE_VERSION:
+      return tfds.features.Tensor(shape=(), dtype=tf.string)
+    return tfds.features.Tensor(shape=(None, MARKUP_TABLE_ROW_SIZE), dtype=tf.int32, encoding='zlib')
+
 
 class IcdarSplit(IcdarBase):
   """DatasetBuilder for training SPLIT model."""
 
-  VERSION = tfds.core.Version('1.0.1')
+  VERSION = tfds.core.Version('1.1.0')
+  SUPPORTED_VERSIONS = [tfds.core.Version('1.0.1')]
   RELEASE_NOTES = {
       '1.0.0': 'Initial release.',
-      '1.0.1': 'Generate markup table.'
+      '1.0.1': 'Generate markup table.',
+      '1.1.0': 'Columnar encoding of markup table.'
   }
 
   def _get_features_dict(self):
@@ -167,7 +225,7 @@ class IcdarSplit(IcdarBase):
       'horz_split_points_mask': tfds.features.Tensor(shape=(None,), dtype=tf.bool),
       'vert_split_points_mask': tfds.features.Tensor(shape=(None,), dtype=tf.bool),
       # Ground truth table
-      'markup_table': tfds.features.Tensor(shape=(), dtype=tf.string)
+      'markup_table': self._get_markup_table_feature()
     })
 
   def _get_single_example_dict(self, table_image, markup_table):
@@ -186,10 +244,12 @@ class IcdarSplit(IcdarBase):
 class IcdarMerge(IcdarBase):
   """DatasetBuilder for training MERGE model."""
 
-  VERSION = tfds.core.Version('1.0.1')
+  VERSION = tfds.core.Version('1.1.0')
+  SUPPORTED_VERSIONS = [tfds.core.Version('1.0.1')]
   RELEASE_NOTES = {
       '1.0.0': 'Initial release.',
-      '1.0.1': 'Generate markup table.'
+      '1.0.1': 'Generate markup table.',
+      '1.1.0': 'Columnar encoding of markup table.'
   }
 
   def __init__(self, split_checkpoint_path='checkpoints/split_icdar.ckpt', **kwargs):
@@ -198,6 +258,9 @@ class IcdarMerge(IcdarBase):
     # Lazy initialization
     self._split_model = None
 
+  def __getstate__(self):
+    return dict(super().__getstate__(), split_checkpoint_path=self._split_checkpoint_path)
+
   def _get_features_dict(self):
     return tfds.features.FeaturesDict({
       'image': tfds.features.Image(shape=(None, None, 3)),
@@ -210,7 +273,7 @@ class IcdarMerge(IcdarBase):
       'merge_right_mask': tfds.features.Tensor(shape=(None, None), dtype=tf.bool, encoding='zlib'),
       'merge_down_mask': tfds.features.Tensor(shape=(None, None), dtype=tf.bool, encoding='zlib'),
       # Ground truth table
-      'markup_table': tfds.features.Tensor(shape=(), dtype=tf.string)
+      'markup_table': self._get_markup_table_feature()
     })
 
   def _get_single_example_dict(self, table_image, markup_table):
@@ -0,0 +1,132 @@
+"""On-disk cache of rendered PDF pages shared by dataset builders."""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from datasets.rasterizers import Rasterizer, create_rasterizer
+
+
+DEFAULT_MAX_CACHE_SIZE = 16 * 2**30
+
+# Cache is shrunk to this fraction of its max size, when the size is exceeded.
+_EVICTION_TARGET_FRACTION = 0.9
+
+_CACHE_FILE_EXTENSION = '.npy'
+
+
+class CachingRasterizer(Rasterizer):
+  """Rasterizer, which stores pages rendered by other rasterizer in cache folder.
+
+  Pages are stored as decoded bitmaps, keyed by hash of PDF file content,
+  page number, render parameters and rasterizer name, so the cache may be
+  shared by builders and survives versions of datasets. Least recently
+  used pages are evicted, when total size of cached pages exceeds max_size
+  bytes. Cache may be used by several processes, then its size may exceed
+  max_size until some process evicts pages. Clip of page is cropped from
+  cached page, if it's cached. Otherwise only clip is rendered (which is
+  faster for some rasterizers), and it's cached separately from page.
+  """
+
+  def __init__(self, rasterizer, rasterizer_name, cache_folder_path, max_size):
+    assert max_size > 0
+    self._rasterizer = rasterizer
+    self._rasterizer_name = rasterizer_name
+    self._cache_folder_path = os.path.expanduser(cache_folder_path)
+    self._max_size = max_size
+    os.makedirs(self._cache_folder_path, exist_ok=True)
+    # Size of cache, which includes pages stored by this process since last eviction.
+    self._size = sum(size for _, size, _ in self._scan_cache_files())
+    self._pdf_files_hashes = {}
+
+  def render_page(self, pdf_file_path, page_number, dpi=72, size=None, clip_rect=None):
+    render_parameters = 'dpi{}'.format(dpi) if size is None else '{}x{}'.format(*size)
+    key = '{}-{}-{}-{}'.format(
+      self._get_pdf_file_hash(pdf_file_path), page_number, render_parameters, self._rasterizer_name)
+    page = self._load_page(self._get_cache_file_path(key))
+    if clip_rect is None:
+      if page is None:
+        page = self._rasterizer.render_page(pdf_file_path, page_number, dpi, size)
+        self._store_page(self._get_cache_file_path(key), page)
+      return page
+
+    if page is not None:
+      return page.crop(clip_rect.as_tuple())
+    clip_cache_file_path = self._get_cache_file_path(key + '-clip{}_{}_{}_{}'.format(*clip_rect.as_tuple()))
+    clip = self._load_page(clip_cache_file_path)
+    if clip is None:
+      clip = self._rasterizer.render_page(pdf_file_path, page_number, dpi, size, clip_rect)
+      self._store_page(clip_cache_file_path, clip)
+    return clip
+
+  def _get_cache_file_path(self, key):
+    return os.path.join(self._cache_folder_path, key + _CACHE_FILE_EXTENSION)
+
+  def _get_pdf_file_hash(self, pdf_file_path):
+    stat = os.stat(pdf_file_path)
+    file_id = (str(pdf_file_path), stat.st_size, stat.st_mtime_ns)
+    if file_id not in self._pdf_files_hashes:
+      with open(pdf_file_path, 'rb') as pdf_file:
+        self._pdf_files_hashes[file_id] = hashlib.sha256(pdf_file.read()).hexdigest()
+    return self._pdf_files_hashes[file_id]
+
+  def _load_page(self, cache_file_path):
+    try:
+      page = Image.fromarray(np.load(cache_file_path))
+    except (FileNotFoundError, ValueError, OSError):
+      # Page isn't cached, was evicted by other process or is partially written.
+      return None
+    # Access time is tracked as modification time, as access times may be disabled in file system.
+    try:
+      os.utime(cache_file_path)
+    except FileNotFoundError:
+      pass
+    return page
+
+  def _store_page(self, cache_file_path, page):
+    # Page is written to temporary file and renamed, so that other processes never read partial page.
+    file_descriptor, temp_file_path = tempfile.mkstemp(dir=self._cache_folder_path, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'wb') as temp_file:
+      np.save(temp_file, np.asarray(page.convert('RGB')))
+    self._size += os.path.getsize(temp_file_path)
+    os.replace(temp_file_path, cache_file_path)
+    if self._size > self._max_size:
+      self._evict_pages()
+
+  def _evict_pages(self):
+    cache_files = sorted(self._scan_cache_files(), key=lambda cache_file: cache_file[2])
+    self._size = sum(size for _, size, _ in cache_files)
+    for path, size, _ in cache_files:
+      if self._size <= _EVICTION_TARGET_FRACTION * self._max_size:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        # Evicted by other process.
+        pass
+      self._size -= size
+
+  def _scan_cache_files(self):
+    # Returns path, size and modification time of each cached page.
+    result = []
+    with os.scandir(self._cache_folder_path) as entries:
+      for entry in entries:
+        if not entry.name.endswith(_CACHE_FILE_EXTENSION):
+          continue
+        try:
+          stat = entry.stat()
+        except FileNotFoundError:
+          continue
+        result.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return result
+
+
+def create_cached_rasterizer(rasterizer_name, cache_folder_path=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE):
+  """Returns rasterizer with specified name (see datasets.rasterizers), which uses cache if its folder is set."""
+  rasterizer = create_rasterizer(rasterizer_name)
+  if cache_folder_path is None:
+    return rasterizer
+  return CachingRasterizer(rasterizer, rasterizer_name, cache_folder_path, max_cache_size)
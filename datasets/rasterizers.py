@@ -0,0 +1,94 @@
+"""Rasterizers of PDF pages used by dataset builders.
+
+'pdf2image' rasterizer runs pdftoppm subprocess for each page. 'pdfium'
+rasterizer renders pages in process with pypdfium2 (which isn't required
+by other rasterizers), directly into NumPy buffer of resulting image.
+Images of the same page rendered by different rasterizers are similar,
+but not identical. Rasterizer isn't part of builders' version or config,
+so datasets built with different rasterizers should be kept in separate
+data_dir folders.
+
+'pdfium' rasterizer requires pypdfium2>=4,<5 (see requirements.txt),
+as it uses pypdfium2.raw and PdfPage API of version 4.
+"""
+
+from abc import ABC, abstractmethod
+import math
+
+import numpy as np
+import pdf2image
+from PIL import Image
+
+
+PDF2IMAGE_RASTERIZER = 'pdf2image'
+PDFIUM_RASTERIZER = 'pdfium'
+
+
+class Rasterizer(ABC):
+  """Renders pages of PDF files to RGB images."""
+
+  @abstractmethod
+  def render_page(self, pdf_file_path, page_number, dpi=72, size=None, clip_rect=None):
+    """Returns PIL image of page with 1-based page_number.
+
+    Page is rendered with dpi resolution, or is scaled to (width, height)
+    size, if it's specified. If clip_rect (utils.rect.Rect in pixels of
+    rendered page) is specified, then only this part of page is returned.
+    """
+    pass
+
+
+class Pdf2ImageRasterizer(Rasterizer):
+  def render_page(self, pdf_file_path, page_number, dpi=72, size=None, clip_rect=None):
+    page = pdf2image.convert_from_path(
+      pdf_file_path, dpi=dpi, size=size, first_page=page_number, last_page=page_number)[0]
+    if clip_rect is not None:
+      page = page.crop(clip_rect.as_tuple())
+    return page
+
+
+class PdfiumRasterizer(Rasterizer):
+  def __init__(self):
+    # Optional dependency.
+    import pypdfium2
+    self._pdfium = pypdfium2
+
+  def render_page(self, pdf_file_path, page_number, dpi=72, size=None, clip_rect=None):
+    pdfium_c = self._pdfium.raw
+    document = self._pdfium.PdfDocument(str(pdf_file_path))
+    try:
+      page = document[page_number - 1]
+      if size is None:
+        page_width, page_height = page.get_size()
+        size = (math.ceil(page_width * dpi / 72), math.ceil(page_height * dpi / 72))
+      left, top, right, bottom = clip_rect.as_tuple() if clip_rect is not None else (0, 0, *size)
+
+      # Only clip rect of page scaled to size is rendered into white image.
+      image = np.full((bottom - top, right - left, 3), 255, dtype=np.uint8)
+      if image.size > 0:
+        bitmap = pdfium_c.FPDFBitmap_CreateEx(
+          right - left, bottom - top, pdfium_c.FPDFBitmap_BGR, image.ctypes.data, image.strides[0])
+        try:
+          pdfium_c.FPDF_RenderPageBitmap(
+            bitmap, page.raw, -left, -top, size[0], size[1], 0,
+            pdfium_c.FPDF_ANNOT | pdfium_c.FPDF_REVERSE_BYTE_ORDER)
+        finally:
+          pdfium_c.FPDFBitmap_Destroy(bitmap)
+      page.close()
+    finally:
+      document.close()
+    return Image.fromarray(image)
+
+
+_RASTERIZERS_CLASSES = {
+  PDF2IMAGE_RASTERIZER: Pdf2ImageRasterizer,
+  PDFIUM_RASTERIZER: PdfiumRasterizer
+}
+
+RASTERIZERS = list(_RASTERIZERS_CLASSES)
+
+
+def create_rasterizer(name=PDF2IMAGE_RASTERIZER):
+  """Returns rasterizer with specified name."""
+  assert name in RASTERIZERS
+  return _RASTERIZERS_CLASSES[name]()
@@ -8,18 +8,40 @@ import split.evaluation
 import merge.evaluation
 from datasets.ICDAR.ICDAR import IcdarSplit
 from datasets.FinTabNet.FinTabNet import FinTabNetSplit
+from table.markup_table import convert_pickled_markup_tables
+from utils.batching import bucket_by_image_size
+from utils.resolution import ResolutionPolicy
+from utils.precision import PRECISIONS, FLOAT32_PRECISION
 
 
-def main(args):
-    module = split.evaluation if args.model_type == 'SPLIT' else merge.evaluation
-    model = module.load_model(args.model_file_path, True)
+def load_dataset(module, model_type, dataset_name, split, batch_size, bucket_size, dataset_version=None):
+    ds_suffix = '_split' if model_type == 'SPLIT' else '_merge'
+    ds_version = ':' + dataset_version if dataset_version else ''
+    ds = convert_pickled_markup_tables(tfds.load(dataset_name + ds_suffix + ds_version, split=split))
+    if batch_size > 1:
+        ds = ds.map(module.convert_ds_element_to_padded_tuple)
+        ds = bucket_by_image_size(
+            ds, batch_size, bucket_size, module.get_padding_values())
+    else:
+        ds = ds.map(module.convert_ds_element_to_tuple)
+        ds = ds.batch(1)
+    return ds.prefetch(tf.data.AUTOTUNE)
 
-    ds_suffix = '_split' if args.model_type == 'SPLIT' else '_merge'
-    ds = tfds.load(args.dataset_name + ds_suffix, split=args.split)
-    ds = ds.map(module.convert_ds_element_to_tuple)
-    ds = ds.batch(1)
-    ds = ds.prefetch(tf.data.AUTOTUNE)
+def main(args):
+    if args.model_type == 'SPLIT':
+        module = split.evaluation
+        resolution_policy = ResolutionPolicy(args.max_side, args.max_pixels)
+        model = module.load_model(
+            args.model_file_path, True, resolution_policy=resolution_policy,
+            anisotropic_pool_size=args.anisotropic_pool_size, tiling_pixels_budget=args.tiling_pixels_budget,
+            precision=args.precision)
+    else:
+        module = merge.evaluation
+        model = module.load_model(args.model_file_path, True, precision=args.precision)
 
+    ds = load_dataset(
+        module, args.model_type, args.dataset_name, args.split, args.batch_size, args.bucket_size,
+        args.dataset_version)
     model.evaluate(ds)
 
 if __name__ == '__main__':
@@ -29,5 +51,26 @@ if __name__ == '__main__':
     parser.add_argument('dataset_name', help='Name of the dataset to evaluate on.', 
         choices=['icdar', 'fin_tab_net'])
     parser.add_argument('split', choices=['train', 'test'], help='Name of the dataset split to evaluate.')
+    parser.add_argument('--dataset_version',
+        help='Version of the dataset, e.g. 1.0.1 for dataset built with pickled markup tables. Latest by default.')
+    parser.add_argument('--batch_size', default=1, type=int,
+        help='Number of tables in batch. Tables of similar size are padded and batched together.')
+    parser.add_argument('--bucket_size', default=64, type=int,
+        help='Max padding (in pixels) of table image in each dimension, when batch_size > 1.')
+    parser.add_argument('--precision', default=FLOAT32_PRECISION, choices=PRECISIONS,
+        help='Precision of activations. Falls back to float32, if bfloat16 is not supported natively.')
+    parser.add_argument('--max_side', type=int,
+        help='SPLIT only. Images with longer side exceeding this value are downscaled before inference.')
+    parser.add_argument('--max_pixels', type=int,
+        help='SPLIT only. Images with more pixels than this value are downscaled before inference.')
+    parser.add_argument('--anisotropic_pool_size', type=int,
+        help='SPLIT only. Pool size of model trained with anisotropic downsampling of RPN and CPN inputs.')
+    parser.add_argument('--tiling_pixels_budget', type=int,
+        help='SPLIT only. Compute model by tiles for batches with more pixels than this value to bound memory.')
 
-    main(parser.parse_args())
\ No newline at end of file
+    args = parser.parse_args()
+    if args.model_type == 'MERGE' and any(
+            value is not None for value in [
+                args.max_side, args.max_pixels, args.anisotropic_pool_size, args.tiling_pixels_budget]):
+        parser.error('Resolution, anisotropic pooling and tiling options are supported only for SPLIT model.')
+    main(args)
\ No newline at end of file
@@ -0,0 +1,49 @@
+import argparse
+import time
+
+import tensorflow_datasets as tfds
+
+from datasets.ICDAR.ICDAR import IcdarMerge
+from datasets.FinTabNet.FinTabNet import FinTabNetMerge
+from table.markup_table import convert_pickled_markup_tables
+from utils.shards import write_shards, load_shards
+
+
+def measure_throughput(ds, elements_count):
+    """Returns number of first elements_count elements of ds read per second."""
+    start_time = time.perf_counter()
+    read_elements_count = 0
+    for _ in ds.take(elements_count):
+        read_elements_count += 1
+    return read_elements_count / (time.perf_counter() - start_time)
+
+def main(args):
+    ds_suffix = '_split' if args.model_type == 'SPLIT' else '_merge'
+    ds_version = ':' + args.dataset_version if args.dataset_version else ''
+    # Small splits aren't cached in memory, so that decoding of tfds elements is measured.
+    ds = convert_pickled_markup_tables(tfds.load(
+        args.dataset_name + ds_suffix + ds_version, split=args.split, read_config=tfds.ReadConfig(try_autocache=False)))
+    elements_count = write_shards(ds, args.dst_folder_path, args.examples_per_shard)
+    print(f'{elements_count} elements are written.')
+
+    print('|Dataset|Elements per second|')
+    print('|-|-|')
+    for name, ds in [('tfds', ds), ('shards', load_shards(args.dst_folder_path))]:
+        print(f'|{name}|{measure_throughput(ds, args.benchmark_size):.1f}|', flush=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Exports dataset split to memory-mapped shards of decoded elements for training.")
+    parser.add_argument('model_type', help='Type of model, which dataset is exported.', choices=['SPLIT', 'MERGE'])
+    parser.add_argument('dataset_name', help='Name of the dataset to export.',
+        choices=['icdar', 'fin_tab_net'])
+    parser.add_argument('split', choices=['train', 'test'], help='Name of the dataset split to export.')
+    parser.add_argument('dst_folder_path', help='Path to folder where shards will be stored.')
+    parser.add_argument('--dataset_version',
+        help='Version of the dataset, e.g. 1.0.1 for dataset built with pickled markup tables. Latest by default.')
+    parser.add_argument('--examples_per_shard', default=1024, type=int,
+        help='Number of elements in each shard.')
+    parser.add_argument('--benchmark_size', default=1000, type=int,
+        help='Number of elements read to compare decode throughput of shards and tfds dataset.')
+
+    main(parser.parse_args())
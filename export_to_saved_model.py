@@ -6,18 +6,28 @@ import tensorflow as tf
 
 import split.evaluation
 import merge.evaluation
+from utils.ops import CUSTOM_IMPLEMENTATION, TF_IMPLEMENTATION
+from utils.resolution import ResolutionPolicy, upscale_positions
+from utils.precision import PRECISIONS, FLOAT32_PRECISION
 
 
 class SplergeModel(tf.Module):
-    def __init__(self, split_model, merge_model):
+    def __init__(self, split_model, merge_model, resolution_policy=None):
+        """If resolution_policy (see utils.resolution) is set, then both models
+        are run on downscaled image, and grid positions are mapped back to
+        original image coordinates.
+        """
         super().__init__()
 
         self._split_model = split_model
         self._merge_model = merge_model
+        self._resolution_policy = resolution_policy or ResolutionPolicy()
 
     @tf.function(input_signature=[tf.TensorSpec(shape=(None, None, 3), dtype=tf.int32)])
     def call(self, image):
-        image = tf.expand_dims(image, 0)
+        height = tf.shape(image)[0]
+        width = tf.shape(image)[1]
+        image, _, _ = self._resolution_policy.downscale_image(tf.expand_dims(image, 0))
         split_outputs = self._split_model(image)
         merge_inputs = {
             'image': image,
@@ -27,23 +37,32 @@ class SplergeModel(tf.Module):
             'vert_split_points_binary': split_outputs['vert_split_points_binary']
         }  
         merge_outputs = self._merge_model(merge_inputs)
+        h_positions = upscale_positions(merge_outputs['h_positions'], tf.shape(image)[1], height)
+        v_positions = upscale_positions(merge_outputs['v_positions'], tf.shape(image)[2], width)
         return {
-            'h_positions': merge_outputs['h_positions'],
-            'v_positions': merge_outputs['v_positions'],
-            'cells_grid_rects': merge_outputs['cells_grid_rects']
+            'h_positions': h_positions[0],
+            'v_positions': v_positions[0],
+            'cells_grid_rects': merge_outputs['cells_grid_rects'][0]
         }
 
 
 def main(args):
-    split_model = split.evaluation.load_model(args.split_checkpoint_path, False)
-    merge_model = merge.evaluation.load_model(args.merge_checkpoint_path, False)
+    split_model = split.evaluation.load_model(
+        args.split_checkpoint_path, False, args.ops_implementation, args.fuse_split_networks,
+        anisotropic_pool_size=args.anisotropic_pool_size, tiling_pixels_budget=args.split_tiling_pixels_budget,
+        precision=args.precision)
+    merge_model = merge.evaluation.load_model(
+        args.merge_checkpoint_path, False, args.ops_implementation, args.fuse_merge_branches,
+        precision=args.precision)
 
-    model = SplergeModel(split_model, merge_model)
+    resolution_policy = ResolutionPolicy(args.max_side, args.max_pixels)
+    model = SplergeModel(split_model, merge_model, resolution_policy)
     tf.saved_model.save(model, args.dst_folder_path)
-    # Copy custom ops sources and libs to destination folder.
-    shutil.copytree(
-        './ops', os.path.join(args.dst_folder_path, 'ops'), 
-        dirs_exist_ok=True)
+    if args.ops_implementation == CUSTOM_IMPLEMENTATION:
+        # Copy custom ops sources and libs to destination folder.
+        shutil.copytree(
+            './ops', os.path.join(args.dst_folder_path, 'ops'), 
+            dirs_exist_ok=True)
     
 
 if __name__ == '__main__':
@@ -51,5 +70,22 @@ if __name__ == '__main__':
     parser.add_argument('split_checkpoint_path', help='Path to trained SPLIT model checkpoint.')
     parser.add_argument('merge_checkpoint_path', help='Path to trained MERGE model checkpoint.')
     parser.add_argument('dst_folder_path', help='Path to folder where saved model will be stored.')
+    parser.add_argument('--ops_implementation', default=CUSTOM_IMPLEMENTATION,
+        choices=[CUSTOM_IMPLEMENTATION, TF_IMPLEMENTATION],
+        help='Implementation of SPLERGE ops. Pure TensorFlow one does not require ops/ops.so on deployment host.')
+    parser.add_argument('--fuse_split_networks', action='store_true',
+        help='Compute RPN and CPN of SPLIT model together with fused convolutions.')
+    parser.add_argument('--anisotropic_pool_size', type=int,
+        help='Pool size of SPLIT model trained with anisotropic downsampling of RPN and CPN inputs.')
+    parser.add_argument('--split_tiling_pixels_budget', type=int,
+        help='Compute SPLIT model by tiles for images with more pixels than this value to bound memory.')
+    parser.add_argument('--fuse_merge_branches', action='store_true',
+        help='Compute four branches of MERGE model as a single network with grouped convolutions.')
+    parser.add_argument('--precision', default=FLOAT32_PRECISION, choices=PRECISIONS,
+        help='Precision of activations. Falls back to float32, if bfloat16 is not supported natively on export host.')
+    parser.add_argument('--max_side', type=int,
+        help='Images with longer side exceeding this value are downscaled before inference.')
+    parser.add_argument('--max_pixels', type=int,
+        help='Images with more pixels than this value are downscaled before inference.')
 
     main(parser.parse_args())
\ No newline at end of file
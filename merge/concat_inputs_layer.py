@@ -1,60 +1,69 @@
 import tensorflow as tf
 import tensorflow.keras as keras
 
+from utils.tf_ops import value_rowids
+
 
 class ConcatInputsLayer(keras.layers.Layer):
     def __init__(self):
         super().__init__()
 
-    def call(self, normalized_image, h_probs, v_probs, 
-            h_binary, v_binary, h_positions, v_positions):
+    def call(self, normalized_image, h_probs, v_probs,
+            h_binary, v_binary, h_positions, v_positions, spatial_mask=None):
 
         tf.debugging.assert_shapes([
-            (normalized_image, (1, 'H', 'W', 3)),
-            (h_probs, (1, 'H')),
-            (v_probs, (1, 'W')),
-            (h_binary, (1, 'H')),
-            (v_binary, (1, 'W'))
-        ])    
+            (normalized_image, ('B', 'H', 'W', 3)),
+            (h_probs, ('B', 'H')),
+            (v_probs, ('B', 'W')),
+            (h_binary, ('B', 'H')),
+            (v_binary, ('B', 'W'))
+        ])
+        batch_size = tf.shape(normalized_image)[0]
         height = tf.shape(normalized_image)[1]
         width = tf.shape(normalized_image)[2]
 
-        broadcasted_h_probs = self._broadcast_horz_mask(h_probs, height, width)
-        broadcasted_v_probs = self._broadcast_vert_mask(v_probs, height, width)
-        broadcasted_h_binary = self._broadcast_horz_mask(h_binary, height, width)
-        broadcasted_v_binary = self._broadcast_vert_mask(v_binary, height, width)
+        broadcasted_h_probs = self._broadcast_horz_mask(h_probs, batch_size, height, width)
+        broadcasted_v_probs = self._broadcast_vert_mask(v_probs, batch_size, height, width)
+        broadcasted_h_binary = self._broadcast_horz_mask(h_binary, batch_size, height, width)
+        broadcasted_v_binary = self._broadcast_vert_mask(v_binary, batch_size, height, width)
         grid_image = self._create_grid_image(h_positions, v_positions, height, width)
 
-        return tf.concat([
-            normalized_image, 
-            broadcasted_h_probs, 
-            broadcasted_v_probs, 
+        result = tf.concat([
+            normalized_image,
+            broadcasted_h_probs,
+            broadcasted_v_probs,
             tf.cast(broadcasted_h_binary, tf.float32),
             tf.cast(broadcasted_v_binary, tf.float32),
             grid_image
         ], axis=3)
+        if spatial_mask is not None:
+            result = result * spatial_mask
+        return result
 
-    def _broadcast_horz_mask(self, mask, height, width):
+    def _broadcast_horz_mask(self, mask, batch_size, height, width):
         mask = tf.expand_dims(mask, 2)
         mask = tf.expand_dims(mask, 3)
-        return tf.broadcast_to(mask, (1, height, width, 1))
+        return tf.broadcast_to(mask, (batch_size, height, width, 1))
 
-    def _broadcast_vert_mask(self, mask, height, width):
+    def _broadcast_vert_mask(self, mask, batch_size, height, width):
         mask = tf.expand_dims(mask, 1)
         mask = tf.expand_dims(mask, 3)
-        return tf.broadcast_to(mask, (1, height, width, 1))
+        return tf.broadcast_to(mask, (batch_size, height, width, 1))
 
     def _create_grid_image(self, h_positions, v_positions, height, width):
-        result = tf.zeros(shape=(height, width))
-        result = self._draw_horz_lines(result, h_positions)
-        result = tf.transpose(result)
-        result = self._draw_horz_lines(result, v_positions)
-        result = tf.transpose(result)
-        result = tf.expand_dims(result, 0)
-        result = tf.expand_dims(result, -1)
-        return result
+        h_lines = create_lines_mask(h_positions, height)
+        v_lines = create_lines_mask(v_positions, width)
+        result = tf.maximum(
+            tf.expand_dims(h_lines, 2), tf.expand_dims(v_lines, 1))
+        return tf.expand_dims(result, -1)
+
 
-    def _draw_horz_lines(self, image, positions):
-        indices = tf.expand_dims(positions, -1)
-        updates = tf.ones(shape=(tf.size(positions), tf.shape(image)[1]))
-        return tf.tensor_scatter_nd_update(image, indices, updates)
\ No newline at end of file
+def create_lines_mask(positions, length):
+    """Returns B x length mask of lines at positions (ragged tensor with lines positions of each example)."""
+    indices = tf.stack([
+        tf.cast(value_rowids(positions.row_splits, tf.size(positions.flat_values)), tf.int32),
+        positions.flat_values
+    ], axis=1)
+    updates = tf.ones(shape=(tf.shape(indices)[0],))
+    result = tf.zeros(shape=(positions.nrows(out_type=tf.int32), length))
+    return tf.tensor_scatter_nd_update(result, indices, updates)
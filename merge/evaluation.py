@@ -2,6 +2,10 @@ import os
 import tensorflow as tf
 
 from merge.model import Model
+from merge.training import get_inputs_padding_values
+from utils.ops import CUSTOM_IMPLEMENTATION
+from utils.checkpoints import read_h5_layers_weights, get_layers_weights
+from utils.precision import FLOAT32_PRECISION, precision_policy
 
 
 def run_model_on_random_input(model):
@@ -17,17 +21,47 @@ def run_model_on_random_input(model):
     }
     model(inputs)
 
-def load_model(model_file_path, compute_metric):
+def load_model(model_file_path, compute_metric, ops_implementation=CUSTOM_IMPLEMENTATION,
+               fuse_branches=False, precision=FLOAT32_PRECISION):
     assert os.path.exists(model_file_path)
-    model = Model(compute_metric)
+    with precision_policy(precision):
+        model = Model(compute_metric, ops_implementation, fuse_branches)
     run_model_on_random_input(model)
-    model.load_weights(model_file_path)
+    load_weights(model, model_file_path)
 
-    # Metric can't be calculated in graph mode.
-    run_eagerly = True if compute_metric else False
-    model.compile(run_eagerly=run_eagerly)
+    model.compile()
     return model
 
+# Layers with weights in checkpoints of model with separate and fused branches.
+_UNFUSED_LAYERS_NAMES = [
+    'shared_fully_convolutional_network', 'up_branch', 'down_branch', 'left_branch', 'right_branch']
+_FUSED_LAYERS_NAMES = ['shared_fully_convolutional_network', 'branches']
+
+def load_weights(model, model_file_path):
+    """Loads h5 weights into model.
+
+    Weights of model with separate branches are mapped to fused
+    branches, if model was created with fuse_branches=True.
+    Raises ValueError, if checkpoint doesn't match model.
+    """
+    layers_weights = read_h5_layers_weights(model_file_path)
+    if 'branches' in layers_weights:
+        expected_layers_names = _FUSED_LAYERS_NAMES
+        if not model.fuse_branches:
+            raise ValueError('{} has fused branches, model was created with fuse_branches=False'.format(
+                model_file_path))
+    else:
+        expected_layers_names = _UNFUSED_LAYERS_NAMES
+    if len(layers_weights) != len(expected_layers_names):
+        raise ValueError('Expected layers {} with weights in {}, found: {}'.format(
+            expected_layers_names, model_file_path, list(layers_weights)))
+    layers_weights = get_layers_weights(layers_weights, expected_layers_names, model_file_path)
+
+    if model.fuse_branches and expected_layers_names == _UNFUSED_LAYERS_NAMES:
+        model.set_unfused_weights(layers_weights)
+    else:
+        model.load_weights(model_file_path)
+
 def convert_ds_element_to_tuple(element):
     input_keys = [
         'image', 
@@ -41,4 +75,22 @@ def convert_ds_element_to_tuple(element):
         {
             'markup_table': element['markup_table']  
         }
-    )
\ No newline at end of file
+    )
+
+def convert_ds_element_to_padded_tuple(element):
+    """Same as convert_ds_element_to_tuple, but prepares element for padded batching."""
+
+    inputs, targets = convert_ds_element_to_tuple(element)
+    inputs['height'] = tf.shape(element['image'])[0]
+    inputs['width'] = tf.shape(element['image'])[1]
+    return inputs, targets
+
+def get_padding_values():
+    """Returns padding values for elements created by convert_ds_element_to_padded_tuple."""
+
+    return (
+        get_inputs_padding_values(),
+        {
+            'markup_table': 0
+        }
+    )
@@ -1,36 +1,100 @@
 import tensorflow as tf
 import tensorflow.keras as keras
 
-ops_module = tf.load_op_library('ops/ops.so')
+from utils.tf_ops import get_cells_indices
+
+
+class GridGeometry:
+    """Grid structure of each example in batch, shared by all grid pooling layers.
+
+    h_positions and v_positions are ragged tensors with grid positions of
+    each example (1-D tensors are treated as positions of the only example).
+    height and width are sizes of (padded) batch, heights and widths are
+    sizes of each example's valid region (whole batch by default).
+    """
+    def __init__(self, h_positions, v_positions, height, width, heights=None, widths=None):
+        if not isinstance(h_positions, tf.RaggedTensor):
+            h_positions = tf.RaggedTensor.from_tensor(tf.expand_dims(h_positions, 0))
+        if not isinstance(v_positions, tf.RaggedTensor):
+            v_positions = tf.RaggedTensor.from_tensor(tf.expand_dims(v_positions, 0))
+        batch_size = h_positions.nrows(out_type=tf.int32)
+        if heights is None:
+            heights = tf.fill([batch_size], height)
+        if widths is None:
+            widths = tf.fill([batch_size], width)
+
+        self.rows_count = tf.cast(tf.reduce_max(h_positions.row_lengths()), tf.int32) + 1
+        self.cols_count = tf.cast(tf.reduce_max(v_positions.row_lengths()), tf.int32) + 1
+        # B x H and B x W indices of rows and cols of grid, padded elements
+        # get index rows_count and cols_count respectively.
+        self.rows = self._get_cells_indices(height, heights, h_positions, self.rows_count)
+        self.cols = self._get_cells_indices(width, widths, v_positions, self.cols_count)
+
+        rows_heights = sum_over_cells(tf.ones_like(self.rows, tf.float32), self.rows, self.rows_count)
+        cols_widths = sum_over_cells(tf.ones_like(self.cols, tf.float32), self.cols, self.cols_count)
+        # B x R x C areas of cells, zero for empty cells.
+        self.cells_areas = rows_heights[:, :, tf.newaxis] * cols_widths[:, tf.newaxis, :]
+
+    def _get_cells_indices(self, max_length, lengths, positions, cells_count):
+        positions = positions.with_row_splits_dtype(tf.int64)
+        result = get_cells_indices(max_length, positions.flat_values, positions.row_splits)
+        return tf.where(tf.sequence_mask(lengths, max_length), result, cells_count)
 
 
 class GridPoolingLayer(keras.layers.Layer):
+    """Mean pooling over cells of table grid.
+
+    Full-size tensors kept for backward pass are about half of those of
+    pooling with IndicesCube, but peak memory of MERGE training step isn't
+    reduced measurably: it's dominated by activations of convolutions of
+    grid pooling networks and their gradients.
+    """
     def __init__(self, keep_size):
         super().__init__()
         self._keep_size = keep_size
 
-    def call(self, input, h_positions, v_positions):
-        tf.assert_equal(tf.shape(input)[0], 1)
-        input = input[0]
-
-        height = tf.shape(input)[0]
-        width = tf.shape(input)[1]
-        channels = tf.shape(input)[2]
-
-        multiplier = ops_module.reciprocal_cells_areas_matrix(
-            height, width, h_positions, v_positions
-        )
-        normalized_input = tf.expand_dims(multiplier, -1) * input
-
-        means = tf.zeros(shape=(tf.size(h_positions)+1, tf.size(v_positions)+1, channels))
-        indices = ops_module.indices_cube(
-            height, width, h_positions, v_positions
-        )
-        means = tf.tensor_scatter_nd_add(means, indices, normalized_input)
-        
+    def call(self, input, grid, spatial_mask=None):
+        """Averages input over cells of each example's grid (see GridGeometry).
+
+        If spatial_mask (B x H x W x 1) is specified, then padded region
+        of output is zeroed. Output is padded with zeros.
+        """
+        # Mean over axis-aligned grid is separable, so input is summed
+        # over rows of each cell first, and then over its cols. Sums are accumulated
+        # in float32, if input has lower precision (see utils.precision).
+        sums = sum_over_cells(tf.cast(input, tf.float32), grid.rows, grid.rows_count)
+        sums = sum_over_cells(tf.transpose(sums, [0, 2, 1, 3]), grid.cols, grid.cols_count)
+        sums = tf.transpose(sums, [0, 2, 1, 3])
+        means = tf.math.divide_no_nan(sums, grid.cells_areas[:, :, :, tf.newaxis])
+        means = tf.cast(means, input.dtype)
         if not self._keep_size:
-            return tf.expand_dims(means, axis=0)
+            return means
+
+        # Cols are unpooled first, so that only rows are gathered at full size.
+        result = tf.gather(means, tf.minimum(grid.cols, grid.cols_count - 1), axis=2, batch_dims=1)
+        result = self._unpool_rows(result, tf.minimum(grid.rows, grid.rows_count - 1))
+        if spatial_mask is not None:
+            result = result * spatial_mask
+        return tf.ensure_shape(result, shape=input.shape)
+
+    def _unpool_rows(self, input, rows):
+        # Gathers rows of B x R x ... input by B x H indices. Flat indices are used,
+        # so that gradient is a plain segment sum.
+        batch_size = tf.shape(input)[0]
+        rows_count = tf.shape(input)[1]
+        flat_input = tf.reshape(input, tf.concat([[-1], tf.shape(input)[2:]], axis=0))
+        return tf.gather(flat_input, rows + tf.range(batch_size)[:, tf.newaxis] * rows_count)
+
+
+def sum_over_cells(input, cells, cells_count):
+    """Sums B x N x ... input over cells along axis 1.
 
-        result = tf.gather_nd(means, indices)
-        result = tf.ensure_shape(result, shape=input.shape)
-        return tf.expand_dims(result, axis=0)
+    cells is B x N matrix with cell index of each element,
+    elements with index cells_count are ignored.
+    """
+    batch_size = tf.shape(input)[0]
+    segment_ids = cells + tf.range(batch_size)[:, tf.newaxis] * (cells_count + 1)
+    result = tf.math.unsorted_segment_sum(input, segment_ids, batch_size * (cells_count + 1))
+    result = tf.reshape(
+        result, tf.concat([[batch_size, cells_count + 1], tf.shape(input)[2:]], axis=0))
+    return result[:, :cells_count]
@@ -0,0 +1,89 @@
+import tensorflow as tf
+import tensorflow.keras as keras
+
+from merge.concat_inputs_layer import create_lines_mask
+from utils.outer_product_conv import conv2d_of_outer_products
+
+
+class InputsConvLayer(keras.layers.Layer):
+    """2D convolution with 'same' padding of inputs concatenated by ConcatInputsLayer.
+
+    Inputs aren't concatenated. Split points probabilities and binary masks
+    are constant along rows or cols, and grid image max(h_lines, v_lines)
+    equals h_lines + v_lines - h_lines * v_lines, so their convolutions
+    are computed from 1-D vectors (see conv2d_of_outer_products), and only
+    image is convolved at full size. Kernel is the same as kernel of
+    keras.layers.Conv2D applied to ConcatInputsLayer output.
+
+    Memory trade-off: full-size terms have filters channels, while concatenated
+    input has only image channels + 5, so the layer saves no memory in total.
+    Backward pass has no full-size tensors per term, only the incoming gradient.
+    Peak memory of training step is dominated by grid pooling networks, and
+    it's the same as with concatenation within measurement noise (MERGE train
+    step in tf.function at 800x600 with 30x10 grid on CPU, TF 2.8: peak growth
+    2851-3166 vs 2710-2861 MB).
+    """
+    def __init__(self, filters, kernel_size, activation=None):
+        super().__init__()
+        self._filters = filters
+        self._kernel_size = kernel_size
+        self._activation = keras.activations.get(activation)
+
+    def build(self, input_shape):
+        # Image channels are followed by h_probs, v_probs, h_binary, v_binary and grid image.
+        self.kernel = self.add_weight(
+            'kernel', shape=(self._kernel_size, self._kernel_size, input_shape[-1] + 5, self._filters),
+            initializer='glorot_uniform')
+        self.bias = self.add_weight('bias', shape=(self._filters,), initializer='zeros')
+
+    def call(self, normalized_image, h_probs, v_probs,
+            h_binary, v_binary, h_positions, v_positions, spatial_mask=None):
+
+        tf.debugging.assert_shapes([
+            (normalized_image, ('B', 'H', 'W', 'C')),
+            (h_probs, ('B', 'H')),
+            (v_probs, ('B', 'W')),
+            (h_binary, ('B', 'H')),
+            (v_binary, ('B', 'W'))
+        ])
+        height = tf.shape(normalized_image)[1]
+        width = tf.shape(normalized_image)[2]
+        # Only the first argument is cast to compute dtype by Keras.
+        dtype = self.compute_dtype
+        h_probs = tf.cast(h_probs, dtype)
+        v_probs = tf.cast(v_probs, dtype)
+        if spatial_mask is None:
+            rows_mask = tf.ones_like(h_probs)
+            cols_mask = tf.ones_like(v_probs)
+        else:
+            spatial_mask = tf.cast(spatial_mask, dtype)
+            normalized_image = normalized_image * spatial_mask
+            rows_mask = tf.reduce_max(spatial_mask, axis=[2, 3])
+            cols_mask = tf.reduce_max(spatial_mask, axis=[1, 3])
+        h_lines = tf.cast(create_lines_mask(h_positions, height), dtype) * rows_mask
+        v_lines = tf.cast(create_lines_mask(v_positions, width), dtype) * cols_mask
+
+        image_channels = normalized_image.shape[-1]
+        image_kernel = self.kernel[:, :, :image_channels]
+        h_probs_kernel, v_probs_kernel, h_binary_kernel, v_binary_kernel, grid_kernel = [
+            self.kernel[:, :, image_channels + i:image_channels + i + 1] for i in range(5)
+        ]
+
+        result = tf.nn.conv2d(normalized_image, image_kernel, 1, 'SAME')
+        result += conv2d_of_outer_products([
+            # Channels constant along rows, and h_lines part of grid image.
+            (
+                tf.stack([h_probs * rows_mask, tf.cast(h_binary, dtype) * rows_mask, h_lines], axis=2),
+                cols_mask[:, :, tf.newaxis],
+                tf.concat([h_probs_kernel, h_binary_kernel, grid_kernel], axis=2)
+            ),
+            # Channels constant along cols, and v_lines part of grid image.
+            (
+                rows_mask[:, :, tf.newaxis],
+                tf.stack([v_probs * cols_mask, tf.cast(v_binary, dtype) * cols_mask, v_lines], axis=2),
+                tf.concat([v_probs_kernel, v_binary_kernel, grid_kernel], axis=2)
+            ),
+            # Intersections of lines, which are counted twice above.
+            (h_lines[:, :, tf.newaxis], v_lines[:, :, tf.newaxis], -grid_kernel)
+        ])
+        return self._activation(tf.nn.bias_add(result, self.bias))
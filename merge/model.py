@@ -1,33 +1,52 @@
+import numpy as np
 import tensorflow as tf
 import tensorflow.keras as keras
 
-from merge.grid_pooling_layer import GridPoolingLayer
-from merge.concat_inputs_layer import ConcatInputsLayer
+from merge.grid_pooling_layer import GridPoolingLayer, GridGeometry
+from merge.inputs_conv_layer import InputsConvLayer
 from metrics.adjacency_f_measure import AdjacencyFMeasure
-from table.markup_table import Table
-from table.grid_structure import GridStructureBuilder
-from utils.rect import Rect
+from utils.batching import create_spatial_mask
+from utils.grouped_conv2d import GroupedConv2D, GroupedInitializer
+from utils.ops import get_op, CUSTOM_IMPLEMENTATION
+
+
+def _apply_spatial_mask(input, spatial_mask):
+    # Zeroes padded region, so that it acts like 'same' padding of an unpadded image.
+    if spatial_mask is None:
+        return input
+    return input * spatial_mask
+
+def _concat_by_branch(inputs, branches_count):
+    # Concatenates B x H x W x (branches_count * C_i) inputs, whose channels are grouped
+    # by branch, so that channels of result are grouped by branch too.
+    shape = tf.shape(inputs[0])[:3]
+    result = tf.concat([
+        tf.reshape(input, tf.concat([shape, [branches_count, input.shape[3] // branches_count]], axis=0))
+        for input in inputs
+    ], axis=4)
+    channels = sum(input.shape[3] for input in inputs)
+    return tf.reshape(result, tf.concat([shape, [channels]], axis=0))
 
-ops_module = tf.load_op_library('ops/ops.so')
 
 class SharedFullyConvolutionalNetwork(keras.layers.Layer):
     def __init__(self):
         super().__init__()
         # Original paper suggests to use kernel size = 7,
         # which leads to excessive memory consumption.
-        self._conv1 = keras.layers.Conv2D(18, 3, padding='same', activation='relu')
+        self._conv1 = InputsConvLayer(18, 3, activation='relu')
         #self._pool1 = keras.layers.MaxPool2D()
         self._conv2 = keras.layers.Conv2D(18, 3, padding='same', activation='relu')
         self._conv3 = keras.layers.Conv2D(18, 3, padding='same', activation='relu')
         self._conv4 = keras.layers.Conv2D(18, 3, padding='same', activation='relu')
         #self._pool2 = keras.layers.MaxPool2D()
 
-    def call(self, input):
-        result = self._conv1(input)
+    def call(self, inputs, spatial_mask=None):
+        """Runs network on list of arguments of ConcatInputsLayer."""
+        result = _apply_spatial_mask(self._conv1(*inputs, spatial_mask), spatial_mask)
         #result = self._pool1(result)
-        result = self._conv2(result)
-        result = self._conv3(result)
-        result = self._conv4(result)
+        result = _apply_spatial_mask(self._conv2(result), spatial_mask)
+        result = _apply_spatial_mask(self._conv3(result), spatial_mask)
+        result = _apply_spatial_mask(self._conv4(result), spatial_mask)
         #result = self._pool2(result)
         return result
 
@@ -51,19 +70,20 @@ class GridPoolingNetworkBlock(keras.layers.Layer):
 
         self._concat2 = keras.layers.Concatenate()
 
-    def call(self, input, h_positions, v_positions):
+    def call(self, input, grid, spatial_mask=None):
         middle_result = self._concat1(
             [self._dilated_conv1(input), self._dilated_conv2(input), self._dilated_conv3(input)]
         )
+        middle_result = _apply_spatial_mask(middle_result, spatial_mask)
 
         upper_result = self._upper_branch_conv(middle_result)
-        upper_result = self._upper_branch_pool(upper_result, h_positions, v_positions)
+        upper_result = self._upper_branch_pool(upper_result, grid, spatial_mask)
 
         lower_result = self._lower_branch_conv(middle_result)
         if self._should_output_predictions:
-            predictions = self._prediction_layer(lower_result, h_positions, v_positions)
+            predictions = self._prediction_layer(lower_result, grid, spatial_mask)
             predictions = tf.squeeze(predictions, axis=3)
-        lower_result = self._lower_branch_pool(lower_result, h_positions, v_positions)
+        lower_result = self._lower_branch_pool(lower_result, grid, spatial_mask)
 
         result = self._concat2([upper_result, middle_result, lower_result])
         if self._should_output_predictions:
@@ -81,12 +101,13 @@ class GridPoolingNetworkFinalBlock(keras.layers.Layer):
         self._conv1x1 = keras.layers.Conv2D(1, 1, activation='sigmoid')
         self._prediction_layer = GridPoolingLayer(False)
 
-    def call(self, input, h_positions, v_positions):
+    def call(self, input, grid, spatial_mask=None):
         result = self._concat(
             [self._dilated_conv1(input), self._dilated_conv2(input), self._dilated_conv3(input)]
         )
+        result = _apply_spatial_mask(result, spatial_mask)
         result = self._conv1x1(result)
-        result = self._prediction_layer(result, h_positions, v_positions)
+        result = self._prediction_layer(result, grid, spatial_mask)
         result = tf.squeeze(result, axis=3)
         return result
 
@@ -98,14 +119,118 @@ class GridPoolingNetwork(keras.layers.Layer):
         self._block2 = GridPoolingNetworkBlock(True)
         self._block3 = GridPoolingNetworkFinalBlock()
 
-    def call(self, input, h_positions, v_positions):
-        block1_output = self._block1(input, h_positions, v_positions)
-        block2_output, probs1 = self._block2(block1_output, h_positions, v_positions)
-        probs2 = self._block3(block2_output, h_positions, v_positions)
+    def call(self, input, grid, spatial_mask=None):
+        block1_output = self._block1(input, grid, spatial_mask)
+        block2_output, probs1 = self._block2(block1_output, grid, spatial_mask)
+        probs2 = self._block3(block2_output, grid, spatial_mask)
+        return probs1, probs2
+
+
+class FusedGridPoolingNetworkBlock(keras.layers.Layer):
+    """Several GridPoolingNetworkBlock computed at once.
+
+    Channels of input (unless it's shared by all branches) and output
+    are grouped by branch. Convolutions of branches are grouped ones,
+    and pooling of all branches is done in a single pass.
+    """
+    def __init__(self, branches_count, should_output_predictions, shared_input):
+        super().__init__()
+        self._branches_count = branches_count
+        self._should_output_predictions = should_output_predictions
+
+        def dilated_conv(dilation_rate):
+            if shared_input:
+                return keras.layers.Conv2D(
+                    6 * branches_count, 3, padding='same', activation='relu', dilation_rate=dilation_rate,
+                    kernel_initializer=GroupedInitializer(branches_count))
+            return GroupedConv2D(
+                6 * branches_count, 3, branches_count, activation='relu', dilation_rate=dilation_rate)
+        self._dilated_conv1 = dilated_conv(1)
+        self._dilated_conv2 = dilated_conv(2)
+        self._dilated_conv3 = dilated_conv(3)
+
+        self._upper_branch_conv = GroupedConv2D(
+            18 * branches_count, 1, branches_count, activation='relu', name='upper_branch_conv')
+        self._lower_branch_conv = GroupedConv2D(
+            branches_count, 1, branches_count, activation='sigmoid', name='lower_branch_conv')
+        self._pool = GridPoolingLayer(True)
+        if should_output_predictions:
+            self._prediction_layer = GridPoolingLayer(False)
+
+    def call(self, input, grid, spatial_mask=None):
+        middle_result = _concat_by_branch(
+            [self._dilated_conv1(input), self._dilated_conv2(input), self._dilated_conv3(input)],
+            self._branches_count)
+        middle_result = _apply_spatial_mask(middle_result, spatial_mask)
+
+        upper_result = self._upper_branch_conv(middle_result)
+        lower_result = self._lower_branch_conv(middle_result)
+        if self._should_output_predictions:
+            predictions = self._prediction_layer(lower_result, grid, spatial_mask)
+        pooled_result = self._pool(tf.concat([upper_result, lower_result], axis=3), grid, spatial_mask)
+        upper_result, lower_result = tf.split(
+            pooled_result, [18 * self._branches_count, self._branches_count], axis=3)
+
+        result = _concat_by_branch([upper_result, middle_result, lower_result], self._branches_count)
+        if self._should_output_predictions:
+            return result, predictions
+        return result
+
+
+class FusedGridPoolingNetworkFinalBlock(keras.layers.Layer):
+    def __init__(self, branches_count):
+        super().__init__()
+        self._branches_count = branches_count
+        self._dilated_conv1 = GroupedConv2D(
+            6 * branches_count, 3, branches_count, activation='relu', dilation_rate=1)
+        self._dilated_conv2 = GroupedConv2D(
+            6 * branches_count, 3, branches_count, activation='relu', dilation_rate=2)
+        self._dilated_conv3 = GroupedConv2D(
+            6 * branches_count, 3, branches_count, activation='relu', dilation_rate=3)
+        self._conv1x1 = GroupedConv2D(branches_count, 1, branches_count, activation='sigmoid')
+        self._prediction_layer = GridPoolingLayer(False)
+
+    def call(self, input, grid, spatial_mask=None):
+        result = _concat_by_branch(
+            [self._dilated_conv1(input), self._dilated_conv2(input), self._dilated_conv3(input)],
+            self._branches_count)
+        result = _apply_spatial_mask(result, spatial_mask)
+        result = self._conv1x1(result)
+        return self._prediction_layer(result, grid, spatial_mask)
+
+
+class FusedGridPoolingNetwork(keras.layers.Layer):
+    """Several GridPoolingNetwork with the same input computed at once.
+
+    Outputs are B x R x C x branches_count predictions of all branches.
+    """
+    def __init__(self, branches_count, name):
+        super().__init__(name=name)
+        self._block1 = FusedGridPoolingNetworkBlock(branches_count, False, True)
+        self._block2 = FusedGridPoolingNetworkBlock(branches_count, True, False)
+        self._block3 = FusedGridPoolingNetworkFinalBlock(branches_count)
+
+    def call(self, input, grid, spatial_mask=None):
+        block1_output = self._block1(input, grid, spatial_mask)
+        block2_output, probs1 = self._block2(block1_output, grid, spatial_mask)
+        probs2 = self._block3(block2_output, grid, spatial_mask)
         return probs1, probs2
 
+    def set_branches_weights(self, branches_weights):
+        """Sets weights from weights of each GridPoolingNetwork (see get_weights)."""
+        # Layers of both networks create weights in the same order, and weights of
+        # each branch are contiguous along output channels (the last axis).
+        self.set_weights([
+            np.concatenate(weights, axis=-1) for weights in zip(*branches_weights)
+        ])
+
 
 class CombineOutputsLayer(keras.layers.Layer):
+    """Combines predictions of 4 branches into merge probabilities.
+
+    Inputs are B x R x C grid predictions, padded for examples with less rows or columns.
+    Outputs in padded region are meaningless and should be ignored.
+    """
     def call(self, up_prob, down_prob, left_prob, right_prob):
         merge_down_prob = (
             0.5 * up_prob[:, 1:, :] * down_prob[:, :-1, :] 
@@ -119,47 +244,87 @@ class CombineOutputsLayer(keras.layers.Layer):
 
 
 class Model(keras.models.Model):
-    def __init__(self, compute_metric=False):
+    def __init__(self, compute_metric=False, ops_implementation=CUSTOM_IMPLEMENTATION, fuse_branches=False):
+        """ops_implementation selects implementation of batched ops (see utils.ops).
+
+        If fuse_branches is True, then four branches are computed as a single
+        FusedGridPoolingNetwork. Weights of model with separate branches
+        may be loaded with set_unfused_weights.
+        """
         super().__init__()
         self._normalize_image_layer = keras.layers.experimental.preprocessing.Rescaling(
             scale=1./255)
-        self._concat_inputs_layer = ConcatInputsLayer()
         self._sfcn = SharedFullyConvolutionalNetwork()
-        self._up_branch = GridPoolingNetwork('up_branch')
-        self._down_branch = GridPoolingNetwork('down_branch')
-        self._left_branch = GridPoolingNetwork('left_branch')
-        self._right_branch = GridPoolingNetwork('right_branch')
-        self._combine_outputs1 = CombineOutputsLayer()
-        self._combine_outputs2 = CombineOutputsLayer()
-
-        self._metric = AdjacencyFMeasure() if compute_metric else None
+        self._fuse_branches = fuse_branches
+        if fuse_branches:
+            # Branches are stacked in up, down, left, right order.
+            self._branches = FusedGridPoolingNetwork(4, 'branches')
+        else:
+            self._up_branch = GridPoolingNetwork('up_branch')
+            self._down_branch = GridPoolingNetwork('down_branch')
+            self._left_branch = GridPoolingNetwork('left_branch')
+            self._right_branch = GridPoolingNetwork('right_branch')
+        self._combine_outputs1 = CombineOutputsLayer(dtype='float32')
+        self._combine_outputs2 = CombineOutputsLayer(dtype='float32')
+        self._intervals_centers_op = get_op('batch_intervals_centers', ops_implementation)
+        self._infer_cells_grid_rects_op = get_op('batch_infer_cells_grid_rects', ops_implementation)
+
+        self._metric = AdjacencyFMeasure(ops_implementation) if compute_metric else None
 
     def call(self, input_dict):
+        """Runs model on batch of tables.
+
+        If input_dict contains valid 'height' and 'width' of each image,
+        then inputs are treated as padded batch and padded region does not
+        affect predictions for the valid one.
+        Grid positions and cells rects are returned as ragged tensors.
+        """
         image = input_dict['image']
         h_probs = input_dict['horz_split_points_probs']
         v_probs = input_dict['vert_split_points_probs']
         h_binary = input_dict['horz_split_points_binary']
         v_binary = input_dict['vert_split_points_binary']
-        h_positions = ops_module.intervals_centers(h_binary[0])
-        v_positions = ops_module.intervals_centers(v_binary[0])
+        spatial_mask = None
+        if 'height' in input_dict:
+            heights = input_dict['height']
+            widths = input_dict['width']
+            spatial_mask = create_spatial_mask(
+                heights, widths, tf.shape(image)[1], tf.shape(image)[2], self.compute_dtype)
+        else:
+            heights = tf.fill([tf.shape(image)[0]], tf.shape(image)[1])
+            widths = tf.fill([tf.shape(image)[0]], tf.shape(image)[2])
+        h_positions = self._get_intervals_centers(h_binary, heights)
+        v_positions = self._get_intervals_centers(v_binary, widths)
 
         normalized_image = self._normalize_image_layer(image)
-        input = self._concat_inputs_layer(
-            normalized_image, h_probs, v_probs, h_binary, v_binary,
-            h_positions, v_positions)
-        sfcn_output = self._sfcn(input)
-        
-        up_prob1, up_prob2 = self._up_branch(sfcn_output, h_positions, v_positions)
-        down_prob1, down_prob2 = self._down_branch(sfcn_output, h_positions, v_positions)
-        left_prob1, left_prob2 = self._left_branch(sfcn_output, h_positions, v_positions)
-        right_prob1, right_prob2 = self._right_branch(sfcn_output, h_positions, v_positions)
+        sfcn_output = self._sfcn(
+            [normalized_image, h_probs, v_probs, h_binary, v_binary, h_positions, v_positions],
+            spatial_mask)
 
+        # Grid geometry is computed once and shared by all pooling layers.
+        grid = GridGeometry(
+            h_positions, v_positions, tf.shape(image)[1], tf.shape(image)[2], heights, widths)
+        
+        if self._fuse_branches:
+            probs1, probs2 = self._branches(sfcn_output, grid, spatial_mask)
+            up_prob1, down_prob1, left_prob1, right_prob1 = tf.unstack(probs1, axis=3)
+            up_prob2, down_prob2, left_prob2, right_prob2 = tf.unstack(probs2, axis=3)
+        else:
+            up_prob1, up_prob2 = self._up_branch(sfcn_output, grid, spatial_mask)
+            down_prob1, down_prob2 = self._down_branch(sfcn_output, grid, spatial_mask)
+            left_prob1, left_prob2 = self._left_branch(sfcn_output, grid, spatial_mask)
+            right_prob1, right_prob2 = self._right_branch(sfcn_output, grid, spatial_mask)
+
+        # Predictions are combined in float32 regardless of precision of computations (see utils.precision).
+        up_prob1, down_prob1, left_prob1, right_prob1, up_prob2, down_prob2, left_prob2, right_prob2 = [
+            tf.cast(prob, tf.float32)
+            for prob in [up_prob1, down_prob1, left_prob1, right_prob1, up_prob2, down_prob2, left_prob2, right_prob2]
+        ]
         merge_down_prob1, merge_right_prob1 = self._combine_outputs1(up_prob1, down_prob1, left_prob1, right_prob1)
         merge_down_prob2, merge_right_prob2 = self._combine_outputs2(up_prob2, down_prob2, left_prob2, right_prob2)
 
-        merge_right_mask = tf.squeeze(merge_right_prob2 >= 0.5, axis=0)
-        merge_down_mask = tf.squeeze(merge_down_prob2 >= 0.5, axis=0)
-        cells_grid_rects = ops_module.infer_cells_grid_rects(merge_right_mask, merge_down_mask)
+        cells_grid_rects = self._infer_cells_grid_rects(
+            merge_right_prob2 >= 0.5, merge_down_prob2 >= 0.5, h_positions, v_positions)
 
         return {
             # For training.
@@ -184,23 +349,37 @@ class Model(keras.models.Model):
         if self._metric is None:
             return metric_results
 
-        markup_table = Table.from_tensor(tf.squeeze(targets_dict['markup_table'], axis=0))
+        self._metric.update_state(
+            targets_dict['markup_table'],
+            input_dict['horz_split_points_binary'], input_dict['vert_split_points_binary'],
+            prediction['cells_grid_rects'])
 
-        h_binary = tf.squeeze(input_dict['horz_split_points_binary'], axis=0).numpy()
-        v_binary = tf.squeeze(input_dict['vert_split_points_binary'], axis=0).numpy()
-        
-        grid = GridStructureBuilder(markup_table.rect, h_binary, v_binary).build()
-
-        cells = self._get_cells_grid_rects(prediction['cells_grid_rects'].numpy())
-        self._metric.update_state_eager(markup_table, grid, cells)
-        
         metric_results['adjacency_f_measure'] = self._metric.result()
         
         return metric_results
 
-    def _get_cells_grid_rects(self, rects_array):
-        result = []
-        for rect in rects_array:
-            left, top, right, bottom = rect
-            result.append(Rect(left, top, right, bottom))
-        return result
\ No newline at end of file
+    @property
+    def fuse_branches(self):
+        return self._fuse_branches
+
+    def set_unfused_weights(self, layers_weights):
+        """Sets weights of fused model from weights of model with separate branches.
+
+        layers_weights are weights of each layer of unfused model with weights:
+        shared network and up, down, left and right branches.
+        """
+        assert self._fuse_branches
+        assert len(layers_weights) == 5
+        self._sfcn.set_weights(layers_weights[0])
+        self._branches.set_branches_weights(layers_weights[1:])
+
+    def _get_intervals_centers(self, binary, lengths):
+        centers, row_splits = self._intervals_centers_op(binary, lengths)
+        return tf.RaggedTensor.from_row_splits(centers, row_splits, validate=False)
+
+    def _infer_cells_grid_rects(self, merge_right_mask, merge_down_mask, h_positions, v_positions):
+        rows_counts = tf.cast(h_positions.row_lengths(), tf.int32) + 1
+        cols_counts = tf.cast(v_positions.row_lengths(), tf.int32) + 1
+        rects, row_splits = self._infer_cells_grid_rects_op(
+            merge_right_mask, merge_down_mask, rows_counts, cols_counts)
+        return tf.RaggedTensor.from_row_splits(rects, row_splits, validate=False)
\ No newline at end of file
@@ -1,13 +1,14 @@
-import tensorflow.keras as keras
 import tensorflow as tf
 
+from utils.losses import MaskedBinaryCrossentropy, TARGETS_PADDING_VALUE
+
 
 def get_losses_dict():
     return {
-        'merge_down_probs1': keras.losses.BinaryCrossentropy(from_logits=False, axis=(1, 2)),
-        'merge_down_probs2': keras.losses.BinaryCrossentropy(from_logits=False, axis=(1, 2)),
-        'merge_right_probs1': keras.losses.BinaryCrossentropy(from_logits=False, axis=(1, 2)),
-        'merge_right_probs2': keras.losses.BinaryCrossentropy(from_logits=False, axis=(1, 2)),
+        'merge_down_probs1': MaskedBinaryCrossentropy(axis=(1, 2)),
+        'merge_down_probs2': MaskedBinaryCrossentropy(axis=(1, 2)),
+        'merge_right_probs1': MaskedBinaryCrossentropy(axis=(1, 2)),
+        'merge_right_probs2': MaskedBinaryCrossentropy(axis=(1, 2)),
         'markup_table': None
     }
 
@@ -45,4 +46,49 @@ def convert_ds_element_to_tuple(element):
             'merge_right_probs2': merge_right_mask,
             'markup_table': element['markup_table']  
         }
-    )
\ No newline at end of file
+    )
+
+def convert_ds_element_to_padded_tuple(element):
+    """Same as convert_ds_element_to_tuple, but prepares element for padded batching."""
+
+    merge_down_mask = tf.cast(element['merge_down_mask'], tf.float32)
+    merge_right_mask = tf.cast(element['merge_right_mask'], tf.float32)
+
+    inputs, _ = convert_ds_element_to_tuple(element)
+    inputs['height'] = tf.shape(element['image'])[0]
+    inputs['width'] = tf.shape(element['image'])[1]
+    return (
+        inputs,
+        {
+            'merge_down_probs1': merge_down_mask,
+            'merge_down_probs2': merge_down_mask,
+            'merge_right_probs1': merge_right_mask,
+            'merge_right_probs2': merge_right_mask,
+            'markup_table': element['markup_table']
+        }
+    )
+
+def get_padding_values():
+    """Returns padding values for elements created by convert_ds_element_to_padded_tuple."""
+
+    return (
+        get_inputs_padding_values(),
+        {
+            'merge_down_probs1': TARGETS_PADDING_VALUE,
+            'merge_down_probs2': TARGETS_PADDING_VALUE,
+            'merge_right_probs1': TARGETS_PADDING_VALUE,
+            'merge_right_probs2': TARGETS_PADDING_VALUE,
+            'markup_table': 0
+        }
+    )
+
+def get_inputs_padding_values():
+    return {
+        'image': tf.constant(0, tf.uint8),
+        'horz_split_points_probs': 0.,
+        'vert_split_points_probs': 0.,
+        'horz_split_points_binary': 0,
+        'vert_split_points_binary': 0,
+        'height': 0,
+        'width': 0
+    }
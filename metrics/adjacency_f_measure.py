@@ -1,24 +1,25 @@
-from enum import Enum
-from collections import Counter
-
+import numpy as np
+import tensorflow as tf
 import tensorflow.keras as keras
 
+from utils.ops import get_op, CUSTOM_IMPLEMENTATION
 
-class Direction(Enum):
-    Horizontal = 0
-    Vertical = 1
 
+# Directions of adjacency relations of cells.
+_NO_DIRECTION = 0
+_HORIZONTAL_DIRECTION = 1
+_VERTICAL_DIRECTION = 2
 
-class AjacencyRelation:
-    def __init__(self, leftOrTopCell, rightOrBottomCell, direction):
-        self.leftOrTopCell = leftOrTopCell
-        self.rightOrBottomCell = rightOrBottomCell
-        self.direction = direction
+# Indices of coordinates in arrays of rects.
+_LEFT, _TOP, _RIGHT, _BOTTOM = range(4)
 
 
 class AdjacencyFMeasure(keras.metrics.Metric):
-    def __init__(self):
+    def __init__(self, ops_implementation=CUSTOM_IMPLEMENTATION):
+        """ops_implementation selects implementation of batched ops (see utils.ops)."""
         super().__init__()
+        self._intervals_centers_op = get_op('batch_intervals_centers', ops_implementation)
+        self._adjacency_relations_counts_op = get_op('batch_adjacency_relations_counts', ops_implementation)
         self._markup_adj_relations_count = self.add_weight(
             'markup_adj_relations_count', initializer='zeros', dtype='int32')
         self._correct_adj_relations_count = self.add_weight(
@@ -26,25 +27,83 @@ class AdjacencyFMeasure(keras.metrics.Metric):
         self._detected_adj_relations_count = self.add_weight(
             'detected_adj_relations_count', initializer='zeros', dtype='int32')
 
-    def update_state(self, *args, **kwargs):
-        # This function is wrapped in tf.function which slows down execution significantly.
-        # Call update_state_eager instead.
-        pass
-
-    def update_state_eager(self, markup_table, detected_grid, detected_cells):
-        markup_adj_relations_list = self._create_markup_adj_relations_list(markup_table)
-        markup_adj_relations_count = len(markup_adj_relations_list)
-
-        table_cell_intersections_counter = self._create_table_cell_intersections_counter(
-            markup_table, detected_grid, detected_cells)
-        markup_text_rect_to_table_cell_dict = self._create_markup_text_rect_to_table_cell_dict(
-            markup_table, detected_grid, detected_cells, table_cell_intersections_counter)
+    def update_state(self, markup_tables, h_binary, v_binary, cells_grid_rects=None):
+        """Accumulates adjacency relations of batch of tables, same as update_state_eager.
+
+        markup_tables is a padded batch of tensors of markup tables (see
+        table.markup_table). Detected grid of each table is built from its
+        rect and split points masks h_binary and v_binary, as by
+        GridStructureBuilder. cells_grid_rects is a ragged B x None x 4 tensor
+        of detected cells, each cell of grid is detected if it isn't set.
+        """
+        markup_tables = tf.cast(markup_tables, tf.int32)
+        left, top, right, bottom = tf.unstack(markup_tables[:, 0, 1:5], axis=1)
+        h_positions = self._get_grid_positions(h_binary, top, bottom)
+        v_positions = self._get_grid_positions(v_binary, left, right)
+        if cells_grid_rects is None:
+            cells_grid_rects = self._get_unit_cells_grid_rects(
+                h_positions.row_lengths() - 1, v_positions.row_lengths() - 1)
+
+        counts = self._adjacency_relations_counts_op(
+            markup_tables, h_positions.values, h_positions.row_splits, v_positions.values, v_positions.row_splits,
+            cells_grid_rects.values, cells_grid_rects.row_splits)
+        markup_adj_relations_count, correct_adj_relations_count, detected_adj_relations_count = tf.unstack(
+            tf.reduce_sum(counts, axis=0))
+
+        tf.debugging.assert_less_equal(counts[:, 1], counts[:, 0])
+        tf.debugging.assert_less_equal(counts[:, 1], counts[:, 2])
+        tf.debugging.assert_positive(counts[:, 0])
 
-        correct_adj_relations_count = self._calculate_correct_adj_relations_count(
-            markup_adj_relations_list, markup_text_rect_to_table_cell_dict)
+        self._markup_adj_relations_count.assign_add(markup_adj_relations_count)
+        self._correct_adj_relations_count.assign_add(correct_adj_relations_count)
+        self._detected_adj_relations_count.assign_add(detected_adj_relations_count)
 
-        detected_adj_relations_count = self._calculate_detected_adj_relations_count(
-            detected_cells, table_cell_intersections_counter)
+    def update_state_eager(self, markup_table, detected_grid, detected_cells):
+        """Accumulates adjacency relations of a single table.
+
+        detected_cells are distinct grid rects of cells of detected_grid.
+        """
+        assert len(set(detected_cells)) == len(detected_cells)
+        text_rects = _to_array([cell.text_rect for cell in markup_table.cells])
+        markup_grid_rects = _to_array([cell.grid_rect for cell in markup_table.cells])
+        detected_grid_rects = _to_array(detected_cells)
+        h_positions = np.array(detected_grid.get_h_positions(), dtype=np.int64)
+        v_positions = np.array(detected_grid.get_v_positions(), dtype=np.int64)
+        detected_rects = np.stack([
+            v_positions[detected_grid_rects[:, _LEFT]],
+            h_positions[detected_grid_rects[:, _TOP]],
+            v_positions[detected_grid_rects[:, _RIGHT]],
+            h_positions[detected_grid_rects[:, _BOTTOM]]
+        ], axis=1)
+
+        markup_relations_firsts, markup_relations_seconds, markup_relations_directions = \
+            self._find_adjacency_relations(markup_grid_rects)
+        markup_adj_relations_count = len(markup_relations_directions)
+
+        # Number of text rects intersecting each detected cell.
+        texts, cells = self._find_text_rects_cells_candidates(
+            text_rects, detected_grid_rects, h_positions, v_positions)
+        intersects = _intersect(text_rects[texts], detected_rects[cells])
+        intersections_counts = np.bincount(cells[intersects], minlength=len(detected_cells))
+
+        # Each text rect is mapped to the last detected cell, which contains it
+        # and doesn't intersect other text rects, or to -1.
+        is_mapped_pair = np.logical_and(
+            intersections_counts[cells] == 1, _contains(detected_rects[cells], text_rects[texts]))
+        mapped_cells = np.full(len(text_rects), -1)
+        np.maximum.at(mapped_cells, texts[is_mapped_pair], cells[is_mapped_pair])
+
+        first_cells = mapped_cells[markup_relations_firsts]
+        second_cells = mapped_cells[markup_relations_seconds]
+        is_mapped = (first_cells >= 0) & (second_cells >= 0)
+        mapped_directions = _get_directions(
+            detected_grid_rects[first_cells[is_mapped]], detected_grid_rects[second_cells[is_mapped]])
+        correct_adj_relations_count = int(np.count_nonzero(mapped_directions == markup_relations_directions[is_mapped]))
+
+        detected_relations_firsts, detected_relations_seconds, _ = self._find_adjacency_relations(detected_grid_rects)
+        is_intersected = intersections_counts > 0
+        detected_adj_relations_count = int(np.count_nonzero(
+            is_intersected[detected_relations_firsts] & is_intersected[detected_relations_seconds]))
 
         assert correct_adj_relations_count <= markup_adj_relations_count
         assert correct_adj_relations_count <= detected_adj_relations_count
@@ -55,94 +114,129 @@ class AdjacencyFMeasure(keras.metrics.Metric):
         self._detected_adj_relations_count.assign_add(detected_adj_relations_count)
 
     def result(self):
-        if self._correct_adj_relations_count == 0:
-            return 0
-        
-        assert self._markup_adj_relations_count > 0
-        assert self._detected_adj_relations_count > 0
-
-        recall = self._correct_adj_relations_count / self._markup_adj_relations_count
-        precision = self._correct_adj_relations_count / self._detected_adj_relations_count
-        return 2 * recall * precision / (recall + precision)
-
-    def _create_markup_adj_relations_list(self, markup_table):
-        result = []
-        cells = markup_table.cells
-        for i in range(len(cells) - 1):
-            for j in range(i + 1, len(cells)):
-                are_adjacent, direction = self._are_adjacent(
-                    cells[i].grid_rect, cells[j].grid_rect)
-                if are_adjacent:
-                    result.append(AjacencyRelation(cells[i], cells[j], direction))
-
-        return result
-
-    def _are_adjacent(self, leftOrTopCell, rightOrBottomCell):
-        if leftOrTopCell.right == rightOrBottomCell.left and leftOrTopCell.overlaps_vertically(rightOrBottomCell):
-            return True, Direction.Horizontal
-        if leftOrTopCell.bottom == rightOrBottomCell.top and leftOrTopCell.overlaps_horizontally(rightOrBottomCell):
-            return True, Direction.Vertical
-        return False, None
-
-    def _create_table_cell_intersections_counter(self, markup_table, detected_grid, detected_cells):
-        result = Counter()
-        for cell in markup_table.cells:
-            text_rect = cell.text_rect
-            for detected_cell in detected_cells:
-                detected_cell_rect = detected_grid.get_cell_rect(detected_cell)
-                if text_rect.intersects(detected_cell_rect):
-                    result[detected_cell] += 1
-
-        return result
-
-    def _create_markup_text_rect_to_table_cell_dict(
-            self, markup_table, detected_grid, detected_cells, table_cell_intersections_counter):
-        result = dict()
-        for cell in markup_table.cells:
-            text_rect = cell.text_rect
-            for detected_cell in detected_cells:
-                detected_cell_rect = detected_grid.get_cell_rect(detected_cell)
-                if table_cell_intersections_counter[detected_cell] != 1:
-                    continue
-                if detected_cell_rect.contains(text_rect):
-                    result[text_rect] = detected_cell
-
-        return result
-
-    def _calculate_correct_adj_relations_count(
-            self, markup_adj_relations_list, markup_text_rect_to_table_cell_dict):
-        
-        result = 0
-        for relation in markup_adj_relations_list:
-            leftOrTopCellTextRect = relation.leftOrTopCell.text_rect
-            rightOrBottomCellTextRect = relation.rightOrBottomCell.text_rect
-            if leftOrTopCellTextRect not in markup_text_rect_to_table_cell_dict:
-                continue
-            if rightOrBottomCellTextRect not in markup_text_rect_to_table_cell_dict:
-                continue
-            leftOrTopTableCell = markup_text_rect_to_table_cell_dict[leftOrTopCellTextRect]
-            rightOrBottomTableCell = markup_text_rect_to_table_cell_dict[rightOrBottomCellTextRect]
-            are_adjacent, direction = self._are_adjacent(leftOrTopTableCell, rightOrBottomTableCell)
-            if are_adjacent and direction == relation.direction:
-                result += 1
-
-        return result
-
-    def _calculate_detected_adj_relations_count(self, detected_cells, table_cell_intersections_counter):
-        result = 0
-        for i in range(len(detected_cells) - 1):
-            first_cell = detected_cells[i]
-            if first_cell not in table_cell_intersections_counter:
-                continue
-
-            for j in range(i + 1, len(detected_cells)):
-                second_cell = detected_cells[j]
-                if second_cell not in table_cell_intersections_counter:
-                    continue
-
-                are_adjacent, _ = self._are_adjacent(
-                    first_cell, second_cell)
-                if are_adjacent:
-                    result += 1
-
-        return result
\ No newline at end of file
+        # Metric is 0, if there are no correct relations (in particular, no markup or detected ones).
+        correct_adj_relations_count = tf.cast(self._correct_adj_relations_count, tf.float64)
+        recall = tf.math.divide_no_nan(
+            correct_adj_relations_count, tf.cast(self._markup_adj_relations_count, tf.float64))
+        precision = tf.math.divide_no_nan(
+            correct_adj_relations_count, tf.cast(self._detected_adj_relations_count, tf.float64))
+        return tf.math.divide_no_nan(2 * recall * precision, recall + precision)
+
+    def _get_grid_positions(self, binary, starts, ends):
+        # Returns ragged positions of grids of tables, which span [starts, ends), including their borders.
+        centers, row_splits = self._intervals_centers_op(tf.cast(binary, tf.int32), ends - starts)
+        centers = tf.RaggedTensor.from_row_splits(centers, row_splits, validate=False)
+        return tf.concat(
+            [starts[:, tf.newaxis], centers + starts[:, tf.newaxis], ends[:, tf.newaxis]], axis=1)
+
+    def _get_unit_cells_grid_rects(self, rows_counts, cols_counts):
+        # Returns ragged grid rects of all cells of each grid in row-major order.
+        indices = tf.ragged.range(rows_counts * cols_counts)
+        examples_cols_counts = tf.gather(cols_counts, indices.value_rowids())
+        rows = tf.cast(indices.values // examples_cols_counts, tf.int32)
+        cols = tf.cast(indices.values % examples_cols_counts, tf.int32)
+        return indices.with_values(tf.stack([cols, rows, cols + 1, rows + 1], axis=1))
+
+    def _find_adjacency_relations(self, grid_rects):
+        # Returns indices i < j and directions of adjacent grid rects. Adjacent rects
+        # are found among rects, whose left (top) edge has the same coordinate
+        # as right (bottom) edge of i-th rect, by binary search in sorted edges.
+        firsts, seconds, directions = [], [], []
+        for direction, edge, other_edge in [
+                (_HORIZONTAL_DIRECTION, _RIGHT, _LEFT), (_VERTICAL_DIRECTION, _BOTTOM, _TOP)]:
+            order = np.argsort(grid_rects[:, other_edge], kind='stable')
+            sorted_edges = grid_rects[order, other_edge]
+            starts = np.searchsorted(sorted_edges, grid_rects[:, edge], side='left')
+            ends = np.searchsorted(sorted_edges, grid_rects[:, edge], side='right')
+            first, offsets = _expand_ranges(ends - starts)
+            second = order[starts[first] + offsets]
+            is_relation = np.logical_and(
+                first < second, _get_directions(grid_rects[first], grid_rects[second]) == direction)
+            firsts.append(first[is_relation])
+            seconds.append(second[is_relation])
+            directions.append(np.full(np.count_nonzero(is_relation), direction))
+        return np.concatenate(firsts), np.concatenate(seconds), np.concatenate(directions)
+
+    def _find_text_rects_cells_candidates(self, text_rects, cells_grid_rects, h_positions, v_positions):
+        # Returns indices of text rects and detected cells of all pairs, where cell
+        # may intersect or contain text rect. Cells are indexed by grid elements
+        # they cover. A cell may intersect or contain text rect only if it covers
+        # some element between columns (rows) of left and right (top and bottom)
+        # edges of text rect.
+        rows_count = len(h_positions) - 1
+        cols_count = len(v_positions) - 1
+        cells_count = len(cells_grid_rects)
+
+        spans_widths = cells_grid_rects[:, _RIGHT] - cells_grid_rects[:, _LEFT]
+        spans_heights = cells_grid_rects[:, _BOTTOM] - cells_grid_rects[:, _TOP]
+        spans_areas = spans_widths * spans_heights
+        covering_cells, offsets = _expand_ranges(spans_areas)
+        covered_elements = (
+            (cells_grid_rects[covering_cells, _TOP] + offsets // spans_widths[covering_cells]) * cols_count
+            + cells_grid_rects[covering_cells, _LEFT] + offsets % spans_widths[covering_cells])
+        order = np.argsort(covered_elements, kind='stable')
+        elements_cells = covering_cells[order]
+        elements_starts = np.searchsorted(covered_elements[order], np.arange(rows_count * cols_count + 1))
+
+        first_cols, last_cols = self._get_elements_ranges(
+            v_positions, text_rects[:, _LEFT], text_rects[:, _RIGHT])
+        first_rows, last_rows = self._get_elements_ranges(
+            h_positions, text_rects[:, _TOP], text_rects[:, _BOTTOM])
+        blocks_widths = np.maximum(last_cols - first_cols + 1, 0)
+        blocks_heights = np.maximum(last_rows - first_rows + 1, 0)
+        block_texts, offsets = _expand_ranges(blocks_widths * blocks_heights)
+        block_elements = (
+            (first_rows[block_texts] + offsets // blocks_widths[block_texts]) * cols_count
+            + first_cols[block_texts] + offsets % blocks_widths[block_texts])
+        element_pairs, offsets = _expand_ranges(
+            elements_starts[block_elements + 1] - elements_starts[block_elements])
+        texts = block_texts[element_pairs]
+        cells = elements_cells[elements_starts[block_elements[element_pairs]] + offsets]
+
+        # Cells with empty spans don't cover elements, so they are checked with each text rect.
+        empty_cells = np.flatnonzero(spans_areas == 0)
+        texts = np.concatenate([texts, np.repeat(np.arange(len(text_rects)), len(empty_cells))])
+        cells = np.concatenate([cells, np.tile(empty_cells, len(text_rects))])
+
+        # Cells covering several elements of block are found several times.
+        pairs = np.unique(texts * cells_count + cells)
+        return pairs // max(cells_count, 1), pairs % max(cells_count, 1)
+
+    def _get_elements_ranges(self, positions, starts, ends):
+        # Returns first and last indices of grid elements between elements containing starts and ends.
+        # Element i spans [positions[i], positions[i+1]), indices are clipped to grid.
+        start_indices = np.searchsorted(positions, starts, side='right') - 1
+        end_indices = np.searchsorted(positions, ends, side='left') - 1
+        first_indices = np.maximum(np.minimum(start_indices, end_indices), 0)
+        last_indices = np.minimum(np.maximum(start_indices, end_indices), len(positions) - 2)
+        return first_indices, last_indices
+
+
+def _to_array(rects):
+    return np.array([rect.as_tuple() for rect in rects], dtype=np.int64).reshape(-1, 4)
+
+def _expand_ranges(counts):
+    # Returns index of range and offset in range of each element of consecutive ranges with counts elements.
+    counts = np.asarray(counts, dtype=np.int64)
+    ranges = np.repeat(np.arange(len(counts)), counts)
+    return ranges, np.arange(len(ranges)) - (np.cumsum(counts) - counts)[ranges]
+
+def _get_directions(first_rects, second_rects):
+    # Returns direction of adjacency relation of each pair of grid rects.
+    is_horizontal = (
+        (first_rects[:, _RIGHT] == second_rects[:, _LEFT])
+        & (first_rects[:, _TOP] < second_rects[:, _BOTTOM]) & (second_rects[:, _TOP] < first_rects[:, _BOTTOM]))
+    is_vertical = (
+        (first_rects[:, _BOTTOM] == second_rects[:, _TOP])
+        & (first_rects[:, _LEFT] < second_rects[:, _RIGHT]) & (second_rects[:, _LEFT] < first_rects[:, _RIGHT]))
+    return np.where(is_horizontal, _HORIZONTAL_DIRECTION, np.where(is_vertical, _VERTICAL_DIRECTION, _NO_DIRECTION))
+
+def _intersect(first_rects, second_rects):
+    return (
+        (first_rects[:, _LEFT] < second_rects[:, _RIGHT]) & (second_rects[:, _LEFT] < first_rects[:, _RIGHT])
+        & (first_rects[:, _TOP] < second_rects[:, _BOTTOM]) & (second_rects[:, _TOP] < first_rects[:, _BOTTOM]))
+
+def _contains(outer_rects, inner_rects):
+    return (
+        (outer_rects[:, _LEFT] <= inner_rects[:, _LEFT]) & (inner_rects[:, _RIGHT] <= outer_rects[:, _RIGHT])
+        & (outer_rects[:, _TOP] <= inner_rects[:, _TOP]) & (inner_rects[:, _BOTTOM] <= outer_rects[:, _BOTTOM]))
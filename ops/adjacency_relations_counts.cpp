@@ -0,0 +1,281 @@
+#include "adjacency_relations_counts.h"
+
+#include "rect.h"
+#include "tensorflow/core/framework/shape_inference.h"
+#include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
+#include <algorithm>
+#include <cassert>
+#include <numeric>
+
+using namespace tensorflow;
+
+namespace {
+
+// Directions of adjacency relations.
+const int NoDirection = 0;
+const int HorizontalDirection = 1;
+const int VerticalDirection = 2;
+
+const int MarkupTableRowSize = 8;
+
+}
+
+REGISTER_OP("BatchAdjacencyRelationsCounts")
+    .Input("markup_tables: int32")
+    .Input("h_positions: int32")
+    .Input("h_row_splits: int64")
+    .Input("v_positions: int32")
+    .Input("v_row_splits: int64")
+    .Input("cells_grid_rects: int32")
+    .Input("cells_row_splits: int64")
+    .Output("counts: int32")
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+        c->set_output(0, c->Matrix(c->Dim(c->input(0), 0), 3));
+        return Status::OK();
+    });
+
+REGISTER_KERNEL_BUILDER(Name("BatchAdjacencyRelationsCounts").Device(DEVICE_CPU), BatchAdjacencyRelationsCountsOp);
+
+//////////////////////////////////////////////////////////////////////////////
+// BatchAdjacencyRelationsCountsOp
+
+void BatchAdjacencyRelationsCountsOp::Compute(OpKernelContext* context)
+{
+    const Tensor& markupTables = context->input(0);
+    const auto hPositions = context->input(1).vec<int>();
+    const auto hRowSplits = context->input(2).vec<int64_t>();
+    const auto vPositions = context->input(3).vec<int>();
+    const auto vRowSplits = context->input(4).vec<int64_t>();
+    const Tensor& cellsGridRects = context->input(5);
+    const auto cellsRowSplits = context->input(6).vec<int64_t>();
+    OP_REQUIRES(context, markupTables.dims() == 3 && markupTables.dim_size(1) > 0
+            && markupTables.dim_size(2) == MarkupTableRowSize,
+        errors::InvalidArgument("BatchAdjacencyRelationsCounts expects B x M x 8 markup tables."));
+    OP_REQUIRES(context, cellsGridRects.dims() == 2 && cellsGridRects.dim_size(1) == 4,
+        errors::InvalidArgument("BatchAdjacencyRelationsCounts expects K x 4 cells grid rects."));
+
+    const int batchSize = markupTables.dim_size(0);
+    const int maxRowsCount = markupTables.dim_size(1);
+    OP_REQUIRES(context, hRowSplits.size() == batchSize + 1 && vRowSplits.size() == batchSize + 1
+            && cellsRowSplits.size() == batchSize + 1,
+        errors::InvalidArgument("BatchAdjacencyRelationsCounts got inconsistent batch size."));
+    OP_REQUIRES(context, hRowSplits(batchSize) == hPositions.size() && vRowSplits(batchSize) == vPositions.size()
+            && cellsRowSplits(batchSize) == cellsGridRects.dim_size(0),
+        errors::InvalidArgument("BatchAdjacencyRelationsCounts got inconsistent row splits."));
+
+    const auto markupTablesTensor = markupTables.tensor<int, 3>();
+    const auto cellsGridRectsMatrix = cellsGridRects.matrix<int>();
+    for(int b = 0; b < batchSize; ++b) {
+        const int cellsCount = markupTablesTensor(b, 0, 5);
+        OP_REQUIRES(context, 0 <= cellsCount && cellsCount < maxRowsCount,
+            errors::InvalidArgument("BatchAdjacencyRelationsCounts got cells count out of range."));
+        OP_REQUIRES(context, hRowSplits(b + 1) - hRowSplits(b) >= 2 && vRowSplits(b + 1) - vRowSplits(b) >= 2,
+            errors::InvalidArgument("BatchAdjacencyRelationsCounts expects at least two positions of grid."));
+        const int rowsCount = hRowSplits(b + 1) - hRowSplits(b) - 1;
+        const int colsCount = vRowSplits(b + 1) - vRowSplits(b) - 1;
+        for(int64_t i = cellsRowSplits(b); i < cellsRowSplits(b + 1); ++i) {
+            OP_REQUIRES(context, 0 <= cellsGridRectsMatrix(i, 0)
+                    && cellsGridRectsMatrix(i, 0) <= cellsGridRectsMatrix(i, 2) && cellsGridRectsMatrix(i, 2) <= colsCount
+                    && 0 <= cellsGridRectsMatrix(i, 1)
+                    && cellsGridRectsMatrix(i, 1) <= cellsGridRectsMatrix(i, 3) && cellsGridRectsMatrix(i, 3) <= rowsCount,
+                errors::InvalidArgument("BatchAdjacencyRelationsCounts got cell out of grid."));
+        }
+    }
+
+    Tensor* countsTensor = 0;
+    OP_REQUIRES_OK(
+        context, context->allocate_output(0, TensorShape({batchSize, 3}), &countsTensor));
+    auto countsMatrix = countsTensor->matrix<int>();
+
+    auto countExamplesRelations = [&](int64_t start, int64_t limit) {
+        for(int64_t b = start; b < limit; ++b) {
+            const int cellsCount = markupTablesTensor(b, 0, 5);
+            vector<Rect> markupTextRects;
+            vector<Rect> markupGridRects;
+            for(int i = 1; i <= cellsCount; ++i) {
+                markupTextRects.emplace_back(
+                    markupTablesTensor(b, i, 0), markupTablesTensor(b, i, 1),
+                    markupTablesTensor(b, i, 2), markupTablesTensor(b, i, 3));
+                markupGridRects.emplace_back(
+                    markupTablesTensor(b, i, 4), markupTablesTensor(b, i, 5),
+                    markupTablesTensor(b, i, 6), markupTablesTensor(b, i, 7));
+            }
+
+            const vector<int> exampleHPositions(
+                hPositions.data() + hRowSplits(b), hPositions.data() + hRowSplits(b + 1));
+            const vector<int> exampleVPositions(
+                vPositions.data() + vRowSplits(b), vPositions.data() + vRowSplits(b + 1));
+            vector<Rect> detectedRects;
+            vector<Rect> detectedGridRects;
+            for(int64_t i = cellsRowSplits(b); i < cellsRowSplits(b + 1); ++i) {
+                const Rect gridRect(
+                    cellsGridRectsMatrix(i, 0), cellsGridRectsMatrix(i, 1),
+                    cellsGridRectsMatrix(i, 2), cellsGridRectsMatrix(i, 3));
+                detectedGridRects.push_back(gridRect);
+                detectedRects.emplace_back(
+                    exampleVPositions[gridRect.Left], exampleHPositions[gridRect.Top],
+                    exampleVPositions[gridRect.Right], exampleHPositions[gridRect.Bottom]);
+            }
+
+            countRelations(
+                markupTextRects, markupGridRects, detectedRects, detectedGridRects,
+                exampleHPositions, exampleVPositions, &countsMatrix(b, 0));
+        }
+    };
+    const auto workerThreads = context->device()->tensorflow_cpu_worker_threads();
+    const int64_t costPerExample = 1000 * static_cast<int64_t>(maxRowsCount);
+    Shard(workerThreads->num_threads, workerThreads->workers, batchSize, costPerExample, countExamplesRelations);
+}
+
+void BatchAdjacencyRelationsCountsOp::countRelations(
+    const vector<Rect>& markupTextRects, const vector<Rect>& markupGridRects,
+    const vector<Rect>& detectedRects, const vector<Rect>& detectedGridRects,
+    const vector<int>& hPositions, const vector<int>& vPositions, int* counts) const
+{
+    const int markupCellsCount = markupGridRects.size();
+    const int detectedCellsCount = detectedGridRects.size();
+    const int rowsCount = hPositions.size() - 1;
+    const int colsCount = vPositions.size() - 1;
+
+    const vector<AdjacencyRelation> markupRelations = findAdjacencyRelations(markupGridRects);
+
+    // Index of detected cells covering each element of grid.
+    vector<vector<int>> elementsCells(rowsCount * colsCount);
+    vector<int> emptyCells;
+    for(int i = 0; i < detectedCellsCount; ++i) {
+        const Rect& gridRect = detectedGridRects[i];
+        if(gridRect.IsEmpty()) {
+            emptyCells.push_back(i);
+        }
+        for(int row = gridRect.Top; row < gridRect.Bottom; ++row) {
+            for(int col = gridRect.Left; col < gridRect.Right; ++col) {
+                elementsCells[row * colsCount + col].push_back(i);
+            }
+        }
+    }
+
+    // A cell may intersect or contain text rect only if it covers some element
+    // between columns (rows) of left and right (top and bottom) edges of text rect.
+    // Cells with empty spans don't cover elements, so they are checked with each text rect.
+    vector<int> intersectionsCounts(detectedCellsCount, 0);
+    vector<std::pair<int, int>> containments;
+    vector<int> lastCheckedTexts(detectedCellsCount, -1);
+    for(int i = 0; i < markupCellsCount; ++i) {
+        const Rect& textRect = markupTextRects[i];
+        auto checkCell = [&](int cell) {
+            if(lastCheckedTexts[cell] == i) {
+                return;
+            }
+            lastCheckedTexts[cell] = i;
+            const Rect& detectedRect = detectedRects[cell];
+            if(textRect.HasIntersection(detectedRect)) {
+                ++intersectionsCounts[cell];
+            }
+            if(detectedRect.Left <= textRect.Left && textRect.Right <= detectedRect.Right
+                    && detectedRect.Top <= textRect.Top && textRect.Bottom <= detectedRect.Bottom) {
+                containments.emplace_back(i, cell);
+            }
+        };
+
+        int firstRow, lastRow, firstCol, lastCol;
+        getElementsRange(hPositions, textRect.Top, textRect.Bottom, &firstRow, &lastRow);
+        getElementsRange(vPositions, textRect.Left, textRect.Right, &firstCol, &lastCol);
+        for(int row = firstRow; row <= lastRow; ++row) {
+            for(int col = firstCol; col <= lastCol; ++col) {
+                for(int cell : elementsCells[row * colsCount + col]) {
+                    checkCell(cell);
+                }
+            }
+        }
+        for(int cell : emptyCells) {
+            checkCell(cell);
+        }
+    }
+
+    // Each text rect is mapped to the last detected cell, which contains it
+    // and doesn't intersect other text rects.
+    vector<int> markupToDetectedCells(markupCellsCount, -1);
+    for(const auto& containment : containments) {
+        if(intersectionsCounts[containment.second] == 1) {
+            markupToDetectedCells[containment.first] = std::max(
+                markupToDetectedCells[containment.first], containment.second);
+        }
+    }
+
+    int correctRelationsCount = 0;
+    for(const AdjacencyRelation& relation : markupRelations) {
+        const int firstCell = markupToDetectedCells[relation.FirstCell];
+        const int secondCell = markupToDetectedCells[relation.SecondCell];
+        if(firstCell >= 0 && secondCell >= 0
+                && getAdjacencyDirection(detectedGridRects[firstCell], detectedGridRects[secondCell]) == relation.Direction) {
+            ++correctRelationsCount;
+        }
+    }
+
+    int detectedRelationsCount = 0;
+    for(const AdjacencyRelation& relation : findAdjacencyRelations(detectedGridRects)) {
+        if(intersectionsCounts[relation.FirstCell] > 0 && intersectionsCounts[relation.SecondCell] > 0) {
+            ++detectedRelationsCount;
+        }
+    }
+
+    counts[0] = markupRelations.size();
+    counts[1] = correctRelationsCount;
+    counts[2] = detectedRelationsCount;
+}
+
+vector<BatchAdjacencyRelationsCountsOp::AdjacencyRelation> BatchAdjacencyRelationsCountsOp::findAdjacencyRelations(
+    const vector<Rect>& gridRects) const
+{
+    // Rects adjacent to i-th rect (with j > i) are searched among rects,
+    // whose left (top) edge has the same coordinate as right (bottom) edge of i-th rect.
+    vector<AdjacencyRelation> result;
+    vector<int> order(gridRects.size());
+    for(const int direction : {HorizontalDirection, VerticalDirection}) {
+        auto getNearEdge = [&](int i) {
+            return direction == HorizontalDirection ? gridRects[i].Left : gridRects[i].Top;
+        };
+        std::iota(order.begin(), order.end(), 0);
+        std::stable_sort(order.begin(), order.end(), [&](int first, int second) {
+            return getNearEdge(first) < getNearEdge(second);
+        });
+
+        for(int i = 0; i < gridRects.size(); ++i) {
+            const int farEdge = direction == HorizontalDirection ? gridRects[i].Right : gridRects[i].Bottom;
+            auto it = std::lower_bound(order.begin(), order.end(), farEdge, [&](int j, int edge) {
+                return getNearEdge(j) < edge;
+            });
+            for(; it != order.end() && getNearEdge(*it) == farEdge; ++it) {
+                if(i < *it && getAdjacencyDirection(gridRects[i], gridRects[*it]) == direction) {
+                    result.push_back({i, *it, direction});
+                }
+            }
+        }
+    }
+    return result;
+}
+
+void BatchAdjacencyRelationsCountsOp::getElementsRange(
+    const vector<int>& positions, int start, int end, int* first, int* last) const
+{
+    // Element i spans [positions[i], positions[i+1]), range is clipped to grid.
+    const int startIndex = std::upper_bound(positions.begin(), positions.end(), start) - positions.begin() - 1;
+    const int endIndex = std::lower_bound(positions.begin(), positions.end(), end) - positions.begin() - 1;
+    *first = std::max(std::min(startIndex, endIndex), 0);
+    *last = std::min(std::max(startIndex, endIndex), static_cast<int>(positions.size()) - 2);
+}
+
+int BatchAdjacencyRelationsCountsOp::getAdjacencyDirection(
+    const Rect& leftOrTopCell, const Rect& rightOrBottomCell) const
+{
+    if(leftOrTopCell.Right == rightOrBottomCell.Left
+            && leftOrTopCell.Top < rightOrBottomCell.Bottom && rightOrBottomCell.Top < leftOrTopCell.Bottom) {
+        return HorizontalDirection;
+    }
+    if(leftOrTopCell.Bottom == rightOrBottomCell.Top
+            && leftOrTopCell.Left < rightOrBottomCell.Right && rightOrBottomCell.Left < leftOrTopCell.Right) {
+        return VerticalDirection;
+    }
+    return NoDirection;
+}
@@ -0,0 +1,42 @@
+#pragma once
+
+#include <vector>
+#include "tensorflow/core/framework/op.h"
+#include "tensorflow/core/framework/shape_inference.h"
+#include "tensorflow/core/framework/op_kernel.h"
+
+using namespace tensorflow;
+using std::vector;
+
+struct Rect;
+
+// Counts adjacency relations of markup tables and detected table structures,
+// same as metrics.adjacency_f_measure.AdjacencyFMeasure.update_state_eager.
+// Markup tables are B x M x 8 columnar tensors (see table.markup_table),
+// padded with arbitrary rows. Grid positions (including borders of grid)
+// and grid rects of detected cells of each example are given as values
+// and row splits of ragged tensors. Outputs B x 3 matrix with numbers of
+// markup, correctly detected and detected adjacency relations. Adjacent
+// cells are found by binary search in sorted edges of cells, and cells
+// intersecting text rects are found by index of grid elements.
+class BatchAdjacencyRelationsCountsOp : public OpKernel {
+public:
+    explicit BatchAdjacencyRelationsCountsOp(OpKernelConstruction* context) : OpKernel(context) {}
+
+    virtual void Compute(OpKernelContext* context) override;
+
+private:
+    struct AdjacencyRelation {
+        int FirstCell;
+        int SecondCell;
+        int Direction;
+    };
+
+    void countRelations(
+        const vector<Rect>& markupTextRects, const vector<Rect>& markupGridRects,
+        const vector<Rect>& detectedRects, const vector<Rect>& detectedGridRects,
+        const vector<int>& hPositions, const vector<int>& vPositions, int* counts) const;
+    vector<AdjacencyRelation> findAdjacencyRelations(const vector<Rect>& gridRects) const;
+    void getElementsRange(const vector<int>& positions, int start, int end, int* first, int* last) const;
+    int getAdjacencyDirection(const Rect& leftOrTopCell, const Rect& rightOrBottomCell) const;
+};
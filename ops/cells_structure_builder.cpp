@@ -11,14 +11,16 @@ using std::make_pair;
 
 
 CellsStructureBuilder::CellsStructureBuilder(
-        const Tensor& _mergeRightMask, const Tensor& _mergeDownMask) :
+        TTypes<bool>::ConstMatrix _mergeRightMask, TTypes<bool>::ConstMatrix _mergeDownMask,
+        int _rowsCount, int _colsCount) :
     mergeRightMask(_mergeRightMask),
-    mergeDownMask(_mergeDownMask)
+    mergeDownMask(_mergeDownMask),
+    rowsCount(_rowsCount),
+    colsCount(_colsCount)
 {
-    rowsCount = static_cast<int>(mergeRightMask.dim_size(0));
-    colsCount = static_cast<int>(mergeDownMask.dim_size(1));
-
     assert(rowsCount > 0 && colsCount > 0);
+    assert(mergeRightMask.dimension(0) >= rowsCount && mergeRightMask.dimension(1) >= colsCount - 1);
+    assert(mergeDownMask.dimension(0) >= rowsCount - 1 && mergeDownMask.dimension(1) >= colsCount);
 }
 
 vector<Rect> CellsStructureBuilder::Build() const
@@ -51,14 +53,11 @@ vector<Rect> CellsStructureBuilder::buildInitialCells() const
 
 vector<vector<int>> CellsStructureBuilder::createGraph() const
 {
-    const auto mergeRightMaskMatrix = mergeRightMask.matrix<bool>();
-    const auto mergeDownMaskMatrix = mergeDownMask.matrix<bool>();
-
     vector<vector<int>> graph(rowsCount * colsCount);
 
     for(int i = 0; i < rowsCount; ++i) {
         for(int j = 0; j + 1 < colsCount; ++j) {
-            if(mergeRightMaskMatrix(i, j)) {
+            if(mergeRightMask(i, j)) {
                 const int u = to1DIndex(i, j);
                 const int v = to1DIndex(i, j+1);
                 graph[u].push_back(v);
@@ -69,7 +68,7 @@ vector<vector<int>> CellsStructureBuilder::createGraph() const
 
     for(int i = 0; i + 1 < rowsCount; ++i) {
         for(int j = 0; j < colsCount; ++j) {
-            if(mergeDownMaskMatrix(i, j)) {
+            if(mergeDownMask(i, j)) {
                 const int u = to1DIndex(i, j);
                 const int v = to1DIndex(i+1, j);
                 graph[u].push_back(v);
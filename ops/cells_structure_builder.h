@@ -11,13 +11,17 @@ using std::pair;
 
 class CellsStructureBuilder {
 public:
-    CellsStructureBuilder(const Tensor& _mergeRightMask, const Tensor& _mergeDownMask);
+    // Only top-left rowsCount x (colsCount-1) and (rowsCount-1) x colsCount
+    // submatrices of masks are used, so masks may be padded.
+    CellsStructureBuilder(
+        TTypes<bool>::ConstMatrix _mergeRightMask, TTypes<bool>::ConstMatrix _mergeDownMask,
+        int _rowsCount, int _colsCount);
 
     vector<Rect> Build() const;
 
 private:
-    const Tensor& mergeRightMask;
-    const Tensor& mergeDownMask;
+    TTypes<bool>::ConstMatrix mergeRightMask;
+    TTypes<bool>::ConstMatrix mergeDownMask;
     int rowsCount;
     int colsCount;
 
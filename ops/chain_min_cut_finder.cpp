@@ -0,0 +1,64 @@
+#include "chain_min_cut_finder.h"
+#include <algorithm>
+#include <cassert>
+
+using std::min;
+
+
+ChainMinCutFinder::ChainMinCutFinder(const vector<int>& _sourceCapacities,
+        const vector<int>& _sinkCapacities, int _pairwiseCapacity) :
+    sourceCapacities(_sourceCapacities),
+    sinkCapacities(_sinkCapacities),
+    pairwiseCapacity(_pairwiseCapacity)
+{
+    assert(sourceCapacities.size() == sinkCapacities.size());
+}
+
+vector<bool> ChainMinCutFinder::Find() const
+{
+    const int numOfNodes = sourceCapacities.size();
+    vector<bool> result(numOfNodes, false);
+    if(numOfNodes == 0) {
+        return result;
+    }
+
+    // prefixCosts[2*i + label] is the min cost of nodes 0..i, given that node i has label.
+    vector<long long> prefixCosts(2 * numOfNodes);
+    for(int label = 0; label < 2; ++label) {
+        prefixCosts[label] = getUnaryCost(0, label);
+    }
+    for(int i = 1; i < numOfNodes; ++i) {
+        for(int label = 0; label < 2; ++label) {
+            prefixCosts[2*i + label] = getUnaryCost(i, label) + min(
+                prefixCosts[2*(i-1) + label],
+                prefixCosts[2*(i-1) + 1 - label] + pairwiseCapacity);
+        }
+    }
+
+    // suffixCosts[2*i + label] is the min cost of nodes i+1..n-1, given that node i has label.
+    vector<long long> suffixCosts(2 * numOfNodes);
+    suffixCosts[2*(numOfNodes-1)] = 0;
+    suffixCosts[2*(numOfNodes-1) + 1] = 0;
+    for(int i = numOfNodes - 2; i >= 0; --i) {
+        for(int label = 0; label < 2; ++label) {
+            suffixCosts[2*i + label] = min(
+                getUnaryCost(i+1, label) + suffixCosts[2*(i+1) + label],
+                getUnaryCost(i+1, 1 - label) + pairwiseCapacity + suffixCosts[2*(i+1) + 1 - label]);
+        }
+    }
+
+    // Node belongs to the smallest source side of min cut
+    // iff it belongs to the source side of every min cut.
+    for(int i = 0; i < numOfNodes; ++i) {
+        const long long sinkSideCost = prefixCosts[2*i] + suffixCosts[2*i];
+        const long long sourceSideCost = prefixCosts[2*i + 1] + suffixCosts[2*i + 1];
+        result[i] = sourceSideCost < sinkSideCost;
+    }
+    return result;
+}
+
+long long ChainMinCutFinder::getUnaryCost(int node, int label) const
+{
+    // Node on the sink side cuts edge from source and vice versa.
+    return label == 0 ? sourceCapacities[node] : sinkCapacities[node];
+}
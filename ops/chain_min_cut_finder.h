@@ -0,0 +1,27 @@
+#pragma once
+
+#include <vector>
+
+using std::vector;
+
+
+// Finds min cut in a chain graph, where every node is connected to source
+// and sink, and each pair of adjacent nodes is connected with an edge of the same capacity.
+// Gives the same result as MinCutFinder on such graphs in linear time.
+class ChainMinCutFinder {
+public:
+    ChainMinCutFinder(const vector<int>& _sourceCapacities,
+        const vector<int>& _sinkCapacities, int _pairwiseCapacity);
+
+    // Returns true for nodes, which belong to the source side of the cut.
+    // If there are several min cuts, then the one with the smallest source side is returned.
+    vector<bool> Find() const;
+
+private:
+    vector<int> sourceCapacities;
+    vector<int> sinkCapacities;
+    int pairwiseCapacity;
+
+    // Cost of assigning node to the source (label=1) or the sink (label=0) side of the cut.
+    long long getUnaryCost(int node, int label) const;
+};
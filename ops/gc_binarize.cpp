@@ -2,7 +2,9 @@
 
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
 #include "min_cut_finder.h"
+#include "chain_min_cut_finder.h"
 
 using namespace tensorflow;
 
@@ -10,15 +12,33 @@ REGISTER_OP("GcBinarize")
     .Input("to_binarize: float32")
     .Input("lambda: float32")
     .Output("binarized: int32")
+    .Attr("solver: {'chain', 'max_flow'} = 'chain'")
     .SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
         return ::tensorflow::shape_inference::UnchangedShapeWithRank(c, 1);
     });
 
 REGISTER_KERNEL_BUILDER(Name("GcBinarize").Device(DEVICE_CPU), GcBinarizeOp);
 
+REGISTER_OP("BatchGcBinarize")
+    .Input("to_binarize: float32")
+    .Input("lengths: int32")
+    .Input("lambda: float32")
+    .Output("binarized: int32")
+    .Attr("solver: {'chain', 'max_flow'} = 'chain'")
+    .SetShapeFn([](::tensorflow::shape_inference::InferenceContext* c) {
+        return ::tensorflow::shape_inference::UnchangedShapeWithRank(c, 2);
+    });
+
+REGISTER_KERNEL_BUILDER(Name("BatchGcBinarize").Device(DEVICE_CPU), BatchGcBinarizeOp);
+
 //////////////////////////////////////////////////////////////////////////////
 // GcBinarizeOp
 
+GcBinarizeOp::GcBinarizeOp(OpKernelConstruction* context) : OpKernel(context)
+{
+  OP_REQUIRES_OK(context, context->GetAttr("solver", &solver));
+}
+
 void GcBinarizeOp::Compute(OpKernelContext* context) 
 {
   // Grab the input tensor
@@ -29,10 +49,8 @@ void GcBinarizeOp::Compute(OpKernelContext* context)
   OP_REQUIRES(context, TensorShapeUtils::IsScalar(lambda.shape()),
     errors::InvalidArgument("GcBinarize expects a scalar as a second argument."));
 
-  MinCutFinder::TCapacity capacities;
-  const vector<vector<int>> graph = createGraph(probs, lambda.scalar<float>()(0), capacities);
-  const MinCutFinder minCutFinder(graph, capacities);
-  const vector<bool> partition = minCutFinder.Find(0, graph.size()-1);
+  const vector<bool> partition = binarize(
+    probs.vec<float>().data(), probs.dim_size(0), lambda.scalar<float>()(0));
 
   // Create an output tensor
   Tensor* resultTensor = 0;
@@ -40,7 +58,7 @@ void GcBinarizeOp::Compute(OpKernelContext* context)
       context, context->allocate_output(0, probs.shape(), &resultTensor));
   auto resultVector = resultTensor->vec<int>();
   for (int i = 0; i < resultVector.size(); ++i) {
-    if(partition[i+1]) {
+    if(partition[i]) {
       resultVector(i) = 1;
     } else {
       resultVector(i) = 0;
@@ -48,19 +66,49 @@ void GcBinarizeOp::Compute(OpKernelContext* context)
   }
 }
 
+vector<bool> GcBinarizeOp::binarize(const float* probs, int length, float lambda) const
+{
+  return solver == "max_flow"
+    ? findPartitionWithMaxFlow(probs, length, lambda)
+    : findPartition(probs, length, lambda);
+}
+
+vector<bool> GcBinarizeOp::findPartition(const float* probs, int length, float lambda) const
+{
+  vector<int> sourceCapacities(length);
+  vector<int> sinkCapacities(length);
+  for(int i = 0; i < length; ++i) {
+    const float prob = probs[i];
+    sourceCapacities[i] = getCapacity(prob);
+    sinkCapacities[i] = getCapacity(1-prob);
+  }
+
+  const ChainMinCutFinder minCutFinder(sourceCapacities, sinkCapacities, getCapacity(lambda));
+  return minCutFinder.Find();
+}
+
+vector<bool> GcBinarizeOp::findPartitionWithMaxFlow(const float* probs, int length, float lambda) const
+{
+  MinCutFinder::TCapacity capacities;
+  const vector<vector<int>> graph = createGraph(probs, length, lambda, capacities);
+  const MinCutFinder minCutFinder(graph, capacities);
+  const vector<bool> partition = minCutFinder.Find(0, graph.size()-1);
+  // Strip source and sink nodes.
+  return vector<bool>(partition.begin() + 1, partition.end() - 1);
+}
+
 vector<vector<int>> GcBinarizeOp::createGraph(
-  const Tensor& probs, float lambda, 
+  const float* probs, int length, float lambda, 
   MinCutFinder::TCapacity& capacities) const
 {
-  const auto probsVector = probs.vec<float>();
-  const int numOfNodes = probsVector.size() + 2;
+  const int numOfNodes = length + 2;
   const int s = 0;
   const int t = numOfNodes-1;
 
   vector<vector<int>> graph(numOfNodes);
 
-  for(int i = 0; i < probsVector.size(); ++i) {
-    const float prob = probsVector(i);
+  for(int i = 0; i < length; ++i) {
+    const float prob = probs[i];
 
     graph[s].push_back(i+1);
     graph[i+1].push_back(s);
@@ -73,7 +121,7 @@ vector<vector<int>> GcBinarizeOp::createGraph(
     capacities.insert({{i+1, t}, getCapacity(1-prob)});
   }
 
-  for(int i = 1; i < probsVector.size(); ++i) {
+  for(int i = 1; i < length; ++i) {
     graph[i].push_back(i+1);
     graph[i+1].push_back(i);
 
@@ -87,4 +135,51 @@ vector<vector<int>> GcBinarizeOp::createGraph(
 int GcBinarizeOp::getCapacity(float value) const
 {
   return static_cast<int>(1024 * value);
-}
\ No newline at end of file
+}
+
+//////////////////////////////////////////////////////////////////////////////
+// BatchGcBinarizeOp
+
+void BatchGcBinarizeOp::Compute(OpKernelContext* context)
+{
+  const Tensor& probs = context->input(0);
+  const Tensor& lengths = context->input(1);
+  const Tensor& lambda = context->input(2);
+  OP_REQUIRES(context, TensorShapeUtils::IsMatrix(probs.shape()),
+    errors::InvalidArgument("BatchGcBinarize expects a matrix as a first argument."));
+  OP_REQUIRES(context, TensorShapeUtils::IsVector(lengths.shape())
+      && lengths.dim_size(0) == probs.dim_size(0),
+    errors::InvalidArgument("BatchGcBinarize expects a vector of lengths of each row."));
+  OP_REQUIRES(context, TensorShapeUtils::IsScalar(lambda.shape()),
+    errors::InvalidArgument("BatchGcBinarize expects a scalar as a third argument."));
+
+  const int batchSize = probs.dim_size(0);
+  const int maxLength = probs.dim_size(1);
+  const auto lengthsVector = lengths.vec<int>();
+  for(int i = 0; i < batchSize; ++i) {
+    OP_REQUIRES(context, 0 <= lengthsVector(i) && lengthsVector(i) <= maxLength,
+      errors::InvalidArgument("BatchGcBinarize got length out of range."));
+  }
+
+  Tensor* resultTensor = 0;
+  OP_REQUIRES_OK(
+      context, context->allocate_output(0, probs.shape(), &resultTensor));
+  auto resultMatrix = resultTensor->matrix<int>();
+  resultMatrix.setZero();
+
+  const auto probsMatrix = probs.matrix<float>();
+  const float lambdaValue = lambda.scalar<float>()(0);
+  auto binarizeRows = [&](int64_t start, int64_t limit) {
+    for(int64_t row = start; row < limit; ++row) {
+      const int length = lengthsVector(row);
+      const vector<bool> partition = binarize(&probsMatrix(row, 0), length, lambdaValue);
+      for(int i = 0; i < length; ++i) {
+        resultMatrix(row, i) = partition[i] ? 1 : 0;
+      }
+    }
+  };
+
+  const auto workerThreads = context->device()->tensorflow_cpu_worker_threads();
+  const int64_t costPerRow = 100 * maxLength;
+  Shard(workerThreads->num_threads, workerThreads->workers, batchSize, costPerRow, binarizeRows);
+}
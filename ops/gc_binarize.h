@@ -8,22 +8,44 @@
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/op_kernel.h"
 #include "min_cut_finder.h"
+#include <string>
 
 using namespace tensorflow;
 using std::vector;
 using std::unordered_map;
 using std::pair;
+using std::string;
 
 class GcBinarizeOp : public OpKernel {
 public:
-    explicit GcBinarizeOp(OpKernelConstruction* context) : OpKernel(context) {}
+    explicit GcBinarizeOp(OpKernelConstruction* context);
 
     virtual void Compute(OpKernelContext* context) override;
 
+protected:
+    // Binarizes vector of probabilities of specified length with selected solver.
+    vector<bool> binarize(const float* probs, int length, float lambda) const;
+
 private:
+    string solver;
+
+    // Finds partition via linear-time dynamic programming on chain graph.
+    vector<bool> findPartition(const float* probs, int length, float lambda) const;
+    // Finds partition via general max-flow algorithm. Used as a reference.
+    vector<bool> findPartitionWithMaxFlow(const float* probs, int length, float lambda) const;
+
     vector<vector<int>> createGraph(
-        const Tensor& probs, float lambda, 
+        const float* probs, int length, float lambda, 
         MinCutFinder::TCapacity& capacities) const;
 
     int getCapacity(float value) const;
+};
+
+// Binarizes each row of B x N matrix. Only first lengths[i] elements
+// of i-th row are binarized, the rest of output is filled with zeros.
+class BatchGcBinarizeOp : public GcBinarizeOp {
+public:
+    explicit BatchGcBinarizeOp(OpKernelConstruction* context) : GcBinarizeOp(context) {}
+
+    virtual void Compute(OpKernelContext* context) override;
 };
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
 #include "grid_structure.h"
 #include <cassert>
 
@@ -24,6 +25,26 @@ REGISTER_OP("IndicesCube")
 REGISTER_KERNEL_BUILDER(
     Name("IndicesCube").Device(DEVICE_CPU), IndicesCubeOp);
 
+REGISTER_OP("BatchIndicesCube")
+    .Input("height: int32")
+    .Input("width: int32")
+    .Input("heights: int32")
+    .Input("widths: int32")
+    .Input("h_positions: int32")
+    .Input("h_row_splits: int64")
+    .Input("v_positions: int32")
+    .Input("v_row_splits: int64")
+    .Output("cube: int32")
+    .SetShapeFn([](InferenceContext* c) {
+        ShapeHandle shape = c->MakeShape(
+            {c->Dim(c->input(2), 0), InferenceContext::kUnknownDim, InferenceContext::kUnknownDim, 3});
+        c->set_output(0, shape);
+        return Status::OK();
+    });
+
+REGISTER_KERNEL_BUILDER(
+    Name("BatchIndicesCube").Device(DEVICE_CPU), BatchIndicesCubeOp);
+
 ////////////////////////////////////////////////////////////////////////////////////////////////
 // IndicesCubeOp
 
@@ -40,52 +61,118 @@ void IndicesCubeOp::Compute(OpKernelContext* context)
     OP_REQUIRES_OK(
         context, context->allocate_output(0, resultShape, &resultTensor));
 
-    const GridStructure grid = createGridStructure(height, width, hPositions, vPositions);
+    fillCube(height, width,
+        hPositions.vec<int>().data(), hPositions.NumElements(),
+        vPositions.vec<int>().data(), vPositions.NumElements(),
+        0, resultTensor->tensor<int, 3>());
+}
+
+void IndicesCubeOp::fillCube(int height, int width,
+    const int* hPositions, int hPositionsCount,
+    const int* vPositions, int vPositionsCount,
+    int firstChannel, TTypes<int, 3>::Tensor cube) const
+{
+    const GridStructure grid = createGridStructure(
+        height, width, hPositions, hPositionsCount, vPositions, vPositionsCount);
 
     for(int rowIndex = 0; rowIndex < grid.GetRowsCount(); ++rowIndex) {
         for(int colIndex = 0; colIndex < grid.GetColsCount(); ++colIndex) {
             const Rect cell = grid.GetCellRect(rowIndex, colIndex);
-            setValues(cell, rowIndex, colIndex, *resultTensor);
+            setValues(cell, rowIndex, colIndex, firstChannel, cube);
         }
     }
 }
 
-GridStructure IndicesCubeOp::createGridStructure(
-    int height, int width, const Tensor& hPositions, const Tensor& vPositions) const
+GridStructure IndicesCubeOp::createGridStructure(int height, int width,
+    const int* hPositions, int hPositionsCount,
+    const int* vPositions, int vPositionsCount) const
 {
     return GridStructure(
-        extractPositions(hPositions, height),
-        extractPositions(vPositions, width)
+        extractPositions(hPositions, hPositionsCount, height),
+        extractPositions(vPositions, vPositionsCount, width)
     );
 }
 
 vector<int> IndicesCubeOp::extractPositions(
-    const Tensor& tensor, int dimensionSize) const
+    const int* positions, int count, int dimensionSize) const
 {
-    const auto vec = tensor.vec<int>();
-
     vector<int> result;
-    result.reserve(vec.size() + 2);
+    result.reserve(count + 2);
     result.push_back(0);
-    for(int i = 0; i < vec.size(); ++i) {
-        result.push_back(vec(i));
+    for(int i = 0; i < count; ++i) {
+        result.push_back(positions[i]);
     }
     result.push_back(dimensionSize);
     return result;
 }
 
-void IndicesCubeOp::setValues(
-    const Rect& rect, int value1, int value2, Tensor& result) const
+void IndicesCubeOp::setValues(const Rect& rect, int value1, int value2,
+    int firstChannel, TTypes<int, 3>::Tensor cube) const
 {
-    auto resultCube = result.tensor<int, 3>();
     {
-        const Eigen::array<int, 3> offsets = {rect.Top, rect.Left, 0};
+        const Eigen::array<int, 3> offsets = {rect.Top, rect.Left, firstChannel};
         const Eigen::array<int, 3> extents = {rect.Height(), rect.Width(), 1};
-        resultCube.slice(offsets, extents).setConstant(value1);
+        cube.slice(offsets, extents).setConstant(value1);
     }
     {
-        const Eigen::array<int, 3> offsets = {rect.Top, rect.Left, 1};
+        const Eigen::array<int, 3> offsets = {rect.Top, rect.Left, firstChannel + 1};
         const Eigen::array<int, 3> extents = {rect.Height(), rect.Width(), 1};
-        resultCube.slice(offsets, extents).setConstant(value2);
+        cube.slice(offsets, extents).setConstant(value2);
     }
-}
\ No newline at end of file
+}
+
+////////////////////////////////////////////////////////////////////////////////////////////////
+// BatchIndicesCubeOp
+
+void BatchIndicesCubeOp::Compute(OpKernelContext* context)
+{
+    const int height = context->input(0).scalar<int>()(0);
+    const int width = context->input(1).scalar<int>()(0);
+    const auto heights = context->input(2).vec<int>();
+    const auto widths = context->input(3).vec<int>();
+    const auto hPositions = context->input(4).vec<int>();
+    const auto hRowSplits = context->input(5).vec<int64_t>();
+    const auto vPositions = context->input(6).vec<int>();
+    const auto vRowSplits = context->input(7).vec<int64_t>();
+
+    const int batchSize = heights.size();
+    OP_REQUIRES(context, widths.size() == batchSize
+            && hRowSplits.size() == batchSize + 1 && vRowSplits.size() == batchSize + 1,
+        errors::InvalidArgument("BatchIndicesCube got inconsistent batch size."));
+    for(int b = 0; b < batchSize; ++b) {
+        OP_REQUIRES(context, 0 <= heights(b) && heights(b) <= height
+                && 0 <= widths(b) && widths(b) <= width,
+            errors::InvalidArgument("BatchIndicesCube got size out of range."));
+        OP_REQUIRES(context, hRowSplits(b) <= hRowSplits(b + 1) && vRowSplits(b) <= vRowSplits(b + 1),
+            errors::InvalidArgument("BatchIndicesCube expects non-decreasing row splits."));
+    }
+    OP_REQUIRES(context, hRowSplits(0) == 0 && hRowSplits(batchSize) == hPositions.size()
+            && vRowSplits(0) == 0 && vRowSplits(batchSize) == vPositions.size(),
+        errors::InvalidArgument("BatchIndicesCube got row splits inconsistent with positions."));
+
+    // Create an output tensor
+    TensorShape resultShape({batchSize, height, width, 3});
+    Tensor* resultTensor = 0;
+    OP_REQUIRES_OK(
+        context, context->allocate_output(0, resultShape, &resultTensor));
+
+    auto resultCubes = resultTensor->tensor<int, 4>();
+    auto fillCubes = [&](int64_t start, int64_t limit) {
+        for(int64_t b = start; b < limit; ++b) {
+            TTypes<int, 3>::Tensor cube(
+                resultCubes.data() + b * height * width * 3, height, width, 3);
+            cube.setZero();
+            const Eigen::array<int, 3> offsets = {0, 0, 0};
+            const Eigen::array<int, 3> extents = {height, width, 1};
+            cube.slice(offsets, extents).setConstant(static_cast<int>(b));
+
+            fillCube(heights(b), widths(b),
+                hPositions.data() + hRowSplits(b), hRowSplits(b + 1) - hRowSplits(b),
+                vPositions.data() + vRowSplits(b), vRowSplits(b + 1) - vRowSplits(b),
+                1, cube);
+        }
+    };
+    const auto workerThreads = context->device()->tensorflow_cpu_worker_threads();
+    const int64_t costPerExample = 3 * static_cast<int64_t>(height) * width;
+    Shard(workerThreads->num_threads, workerThreads->workers, batchSize, costPerExample, fillCubes);
+}
@@ -17,9 +17,29 @@ public:
 
     virtual void Compute(OpKernelContext* context) override;
 
+protected:
+    // Fills channels [firstChannel, firstChannel+1] of height x width x C cube
+    // with indices of cell containing each pixel.
+    void fillCube(int height, int width,
+        const int* hPositions, int hPositionsCount,
+        const int* vPositions, int vPositionsCount,
+        int firstChannel, TTypes<int, 3>::Tensor cube) const;
+
 private:
-    GridStructure createGridStructure(
-        int height, int width, const Tensor& hPositions, const Tensor& vPositions) const;
-    vector<int> extractPositions(const Tensor& tensor, int dimensionSize) const;
-    void setValues(const Rect& rect, int value1, int value2, Tensor& result) const;
+    GridStructure createGridStructure(int height, int width,
+        const int* hPositions, int hPositionsCount,
+        const int* vPositions, int vPositionsCount) const;
+    vector<int> extractPositions(const int* positions, int count, int dimensionSize) const;
+    void setValues(const Rect& rect, int value1, int value2,
+        int firstChannel, TTypes<int, 3>::Tensor cube) const;
+};
+
+// Batched version of IndicesCubeOp. Positions of examples are passed as ragged
+// tensors (values and row splits). Output is B x H x W x 3 cube, where each pixel
+// contains (example index, row index, col index). Padded pixels are set to (b, 0, 0).
+class BatchIndicesCubeOp : public IndicesCubeOp {
+public:
+    explicit BatchIndicesCubeOp(OpKernelConstruction* context) : IndicesCubeOp(context) {}
+
+    virtual void Compute(OpKernelContext* context) override;
 };
\ No newline at end of file
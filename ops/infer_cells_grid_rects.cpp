@@ -3,6 +3,7 @@
 #include "cells_structure_builder.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
 #include <cassert>
 
 using namespace tensorflow;
@@ -18,6 +19,21 @@ REGISTER_OP("InferCellsGridRects")
 
 REGISTER_KERNEL_BUILDER(Name("InferCellsGridRects").Device(DEVICE_CPU), InferCellsGridRectsOp);
 
+REGISTER_OP("BatchInferCellsGridRects")
+    .Input("merge_right_mask: bool")
+    .Input("merge_down_mask: bool")
+    .Input("rows_counts: int32")
+    .Input("cols_counts: int32")
+    .Output("rects: int32")
+    .Output("row_splits: int64")
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+        c->set_output(0, c->Matrix(shape_inference::InferenceContext::kUnknownDim, 4));
+        c->set_output(1, c->Vector(shape_inference::InferenceContext::kUnknownDim));
+        return Status::OK();
+    });
+
+REGISTER_KERNEL_BUILDER(Name("BatchInferCellsGridRects").Device(DEVICE_CPU), BatchInferCellsGridRectsOp);
+
 //////////////////////////////////////////////////////////////////////////////
 // InferCellsGridRectsOp
 
@@ -26,7 +42,10 @@ void InferCellsGridRectsOp::Compute(OpKernelContext* context)
     const Tensor& mergeRightMask = context->input(0);
     const Tensor& mergeDownMask = context->input(1);
 
-    const CellsStructureBuilder builder(mergeRightMask, mergeDownMask);
+    const CellsStructureBuilder builder(
+        mergeRightMask.matrix<bool>(), mergeDownMask.matrix<bool>(),
+        static_cast<int>(mergeRightMask.dim_size(0)),
+        static_cast<int>(mergeDownMask.dim_size(1)));
     const vector<Rect> cellsGridRects = builder.Build();
 
     // Create an output tensor
@@ -34,13 +53,86 @@ void InferCellsGridRectsOp::Compute(OpKernelContext* context)
     Tensor* resultTensor = 0;
     OP_REQUIRES_OK(
         context, context->allocate_output(0, resultShape, &resultTensor));
-        
+
+    writeRects(cellsGridRects, resultTensor->matrix<int>(), 0);
+}
+
+void InferCellsGridRectsOp::writeRects(
+    const vector<Rect>& rects, TTypes<int>::Matrix result, int firstRow) const
+{
+    for(int i = 0; i < rects.size(); ++i) {
+        const Rect& rect = rects[i];
+        result(firstRow + i, 0) = rect.Left;
+        result(firstRow + i, 1) = rect.Top;
+        result(firstRow + i, 2) = rect.Right;
+        result(firstRow + i, 3) = rect.Bottom;
+    }
+}
+
+//////////////////////////////////////////////////////////////////////////////
+// BatchInferCellsGridRectsOp
+
+void BatchInferCellsGridRectsOp::Compute(OpKernelContext* context)
+{
+    const Tensor& mergeRightMask = context->input(0);
+    const Tensor& mergeDownMask = context->input(1);
+    const auto rowsCounts = context->input(2).vec<int>();
+    const auto colsCounts = context->input(3).vec<int>();
+    OP_REQUIRES(context, mergeRightMask.dims() == 3 && mergeDownMask.dims() == 3,
+        errors::InvalidArgument("BatchInferCellsGridRects expects 3-D masks."));
+
+    const int batchSize = mergeRightMask.dim_size(0);
+    const int maxRowsCount = mergeRightMask.dim_size(1);
+    const int maxColsCount = mergeDownMask.dim_size(2);
+    OP_REQUIRES(context, mergeDownMask.dim_size(0) == batchSize
+            && rowsCounts.size() == batchSize && colsCounts.size() == batchSize,
+        errors::InvalidArgument("BatchInferCellsGridRects got inconsistent batch size."));
+    OP_REQUIRES(context, mergeRightMask.dim_size(2) + 1 == maxColsCount
+            && mergeDownMask.dim_size(1) + 1 == maxRowsCount,
+        errors::InvalidArgument("BatchInferCellsGridRects got inconsistent masks shapes."));
+    for(int b = 0; b < batchSize; ++b) {
+        OP_REQUIRES(context, 0 < rowsCounts(b) && rowsCounts(b) <= maxRowsCount
+                && 0 < colsCounts(b) && colsCounts(b) <= maxColsCount,
+            errors::InvalidArgument("BatchInferCellsGridRects got grid size out of range."));
+    }
+
+    const auto mergeRightMasks = mergeRightMask.tensor<bool, 3>();
+    const auto mergeDownMasks = mergeDownMask.tensor<bool, 3>();
+    vector<vector<Rect>> cellsGridRects(batchSize);
+    auto inferRects = [&](int64_t start, int64_t limit) {
+        for(int64_t b = start; b < limit; ++b) {
+            const TTypes<bool>::ConstMatrix exampleMergeRightMask(
+                mergeRightMasks.data() + b * maxRowsCount * (maxColsCount - 1),
+                maxRowsCount, maxColsCount - 1);
+            const TTypes<bool>::ConstMatrix exampleMergeDownMask(
+                mergeDownMasks.data() + b * (maxRowsCount - 1) * maxColsCount,
+                maxRowsCount - 1, maxColsCount);
+            const CellsStructureBuilder builder(
+                exampleMergeRightMask, exampleMergeDownMask, rowsCounts(b), colsCounts(b));
+            cellsGridRects[b] = builder.Build();
+        }
+    };
+    const auto workerThreads = context->device()->tensorflow_cpu_worker_threads();
+    const int64_t costPerExample = 100 * static_cast<int64_t>(maxRowsCount) * maxColsCount;
+    Shard(workerThreads->num_threads, workerThreads->workers, batchSize, costPerExample, inferRects);
+
+    // Create output tensors
+    Tensor* rowSplitsTensor = 0;
+    OP_REQUIRES_OK(
+        context, context->allocate_output(1, TensorShape({batchSize + 1}), &rowSplitsTensor));
+    auto rowSplitsVector = rowSplitsTensor->vec<int64_t>();
+    rowSplitsVector(0) = 0;
+    for(int b = 0; b < batchSize; ++b) {
+        rowSplitsVector(b + 1) = rowSplitsVector(b) + cellsGridRects[b].size();
+    }
+
+    TensorShape resultShape({rowSplitsVector(batchSize), 4});
+    Tensor* resultTensor = 0;
+    OP_REQUIRES_OK(
+        context, context->allocate_output(0, resultShape, &resultTensor));
+
     auto resultMatrix = resultTensor->matrix<int>();
-    for(int i = 0; i < cellsGridRects.size(); ++i) {
-        const Rect& rect = cellsGridRects[i];
-        resultMatrix(i, 0) = rect.Left;
-        resultMatrix(i, 1) = rect.Top;
-        resultMatrix(i, 2) = rect.Right;
-        resultMatrix(i, 3) = rect.Bottom;
+    for(int b = 0; b < batchSize; ++b) {
+        writeRects(cellsGridRects[b], resultMatrix, rowSplitsVector(b));
     }
-}
\ No newline at end of file
+}
@@ -1,14 +1,32 @@
 #pragma once
 
+#include <vector>
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/op_kernel.h"
 
 using namespace tensorflow;
+using std::vector;
+
+struct Rect;
 
 class InferCellsGridRectsOp : public OpKernel {
 public:
     explicit InferCellsGridRectsOp(OpKernelConstruction* context) : OpKernel(context) {}
 
+    virtual void Compute(OpKernelContext* context) override;
+
+protected:
+    void writeRects(const vector<Rect>& rects, TTypes<int>::Matrix result, int firstRow) const;
+};
+
+// Batched version of InferCellsGridRectsOp. Masks of examples are padded
+// to B x R x (C-1) and B x (R-1) x C, actual grid size of each example is
+// specified by rows_counts and cols_counts. Outputs values and row splits
+// of ragged result.
+class BatchInferCellsGridRectsOp : public InferCellsGridRectsOp {
+public:
+    explicit BatchInferCellsGridRectsOp(OpKernelConstruction* context) : InferCellsGridRectsOp(context) {}
+
     virtual void Compute(OpKernelContext* context) override;
 };
\ No newline at end of file
@@ -2,7 +2,9 @@
 
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
 #include <cassert>
+#include <algorithm>
 
 using namespace tensorflow;
 
@@ -16,6 +18,19 @@ REGISTER_OP("IntervalsCenters")
 
 REGISTER_KERNEL_BUILDER(Name("IntervalsCenters").Device(DEVICE_CPU), IntervalsCentersOp);
 
+REGISTER_OP("BatchIntervalsCenters")
+    .Input("mask: int32")
+    .Input("lengths: int32")
+    .Output("centers: int32")
+    .Output("row_splits: int64")
+    .SetShapeFn([](shape_inference::InferenceContext* c) {
+        c->set_output(0, c->Vector(shape_inference::InferenceContext::kUnknownDim));
+        c->set_output(1, c->Vector(shape_inference::InferenceContext::kUnknownDim));
+        return Status::OK();
+    });
+
+REGISTER_KERNEL_BUILDER(Name("BatchIntervalsCenters").Device(DEVICE_CPU), BatchIntervalsCentersOp);
+
 //////////////////////////////////////////////////////////////////////////////
 // IntervalsCentersOp
 
@@ -25,7 +40,8 @@ void IntervalsCentersOp::Compute(OpKernelContext* context)
     OP_REQUIRES(context, TensorShapeUtils::IsVector(mask.shape()),
         errors::InvalidArgument("IntervalsCenters expects a 1-D vector."));
     
-    const vector<int> centers = getIntervalsCenters(mask);
+    const vector<int> centers = getIntervalsCenters(
+        mask.vec<int>().data(), static_cast<int>(mask.dim_size(0)));
 
     // Create an output tensor
     TensorShape resultShape({static_cast<int>(centers.size())});
@@ -39,16 +55,14 @@ void IntervalsCentersOp::Compute(OpKernelContext* context)
   }
 }
 
-vector<int> IntervalsCentersOp::getIntervalsCenters(const Tensor& input) const
+vector<int> IntervalsCentersOp::getIntervalsCenters(const int* input, int length) const
 {
-    const auto inputVec = input.vec<int>();
-    
     vector<int> result;
     int currentIntervalStart = -1;
     bool isInsideInterval = false;
     
-    for(int i = 0; i < inputVec.size(); ++i) {
-        if(inputVec(i) == 1) {
+    for(int i = 0; i < length; ++i) {
+        if(input[i] == 1) {
             if(!isInsideInterval) {
                 currentIntervalStart = i;
                 isInsideInterval = true;
@@ -61,7 +75,58 @@ vector<int> IntervalsCentersOp::getIntervalsCenters(const Tensor& input) const
         }
     }
     if(isInsideInterval) {
-        result.push_back((currentIntervalStart + inputVec.size()) / 2);
+        result.push_back((currentIntervalStart + length) / 2);
     }
     return result;
-}
\ No newline at end of file
+}
+
+//////////////////////////////////////////////////////////////////////////////
+// BatchIntervalsCentersOp
+
+void BatchIntervalsCentersOp::Compute(OpKernelContext* context)
+{
+    const Tensor& mask = context->input(0);
+    const Tensor& lengths = context->input(1);
+    OP_REQUIRES(context, TensorShapeUtils::IsMatrix(mask.shape()),
+        errors::InvalidArgument("BatchIntervalsCenters expects a 2-D matrix."));
+    OP_REQUIRES(context, TensorShapeUtils::IsVector(lengths.shape())
+            && lengths.dim_size(0) == mask.dim_size(0),
+        errors::InvalidArgument("BatchIntervalsCenters expects a vector of lengths of each row."));
+
+    const int batchSize = mask.dim_size(0);
+    const int maxLength = mask.dim_size(1);
+    const auto lengthsVector = lengths.vec<int>();
+    for(int i = 0; i < batchSize; ++i) {
+        OP_REQUIRES(context, 0 <= lengthsVector(i) && lengthsVector(i) <= maxLength,
+            errors::InvalidArgument("BatchIntervalsCenters got length out of range."));
+    }
+
+    const auto maskMatrix = mask.matrix<int>();
+    vector<vector<int>> centers(batchSize);
+    auto findCenters = [&](int64_t start, int64_t limit) {
+        for(int64_t row = start; row < limit; ++row) {
+            centers[row] = getIntervalsCenters(&maskMatrix(row, 0), lengthsVector(row));
+        }
+    };
+    const auto workerThreads = context->device()->tensorflow_cpu_worker_threads();
+    Shard(workerThreads->num_threads, workerThreads->workers, batchSize, maxLength, findCenters);
+
+    // Create output tensors
+    Tensor* rowSplitsTensor = 0;
+    OP_REQUIRES_OK(
+        context, context->allocate_output(1, TensorShape({batchSize + 1}), &rowSplitsTensor));
+    auto rowSplitsVector = rowSplitsTensor->vec<int64_t>();
+    rowSplitsVector(0) = 0;
+    for(int row = 0; row < batchSize; ++row) {
+        rowSplitsVector(row + 1) = rowSplitsVector(row) + centers[row].size();
+    }
+
+    Tensor* resultTensor = 0;
+    TensorShape resultShape({rowSplitsVector(batchSize)});
+    OP_REQUIRES_OK(
+        context, context->allocate_output(0, resultShape, &resultTensor));
+    auto resultVector = resultTensor->vec<int>();
+    for(int row = 0; row < batchSize; ++row) {
+        std::copy(centers[row].begin(), centers[row].end(), resultVector.data() + rowSplitsVector(row));
+    }
+}
@@ -14,6 +14,15 @@ public:
 
     virtual void Compute(OpKernelContext* context) override;
 
-private:
-    vector<int> getIntervalsCenters(const Tensor& input) const;
+protected:
+    vector<int> getIntervalsCenters(const int* input, int length) const;
+};
+
+// Finds intervals centers in each row of B x N mask. Only first lengths[i] elements
+// of i-th row are considered. Outputs values and row splits of ragged result.
+class BatchIntervalsCentersOp : public IntervalsCentersOp {
+public:
+    explicit BatchIntervalsCentersOp(OpKernelConstruction* context) : IntervalsCentersOp(context) {}
+
+    virtual void Compute(OpKernelContext* context) override;
 };
\ No newline at end of file
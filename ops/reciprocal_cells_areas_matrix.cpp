@@ -2,6 +2,7 @@
 
 #include "tensorflow/core/framework/shape_inference.h"
 #include "tensorflow/core/framework/common_shape_fns.h"
+#include "tensorflow/core/util/work_sharder.h"
 #include "grid_structure.h"
 #include <cassert>
 
@@ -22,6 +23,26 @@ REGISTER_OP("ReciprocalCellsAreasMatrix")
 REGISTER_KERNEL_BUILDER(
     Name("ReciprocalCellsAreasMatrix").Device(DEVICE_CPU), ReciprocalCellsAreasMatrixOp);
 
+REGISTER_OP("BatchReciprocalCellsAreasMatrix")
+    .Input("height: int32")
+    .Input("width: int32")
+    .Input("heights: int32")
+    .Input("widths: int32")
+    .Input("h_positions: int32")
+    .Input("h_row_splits: int64")
+    .Input("v_positions: int32")
+    .Input("v_row_splits: int64")
+    .Output("matrix: float32")
+    .SetShapeFn([](InferenceContext* c) {
+        ShapeHandle shape = c->MakeShape(
+            {c->Dim(c->input(2), 0), InferenceContext::kUnknownDim, InferenceContext::kUnknownDim});
+        c->set_output(0, shape);
+        return Status::OK();
+    });
+
+REGISTER_KERNEL_BUILDER(
+    Name("BatchReciprocalCellsAreasMatrix").Device(DEVICE_CPU), BatchReciprocalCellsAreasMatrixOp);
+
 ////////////////////////////////////////////////////////////////////////////////////////////////
 // ReciprocalCellsAreasMatrixOp
 
@@ -38,7 +59,19 @@ void ReciprocalCellsAreasMatrixOp::Compute(OpKernelContext* context)
     OP_REQUIRES_OK(
         context, context->allocate_output(0, resultShape, &resultTensor));
 
-    const GridStructure grid = createGridStructure(height, width, hPositions, vPositions);
+    fillMatrix(height, width,
+        hPositions.vec<int>().data(), hPositions.NumElements(),
+        vPositions.vec<int>().data(), vPositions.NumElements(),
+        resultTensor->matrix<float>());
+}
+
+void ReciprocalCellsAreasMatrixOp::fillMatrix(int height, int width,
+    const int* hPositions, int hPositionsCount,
+    const int* vPositions, int vPositionsCount,
+    TTypes<float>::Matrix result) const
+{
+    const GridStructure grid = createGridStructure(
+        height, width, hPositions, hPositionsCount, vPositions, vPositionsCount);
 
     for(int rowIndex = 0; rowIndex < grid.GetRowsCount(); ++rowIndex) {
         for(int colIndex = 0; colIndex < grid.GetColsCount(); ++colIndex) {
@@ -48,40 +81,90 @@ void ReciprocalCellsAreasMatrixOp::Compute(OpKernelContext* context)
             }
             const int area = cell.GetArea();
             assert(area > 0);
-            setValue(cell, 1.0f / area, *resultTensor);
+            setValue(cell, 1.0f / area, result);
         }
     }
 }
 
-GridStructure ReciprocalCellsAreasMatrixOp::createGridStructure(
-    int height, int width, const Tensor& hPositions, const Tensor& vPositions) const
+GridStructure ReciprocalCellsAreasMatrixOp::createGridStructure(int height, int width,
+    const int* hPositions, int hPositionsCount,
+    const int* vPositions, int vPositionsCount) const
 {
     return GridStructure(
-        extractPositions(hPositions, height),
-        extractPositions(vPositions, width)
+        extractPositions(hPositions, hPositionsCount, height),
+        extractPositions(vPositions, vPositionsCount, width)
     );
 }
 
 vector<int> ReciprocalCellsAreasMatrixOp::extractPositions(
-    const Tensor& tensor, int dimensionSize) const
+    const int* positions, int count, int dimensionSize) const
 {
-    const auto vec = tensor.vec<int>();
-
     vector<int> result;
-    result.reserve(vec.size() + 2);
+    result.reserve(count + 2);
     result.push_back(0);
-    for(int i = 0; i < vec.size(); ++i) {
-        result.push_back(vec(i));
+    for(int i = 0; i < count; ++i) {
+        result.push_back(positions[i]);
     }
     result.push_back(dimensionSize);
     return result;
 }
 
 void ReciprocalCellsAreasMatrixOp::setValue(
-    const Rect& rect, float value, Tensor& result) const
+    const Rect& rect, float value, TTypes<float>::Matrix result) const
 {
-    auto resultMatrix = result.matrix<float>();
     const Eigen::array<int, 2> offsets = {rect.Top, rect.Left};
     const Eigen::array<int, 2> extents = {rect.Height(), rect.Width()};
-    resultMatrix.slice(offsets, extents).setConstant(value);
-}
\ No newline at end of file
+    result.slice(offsets, extents).setConstant(value);
+}
+
+////////////////////////////////////////////////////////////////////////////////////////////////
+// BatchReciprocalCellsAreasMatrixOp
+
+void BatchReciprocalCellsAreasMatrixOp::Compute(OpKernelContext* context)
+{
+    const int height = context->input(0).scalar<int>()(0);
+    const int width = context->input(1).scalar<int>()(0);
+    const auto heights = context->input(2).vec<int>();
+    const auto widths = context->input(3).vec<int>();
+    const auto hPositions = context->input(4).vec<int>();
+    const auto hRowSplits = context->input(5).vec<int64_t>();
+    const auto vPositions = context->input(6).vec<int>();
+    const auto vRowSplits = context->input(7).vec<int64_t>();
+
+    const int batchSize = heights.size();
+    OP_REQUIRES(context, widths.size() == batchSize
+            && hRowSplits.size() == batchSize + 1 && vRowSplits.size() == batchSize + 1,
+        errors::InvalidArgument("BatchReciprocalCellsAreasMatrix got inconsistent batch size."));
+    for(int b = 0; b < batchSize; ++b) {
+        OP_REQUIRES(context, 0 <= heights(b) && heights(b) <= height
+                && 0 <= widths(b) && widths(b) <= width,
+            errors::InvalidArgument("BatchReciprocalCellsAreasMatrix got size out of range."));
+        OP_REQUIRES(context, hRowSplits(b) <= hRowSplits(b + 1) && vRowSplits(b) <= vRowSplits(b + 1),
+            errors::InvalidArgument("BatchReciprocalCellsAreasMatrix expects non-decreasing row splits."));
+    }
+    OP_REQUIRES(context, hRowSplits(0) == 0 && hRowSplits(batchSize) == hPositions.size()
+            && vRowSplits(0) == 0 && vRowSplits(batchSize) == vPositions.size(),
+        errors::InvalidArgument("BatchReciprocalCellsAreasMatrix got row splits inconsistent with positions."));
+
+    // Create an output tensor
+    TensorShape resultShape({batchSize, height, width});
+    Tensor* resultTensor = 0;
+    OP_REQUIRES_OK(
+        context, context->allocate_output(0, resultShape, &resultTensor));
+
+    auto resultMatrices = resultTensor->tensor<float, 3>();
+    auto fillMatrices = [&](int64_t start, int64_t limit) {
+        for(int64_t b = start; b < limit; ++b) {
+            TTypes<float>::Matrix matrix(
+                resultMatrices.data() + b * height * width, height, width);
+            matrix.setZero();
+            fillMatrix(heights(b), widths(b),
+                hPositions.data() + hRowSplits(b), hRowSplits(b + 1) - hRowSplits(b),
+                vPositions.data() + vRowSplits(b), vRowSplits(b + 1) - vRowSplits(b),
+                matrix);
+        }
+    };
+    const auto workerThreads = context->device()->tensorflow_cpu_worker_threads();
+    const int64_t costPerExample = static_cast<int64_t>(height) * width;
+    Shard(workerThreads->num_threads, workerThreads->workers, batchSize, costPerExample, fillMatrices);
+}
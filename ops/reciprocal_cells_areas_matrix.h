@@ -17,9 +17,28 @@ public:
 
     virtual void Compute(OpKernelContext* context) override;
 
+protected:
+    // Fills top-left height x width submatrix of result with reciprocal areas of cells.
+    void fillMatrix(int height, int width,
+        const int* hPositions, int hPositionsCount,
+        const int* vPositions, int vPositionsCount,
+        TTypes<float>::Matrix result) const;
+
 private:
-    GridStructure createGridStructure(
-        int height, int width, const Tensor& hPositions, const Tensor& vPositions) const;
-    vector<int> extractPositions(const Tensor& tensor, int dimensionSize) const;
-    void setValue(const Rect& rect, float value, Tensor& result) const;
+    GridStructure createGridStructure(int height, int width,
+        const int* hPositions, int hPositionsCount,
+        const int* vPositions, int vPositionsCount) const;
+    vector<int> extractPositions(const int* positions, int count, int dimensionSize) const;
+    void setValue(const Rect& rect, float value, TTypes<float>::Matrix result) const;
+};
+
+// Batched version of ReciprocalCellsAreasMatrixOp. Positions of examples are passed
+// as ragged tensors (values and row splits). Output is B x H x W tensor,
+// padded elements are set to zero.
+class BatchReciprocalCellsAreasMatrixOp : public ReciprocalCellsAreasMatrixOp {
+public:
+    explicit BatchReciprocalCellsAreasMatrixOp(OpKernelConstruction* context)
+        : ReciprocalCellsAreasMatrixOp(context) {}
+
+    virtual void Compute(OpKernelContext* context) override;
 };
\ No newline at end of file
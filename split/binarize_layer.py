@@ -1,16 +1,25 @@
 import tensorflow as tf
 from tensorflow import keras
 
-ops_module = tf.load_op_library('ops/ops.so')
+from utils.ops import get_op, CUSTOM_IMPLEMENTATION
 
 
 class BinarizeLayer(keras.layers.Layer):
     """Binarize input probabilities via graph-cut algorithm."""
-    def __init__(self, gc_lambda, name=None):
-        super().__init__(trainable=False, name=name)
+    def __init__(self, gc_lambda, name=None, ops_implementation=CUSTOM_IMPLEMENTATION):
+        # Graph-cut op takes float32 probabilities regardless of global precision policy.
+        super().__init__(trainable=False, name=name, dtype='float32')
         assert gc_lambda >= 0
         self.gc_lambda = gc_lambda
+        self._gc_binarize = get_op('batch_gc_binarize', ops_implementation)
 
-    def call(self, probs):
-        result = ops_module.gc_binarize(probs[0], self.gc_lambda)
-        return tf.expand_dims(result, axis=0)
+    def call(self, probs, lengths=None):
+        """Binarizes each example of the batch.
+
+        If lengths are specified, then only first lengths[i] probabilities
+        of i-th example are binarized, the rest of output is filled with zeros.
+        """
+        if lengths is None:
+            lengths = tf.fill([tf.shape(probs)[0]], tf.shape(probs)[1])
+        result = self._gc_binarize(probs, lengths, self.gc_lambda)
+        return tf.ensure_shape(result, probs.shape)
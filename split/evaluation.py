@@ -2,23 +2,58 @@ import os
 import tensorflow as tf
 
 from split.model import Model
+from utils.ops import CUSTOM_IMPLEMENTATION
+from utils.checkpoints import read_h5_layers_weights, get_layers_weights
+from utils.precision import FLOAT32_PRECISION, precision_policy
 
 
 def run_model_on_random_input(model):
     random_image = tf.random.uniform(shape=(1, 32, 32, 3), minval=0, maxval=256, dtype='int32')
     model(random_image)
 
-def load_model(model_file_path, compute_metric):
+def load_model(model_file_path, compute_metric, ops_implementation=CUSTOM_IMPLEMENTATION,
+               fuse_networks=False, resolution_policy=None, anisotropic_pool_size=None,
+               tiling_pixels_budget=None, precision=FLOAT32_PRECISION):
     assert os.path.exists(model_file_path)
-    model = Model(compute_metric)
+    with precision_policy(precision):
+        model = Model(
+            compute_metric, ops_implementation, fuse_networks, resolution_policy, anisotropic_pool_size,
+            tiling_pixels_budget)
     run_model_on_random_input(model)
-    model.load_weights(model_file_path)
+    load_weights(model, model_file_path)
 
-    # Metric can't be calculated in graph mode.
-    run_eagerly = True if compute_metric else False
-    model.compile(run_eagerly=run_eagerly)
+    model.compile()
     return model
 
+# Layers with weights in checkpoints of model with separate and fused RPN and CPN.
+_UNFUSED_LAYERS_NAMES = ['shared_fully_convolutional_network', 'RPN', 'CPN']
+_FUSED_LAYERS_NAMES = ['shared_fully_convolutional_network', 'projection_networks']
+
+def load_weights(model, model_file_path):
+    """Loads h5 weights into model.
+
+    Weights of model with separate RPN and CPN are mapped to fused
+    networks, if model was created with fuse_networks=True.
+    Raises ValueError, if checkpoint doesn't match model.
+    """
+    layers_weights = read_h5_layers_weights(model_file_path)
+    if 'projection_networks' in layers_weights:
+        expected_layers_names = _FUSED_LAYERS_NAMES
+        if not model.fuse_networks:
+            raise ValueError('{} has fused RPN and CPN, model was created with fuse_networks=False'.format(
+                model_file_path))
+    else:
+        expected_layers_names = _UNFUSED_LAYERS_NAMES
+    if len(layers_weights) != len(expected_layers_names):
+        raise ValueError('Expected layers {} with weights in {}, found: {}'.format(
+            expected_layers_names, model_file_path, list(layers_weights)))
+    layers_weights = get_layers_weights(layers_weights, expected_layers_names, model_file_path)
+
+    if model.fuse_networks and expected_layers_names == _UNFUSED_LAYERS_NAMES:
+        model.set_unfused_weights(layers_weights)
+    else:
+        model.load_weights(model_file_path)
+
 def convert_ds_element_to_tuple(element):    
     return (
         element['image'],
@@ -27,4 +62,37 @@ def convert_ds_element_to_tuple(element):
             'vert_split_points_binary': element['vert_split_points_mask'],
             'markup_table': element['markup_table']   
         }
-    )
\ No newline at end of file
+    )
+
+def convert_ds_element_to_padded_tuple(element):
+    """Same as convert_ds_element_to_tuple, but prepares element for padded batching."""
+
+    image = element['image']
+    return (
+        {
+            'image': image,
+            'height': tf.shape(image)[0],
+            'width': tf.shape(image)[1]
+        },
+        {
+            'horz_split_points_binary': element['horz_split_points_mask'],
+            'vert_split_points_binary': element['vert_split_points_mask'],
+            'markup_table': element['markup_table']
+        }
+    )
+
+def get_padding_values():
+    """Returns padding values for elements created by convert_ds_element_to_padded_tuple."""
+
+    return (
+        {
+            'image': tf.constant(0, tf.uint8),
+            'height': 0,
+            'width': 0
+        },
+        {
+            'horz_split_points_binary': False,
+            'vert_split_points_binary': False,
+            'markup_table': 0
+        }
+    )
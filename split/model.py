@@ -1,25 +1,67 @@
+import numpy as np
 import tensorflow as tf
 import tensorflow.keras as keras
 
 from split.projection_layer import ProjectionLayer, ProjectionDirection
+from split.projections_conv_layer import ProjectionsConvLayer
 from split.binarize_layer import BinarizeLayer
-from table.markup_table import Table
-from table.grid_structure import GridStructureBuilder
-from utils.rect import Rect
 from metrics.adjacency_f_measure import AdjacencyFMeasure
+from utils.batching import create_spatial_mask
+from utils.ops import CUSTOM_IMPLEMENTATION
+from utils.grouped_conv2d import GroupedInitializer
+from utils.resolution import upscale_values
+from utils.tiling import map_tiles, get_tile_length
+
+
+# Receptive field radius of SFCN (3 + 3 + 6) and dilated convolutions of 5 blocks
+# of RPN or CPN (4 each) along their projections, so that tiles with this
+# context give exact results (see Model._call_tiled).
+TILING_CONTEXT = 32
+
+
+def _apply_spatial_mask(input, spatial_mask):
+    # Zeroes padded region, so that it acts like 'same' padding of an unpadded image.
+    if spatial_mask is None:
+        return input
+    return input * spatial_mask
 
 
 class SharedFullyConvolutionalNetwork(keras.layers.Layer):
-    def __init__(self):
+    def __init__(self, anisotropic_pool_size=None):
+        """If anisotropic_pool_size is set, then output of the first convolution
+        is max pooled by this factor along width for RPN and along height for CPN,
+        and further convolutions are applied to each pooled result. RPN needs full
+        resolution along height only and CPN along width only, so that
+        output lengths are preserved.
+        """
         super().__init__()
         self._conv1 = keras.layers.Conv2D(18, 7, padding='same', activation='relu')
         self._conv2 = keras.layers.Conv2D(18, 7, padding='same', activation='relu')
         self._conv3 = keras.layers.Conv2D(18, 7, padding='same', activation='relu', dilation_rate=2)
+        self._anisotropic_pool_size = anisotropic_pool_size
+        if anisotropic_pool_size is not None:
+            self._rows_pooling = keras.layers.MaxPool2D((1, anisotropic_pool_size), padding='same')
+            self._cols_pooling = keras.layers.MaxPool2D((anisotropic_pool_size, 1), padding='same')
 
-    def call(self, input):
-        result = self._conv1(input)
-        result = self._conv2(result)
-        result = self._conv3(result)
+    def call(self, input, spatial_mask=None):
+        """Returns network output.
+
+        If anisotropic_pool_size is set, then returns [(rpn_input, rpn_spatial_mask),
+        (cpn_input, cpn_spatial_mask)] list instead.
+        """
+        result = _apply_spatial_mask(self._conv1(input), spatial_mask)
+        if self._anisotropic_pool_size is None:
+            return self._call_last_convs(result, spatial_mask)
+
+        results = []
+        for pooling in [self._rows_pooling, self._cols_pooling]:
+            pooled_spatial_mask = None if spatial_mask is None else pooling(spatial_mask)
+            results.append((self._call_last_convs(pooling(result), pooled_spatial_mask), pooled_spatial_mask))
+        return results
+
+    def _call_last_convs(self, input, spatial_mask):
+        result = _apply_spatial_mask(self._conv2(input), spatial_mask)
+        result = _apply_spatial_mask(self._conv3(result), spatial_mask)
         return result
 
 
@@ -30,61 +72,78 @@ class ProjectionNetworkBlock(keras.layers.Layer):
         self._should_reduce_size = should_reduce_size
         self._should_output_predictions = should_output_predictions
 
-        self._dilated_conv1 = keras.layers.Conv2D(6, 3, padding='same', activation='relu', dilation_rate=2)
-        self._dilated_conv2 = keras.layers.Conv2D(6, 3, padding='same', activation='relu', dilation_rate=3)
-        self._dilated_conv3 = keras.layers.Conv2D(6, 3, padding='same', activation='relu', dilation_rate=4)
+        self._dilated_conv1 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=2)
+        self._dilated_conv2 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=3)
+        self._dilated_conv3 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=4)
         self._concat1 = keras.layers.Concatenate()
         if should_reduce_size:
             pool_size = (1, 2) if direction == ProjectionDirection.Height else (2, 1)
             self._pooling = keras.layers.MaxPool2D(pool_size, padding='same')
         self._upper_branch_conv = keras.layers.Conv2D(18, 1, activation='relu')
-        self._upper_branch_proj = ProjectionLayer(direction, True)
+        self._upper_branch_proj = ProjectionLayer(direction, False)
         self._lower_branch_conv = keras.layers.Conv2D(1, 1, activation='sigmoid')
-        self._lower_branch_proj = ProjectionLayer(direction, True)
+        self._lower_branch_proj = ProjectionLayer(direction, False)
         if should_output_predictions:
-            self._prediction_layer = ProjectionLayer(direction, False)
             self._flatten_layer = keras.layers.Flatten()
-        self._concat2 = keras.layers.Concatenate()
 
-    def call(self, input):
-        middle_result = self._concat1(
-            [self._dilated_conv1(input), self._dilated_conv2(input), self._dilated_conv3(input)]
-        )
+    def call(self, input, spatial_mask=None):
+        middle_result = self.compute_middle_result(input, spatial_mask)
+        return self.call_on_middle_result(middle_result, self.reduce_spatial_mask(spatial_mask))
+
+    def compute_middle_result(self, input, spatial_mask=None):
+        """Returns result of dilated convolutions and pooling, which doesn't depend on projections of input."""
+        middle_result = self._concat1([
+            self._dilated_conv1(input, spatial_mask),
+            self._dilated_conv2(input, spatial_mask),
+            self._dilated_conv3(input, spatial_mask)
+        ])
+        middle_result = _apply_spatial_mask(middle_result, spatial_mask)
         if self._should_reduce_size:
             middle_result = self._pooling(middle_result)
+        return middle_result
 
-        upper_result = self._upper_branch_conv(middle_result)
-        upper_result = self._upper_branch_proj(upper_result)
+    def call_on_middle_result(self, middle_result, spatial_mask=None):
+        """Returns block output from result of compute_middle_result and spatial mask of block output."""
+        upper_result = _apply_spatial_mask(self._upper_branch_conv(middle_result), spatial_mask)
+        upper_result = self._upper_branch_proj(upper_result, spatial_mask)
 
-        lower_result = self._lower_branch_conv(middle_result)
-        if self._should_output_predictions:
-            predictions = self._prediction_layer(lower_result)
-            predictions = self._flatten_layer(predictions)
-        lower_result = self._lower_branch_proj(lower_result)
+        lower_result = _apply_spatial_mask(self._lower_branch_conv(middle_result), spatial_mask)
+        lower_result = self._lower_branch_proj(lower_result, spatial_mask)
 
-        result = self._concat2([upper_result, middle_result, lower_result])
+        # Projections aren't broadcast to the shape of middle result, see ProjectionsConvLayer.
+        result = [upper_result, middle_result, lower_result]
         if self._should_output_predictions:
-            return [result, predictions]
+            predictions = self._flatten_layer(lower_result)
+            return result, predictions
         return result
 
+    def reduce_spatial_mask(self, spatial_mask):
+        """Returns spatial mask of block output."""
+        if spatial_mask is None or not self._should_reduce_size:
+            return spatial_mask
+        return self._pooling(spatial_mask)
+
 
 class ProjectionNetworkFinalBlock(keras.layers.Layer):
     def __init__(self, direction):
         super().__init__()
-        self._dilated_conv1 = keras.layers.Conv2D(6, 3, padding='same', activation='relu', dilation_rate=2)
-        self._dilated_conv2 = keras.layers.Conv2D(6, 3, padding='same', activation='relu', dilation_rate=3)
-        self._dilated_conv3 = keras.layers.Conv2D(6, 3, padding='same', activation='relu', dilation_rate=4)
+        self._dilated_conv1 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=2)
+        self._dilated_conv2 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=3)
+        self._dilated_conv3 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=4)
         self._concat = keras.layers.Concatenate()
         self._conv1x1 = keras.layers.Conv2D(1, 1, activation='sigmoid')
         self._prediction_layer = ProjectionLayer(direction, False)
         self._flatten_layer = keras.layers.Flatten()
 
-    def call(self, input):
-        result = self._concat(
-            [self._dilated_conv1(input), self._dilated_conv2(input), self._dilated_conv3(input)]
-        )
-        result = self._conv1x1(result)
-        result = self._prediction_layer(result)
+    def call(self, input, spatial_mask=None):
+        result = self._concat([
+            self._dilated_conv1(input, spatial_mask),
+            self._dilated_conv2(input, spatial_mask),
+            self._dilated_conv3(input, spatial_mask)
+        ])
+        result = _apply_spatial_mask(result, spatial_mask)
+        result = _apply_spatial_mask(self._conv1x1(result), spatial_mask)
+        result = self._prediction_layer(result, spatial_mask)
         result = self._flatten_layer(result)
         return result
 
@@ -99,37 +158,278 @@ class ProjectionNetwork(keras.layers.Layer):
         self._block4 = ProjectionNetworkBlock(direction, False, True)
         self._block5 = ProjectionNetworkFinalBlock(direction)
 
-    def call(self, input):
-        block1_output = self._block1(input)
-        block2_output = self._block2(block1_output)
-        block3_output, probs1 = self._block3(block2_output)
-        block4_output, probs2 = self._block4(block3_output)
-        probs3 = self._block5(block4_output)
+    def call(self, input, spatial_mask=None):
+        return self.call_on_block1_middle_result(
+            self.compute_block1_middle_result(input, spatial_mask), spatial_mask)
+
+    def compute_block1_middle_result(self, input, spatial_mask=None):
+        """Returns middle result of the first block, which is local to each pixel of input.
+
+        The rest of network depends on projections, so network may be computed
+        by tiles up to this result (see Model).
+        """
+        return self._block1.compute_middle_result(input, spatial_mask)
+
+    def call_on_block1_middle_result(self, middle_result, spatial_mask=None):
+        """Returns network output from result of compute_block1_middle_result and spatial mask of input."""
+        spatial_mask = self._block1.reduce_spatial_mask(spatial_mask)
+        block1_output = self._block1.call_on_middle_result(middle_result, spatial_mask)
+        block2_output = self._block2(block1_output, spatial_mask)
+        spatial_mask = self._block2.reduce_spatial_mask(spatial_mask)
+        block3_output, probs1 = self._block3(block2_output, spatial_mask)
+        spatial_mask = self._block3.reduce_spatial_mask(spatial_mask)
+        block4_output, probs2 = self._block4(block3_output, spatial_mask)
+        spatial_mask = self._block4.reduce_spatial_mask(spatial_mask)
+        probs3 = self._block5(block4_output, spatial_mask)
+        return probs1, probs2, probs3
+
+
+class FusedProjectionNetworkBlock(keras.layers.Layer):
+    """ProjectionNetworkBlock, whose upper and lower branch convolutions are computed as a single one.
+
+    If has_dilated_convs is False, then block input is the result
+    of its dilated convolutions, computed outside of the block.
+    """
+    def __init__(self, direction, should_reduce_size, should_output_predictions, has_dilated_convs=True):
+        super().__init__()
+        self._direction = direction
+        self._should_reduce_size = should_reduce_size
+        self._should_output_predictions = should_output_predictions
+        self._has_dilated_convs = has_dilated_convs
+
+        if has_dilated_convs:
+            self._dilated_conv1 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=2)
+            self._dilated_conv2 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=3)
+            self._dilated_conv3 = ProjectionsConvLayer(direction, 6, 3, activation='relu', dilation_rate=4)
+            self._concat1 = keras.layers.Concatenate()
+        if should_reduce_size:
+            pool_size = (1, 2) if direction == ProjectionDirection.Height else (2, 1)
+            self._pooling = keras.layers.MaxPool2D(pool_size, padding='same')
+        # Upper branch convolution (18 channels) followed by lower branch one (1 channel).
+        self._branches_conv = keras.layers.Conv2D(
+            19, 1, kernel_initializer=GroupedInitializer([18, 1]))
+        self._upper_branch_proj = ProjectionLayer(direction, False)
+        self._lower_branch_proj = ProjectionLayer(direction, False)
+        if should_output_predictions:
+            self._flatten_layer = keras.layers.Flatten()
+
+    def call(self, input, spatial_mask=None):
+        middle_result = self.compute_middle_result(input, spatial_mask)
+        return self.call_on_middle_result(middle_result, self.reduce_spatial_mask(spatial_mask))
+
+    def compute_middle_result(self, input, spatial_mask=None):
+        """See ProjectionNetworkBlock.compute_middle_result."""
+        if self._has_dilated_convs:
+            middle_result = self._concat1([
+                self._dilated_conv1(input, spatial_mask),
+                self._dilated_conv2(input, spatial_mask),
+                self._dilated_conv3(input, spatial_mask)
+            ])
+        else:
+            middle_result = input
+        middle_result = _apply_spatial_mask(middle_result, spatial_mask)
+        if self._should_reduce_size:
+            middle_result = self._pooling(middle_result)
+        return middle_result
+
+    def call_on_middle_result(self, middle_result, spatial_mask=None):
+        """See ProjectionNetworkBlock.call_on_middle_result."""
+        branches_result = self._branches_conv(middle_result)
+        upper_result = _apply_spatial_mask(tf.nn.relu(branches_result[:, :, :, :18]), spatial_mask)
+        upper_result = self._upper_branch_proj(upper_result, spatial_mask)
+
+        lower_result = _apply_spatial_mask(tf.sigmoid(branches_result[:, :, :, 18:]), spatial_mask)
+        lower_result = self._lower_branch_proj(lower_result, spatial_mask)
+
+        # Projections aren't broadcast to the shape of middle result, see ProjectionsConvLayer.
+        result = [upper_result, middle_result, lower_result]
+        if self._should_output_predictions:
+            predictions = self._flatten_layer(lower_result)
+            return result, predictions
+        return result
+
+    def reduce_spatial_mask(self, spatial_mask):
+        """Returns spatial mask of block output."""
+        if spatial_mask is None or not self._should_reduce_size:
+            return spatial_mask
+        return self._pooling(spatial_mask)
+
+
+class FusedProjectionNetworks(keras.layers.Layer):
+    """RPN and CPN (see ProjectionNetwork) computed together.
+
+    Dilated convolutions of their first blocks have the same input, so they are
+    computed as single convolutions with channels of RPN followed by channels of CPN.
+    Outputs of further blocks have different shapes, so only upper and lower
+    branch convolutions inside each block are fused.
+    """
+    def __init__(self, name):
+        super().__init__(name=name)
+        self._dilated_conv1 = keras.layers.Conv2D(
+            12, 3, padding='same', activation='relu', dilation_rate=2, kernel_initializer=GroupedInitializer(2))
+        self._dilated_conv2 = keras.layers.Conv2D(
+            12, 3, padding='same', activation='relu', dilation_rate=3, kernel_initializer=GroupedInitializer(2))
+        self._dilated_conv3 = keras.layers.Conv2D(
+            12, 3, padding='same', activation='relu', dilation_rate=4, kernel_initializer=GroupedInitializer(2))
+        self._rpn_blocks = self._create_blocks(ProjectionDirection.Height)
+        self._cpn_blocks = self._create_blocks(ProjectionDirection.Width)
+
+    def call(self, input, spatial_mask=None):
+        rpn_middle_result, cpn_middle_result = self.compute_block1_middle_results(input, spatial_mask)
+        return (
+            self.call_on_block1_middle_result(ProjectionDirection.Height, rpn_middle_result, spatial_mask),
+            self.call_on_block1_middle_result(ProjectionDirection.Width, cpn_middle_result, spatial_mask)
+        )
+
+    def compute_block1_middle_results(self, input, spatial_mask=None):
+        """Returns middle results of the first RPN and CPN blocks (see ProjectionNetwork)."""
+        dilated_convs_results = [
+            tf.split(self._dilated_conv1(input), 2, axis=3),
+            tf.split(self._dilated_conv2(input), 2, axis=3),
+            tf.split(self._dilated_conv3(input), 2, axis=3)
+        ]
+        rpn_block1_input = tf.concat([result[0] for result in dilated_convs_results], axis=3)
+        cpn_block1_input = tf.concat([result[1] for result in dilated_convs_results], axis=3)
+        return (
+            self._rpn_blocks[0].compute_middle_result(rpn_block1_input, spatial_mask),
+            self._cpn_blocks[0].compute_middle_result(cpn_block1_input, spatial_mask)
+        )
+
+    def call_on_block1_middle_result(self, direction, middle_result, spatial_mask=None):
+        """Returns RPN (Height direction) or CPN (Width direction) output.
+
+        middle_result is the corresponding result of compute_block1_middle_results,
+        spatial_mask is the mask of input.
+        """
+        blocks = self._rpn_blocks if direction == ProjectionDirection.Height else self._cpn_blocks
+        return self._call_blocks(blocks, middle_result, spatial_mask)
+
+    def set_networks_weights(self, rpn_weights, cpn_weights):
+        """Sets weights from weights of RPN and CPN (see ProjectionNetwork.get_weights)."""
+        # Each of 4 ProjectionNetworkBlock has 10 weights: kernel and bias of 3 dilated
+        # convolutions, upper and lower branch convolutions. Final block has 8 weights.
+        def get_blocks_weights(weights):
+            result = []
+            for block_index in range(4):
+                block_weights = weights[10 * block_index:10 * (block_index + 1)]
+                if block_index > 0:
+                    result += block_weights[:6]
+                result.append(np.concatenate([block_weights[6], block_weights[8]], axis=-1))
+                result.append(np.concatenate([block_weights[7], block_weights[9]], axis=-1))
+            return result + weights[40:]
+
+        assert len(rpn_weights) == len(cpn_weights) == 48
+        self.set_weights(
+            [np.concatenate(weights, axis=-1) for weights in zip(rpn_weights[:6], cpn_weights[:6])]
+            + get_blocks_weights(rpn_weights)
+            + get_blocks_weights(cpn_weights)
+        )
+
+    def _create_blocks(self, direction):
+        return [
+            FusedProjectionNetworkBlock(direction, True, False, False),
+            FusedProjectionNetworkBlock(direction, True, False),
+            FusedProjectionNetworkBlock(direction, True, True),
+            FusedProjectionNetworkBlock(direction, False, True),
+            ProjectionNetworkFinalBlock(direction)
+        ]
+
+    def _call_blocks(self, blocks, block1_middle_result, spatial_mask):
+        spatial_mask = blocks[0].reduce_spatial_mask(spatial_mask)
+        block1_output = blocks[0].call_on_middle_result(block1_middle_result, spatial_mask)
+        block2_output = blocks[1](block1_output, spatial_mask)
+        spatial_mask = blocks[1].reduce_spatial_mask(spatial_mask)
+        block3_output, probs1 = blocks[2](block2_output, spatial_mask)
+        spatial_mask = blocks[2].reduce_spatial_mask(spatial_mask)
+        block4_output, probs2 = blocks[3](block3_output, spatial_mask)
+        spatial_mask = blocks[3].reduce_spatial_mask(spatial_mask)
+        probs3 = blocks[4](block4_output, spatial_mask)
         return probs1, probs2, probs3
 
 
 class Model(keras.models.Model):
-    def __init__(self, compute_metric=False):
+    def __init__(self, compute_metric=False, ops_implementation=CUSTOM_IMPLEMENTATION, fuse_networks=False,
+                 resolution_policy=None, anisotropic_pool_size=None, tiling_pixels_budget=None):
+        """ops_implementation selects implementation of batched ops (see utils.ops).
+
+        If fuse_networks is True, then RPN and CPN are computed as
+        FusedProjectionNetworks. Weights of model with separate networks
+        may be loaded with set_unfused_weights.
+        If resolution_policy (see utils.resolution) is set, then images are
+        downscaled by it, and predictions are upscaled to original size.
+        If anisotropic_pool_size is set, then RPN input is downsampled along
+        width and CPN input along height (see SharedFullyConvolutionalNetwork).
+        RPN and CPN have different inputs in this case, so they can't be fused.
+        If tiling_pixels_budget is set, then batches with more pixels are computed
+        by tiles up to the first blocks of RPN and CPN (see _call_tiled).
+        """
         super().__init__()
+        assert not (fuse_networks and anisotropic_pool_size is not None)
+        assert not (tiling_pixels_budget is not None and anisotropic_pool_size is not None)
+        self._resolution_policy = resolution_policy
+        self._tiling_pixels_budget = tiling_pixels_budget
 
         self._normalize_image_layer = keras.layers.experimental.preprocessing.Rescaling(
             scale=1./255)
-        self._sfcn = SharedFullyConvolutionalNetwork()
-        self._rpn = ProjectionNetwork(ProjectionDirection.Height, 'RPN')
-        self._cpn = ProjectionNetwork(ProjectionDirection.Width, 'CPN')
+        self._sfcn = SharedFullyConvolutionalNetwork(anisotropic_pool_size)
+        self._fuse_networks = fuse_networks
+        if fuse_networks:
+            self._projection_networks = FusedProjectionNetworks('projection_networks')
+        else:
+            self._rpn = ProjectionNetwork(ProjectionDirection.Height, 'RPN')
+            self._cpn = ProjectionNetwork(ProjectionDirection.Width, 'CPN')
 
-        self._binarize_horz_splits_layer = BinarizeLayer(0)
-        self._binarize_vert_splits_layer = BinarizeLayer(0.75)
+        self._binarize_horz_splits_layer = BinarizeLayer(0, ops_implementation=ops_implementation)
+        self._binarize_vert_splits_layer = BinarizeLayer(0.75, ops_implementation=ops_implementation)
 
-        self._metric = AdjacencyFMeasure() if compute_metric else None
+        self._metric = AdjacencyFMeasure(ops_implementation) if compute_metric else None
 
     def call(self, input):
-        input = self._normalize_image_layer(input)
-        sfcn_output = self._sfcn(input)
-        horz_split_points_probs1, horz_split_points_probs2, horz_split_points_probs3 = self._rpn(sfcn_output)
-        vert_split_points_probs1, vert_split_points_probs2, vert_split_points_probs3 = self._cpn(sfcn_output)
-        horz_split_points_binary = self._binarize_horz_splits_layer(horz_split_points_probs3)
-        vert_split_points_binary = self._binarize_vert_splits_layer(vert_split_points_probs3)
+        """Runs model on batch of images.
+
+        Input is either an image tensor or a dict with padded 'image' batch
+        and valid 'height' and 'width' of each image. In the latter case
+        padded region does not affect predictions for the valid one.
+        """
+        heights = widths = spatial_mask = None
+        if isinstance(input, dict):
+            image = input['image']
+            heights = input['height']
+            widths = input['width']
+            spatial_mask = create_spatial_mask(
+                heights, widths, tf.shape(image)[1], tf.shape(image)[2], self.compute_dtype)
+        else:
+            image = input
+
+        height = tf.shape(image)[1]
+        width = tf.shape(image)[2]
+        if self._resolution_policy is not None:
+            image, heights, widths = self._resolution_policy.downscale_image(image, heights, widths)
+            if spatial_mask is not None:
+                spatial_mask = create_spatial_mask(
+                    heights, widths, tf.shape(image)[1], tf.shape(image)[2], self.compute_dtype)
+
+        normalized_image = self._normalize_image_layer(image)
+        if self._tiling_pixels_budget is not None:
+            horz_split_points_probs, vert_split_points_probs = self._call_tiled(normalized_image, spatial_mask)
+        else:
+            horz_split_points_probs, vert_split_points_probs = self._call_networks(normalized_image, spatial_mask)
+        # Predictions are float32 regardless of precision of computations (see utils.precision).
+        horz_split_points_probs1, horz_split_points_probs2, horz_split_points_probs3 = [
+            tf.cast(probs, tf.float32) for probs in horz_split_points_probs]
+        vert_split_points_probs1, vert_split_points_probs2, vert_split_points_probs3 = [
+            tf.cast(probs, tf.float32) for probs in vert_split_points_probs]
+        horz_split_points_binary = self._binarize_horz_splits_layer(horz_split_points_probs3, heights)
+        vert_split_points_binary = self._binarize_vert_splits_layer(vert_split_points_probs3, widths)
+        if self._resolution_policy is not None:
+            horz_split_points_probs1, horz_split_points_probs2, horz_split_points_probs3, horz_split_points_binary = [
+                upscale_values(values, height) for values in [
+                    horz_split_points_probs1, horz_split_points_probs2, horz_split_points_probs3, horz_split_points_binary]
+            ]
+            vert_split_points_probs1, vert_split_points_probs2, vert_split_points_probs3, vert_split_points_binary = [
+                upscale_values(values, width) for values in [
+                    vert_split_points_probs1, vert_split_points_probs2, vert_split_points_probs3, vert_split_points_binary]
+            ]
         return {
             'horz_split_points_probs1': horz_split_points_probs1,
             'horz_split_points_probs2': horz_split_points_probs2,
@@ -143,6 +443,21 @@ class Model(keras.models.Model):
             'markup_table': tf.zeros(shape=(0,))
         }
 
+    @property
+    def fuse_networks(self):
+        return self._fuse_networks
+
+    def set_unfused_weights(self, layers_weights):
+        """Sets weights of fused model from weights of model with separate networks.
+
+        layers_weights are weights of each layer of unfused model with weights:
+        shared network, RPN and CPN.
+        """
+        assert self._fuse_networks
+        assert len(layers_weights) == 3
+        self._sfcn.set_weights(layers_weights[0])
+        self._projection_networks.set_networks_weights(layers_weights[1], layers_weights[2])
+
     def compute_metrics(self, input_dict, targets_dict, prediction, sample_weight):
         metric_results = super().compute_metrics(
             input_dict, targets_dict, prediction, sample_weight)
@@ -150,22 +465,81 @@ class Model(keras.models.Model):
         if self._metric is None:
             return metric_results
 
-        markup_table = Table.from_tensor(tf.squeeze(targets_dict['markup_table'], axis=0))
-
-        h_binary = tf.squeeze(prediction['horz_split_points_binary'], axis=0).numpy()
-        v_binary = tf.squeeze(prediction['vert_split_points_binary'], axis=0).numpy()
-        
-        # Uncomment if you want to know max possible value of metric.
-        #h_binary = tf.squeeze(targets_dict['horz_split_points_binary'], axis=0).numpy()
-        #v_binary = tf.squeeze(targets_dict['vert_split_points_binary'], axis=0).numpy()
-
-        grid = GridStructureBuilder(markup_table.rect, h_binary, v_binary).build()
-        cells = []
-        for i in range(grid.get_rows_count()):
-            for j in range(grid.get_cols_count()):
-                cells.append(Rect(j, i, j+1, i+1))
+        # Use targets_dict binary masks instead, if you want to know max possible value of metric.
+        self._metric.update_state(
+            targets_dict['markup_table'],
+            prediction['horz_split_points_binary'], prediction['vert_split_points_binary'])
 
-        self._metric.update_state_eager(markup_table, grid, cells)
         metric_results['adjacency_f_measure'] = self._metric.result()
         
         return metric_results 
+
+    def _call_networks(self, normalized_image, spatial_mask):
+        # Returns RPN and CPN outputs.
+        sfcn_output = self._sfcn(normalized_image, spatial_mask)
+        if self._fuse_networks:
+            return self._projection_networks(sfcn_output, spatial_mask)
+        if isinstance(sfcn_output, list):
+            (rpn_input, rpn_spatial_mask), (cpn_input, cpn_spatial_mask) = sfcn_output
+            return self._rpn(rpn_input, rpn_spatial_mask), self._cpn(cpn_input, cpn_spatial_mask)
+        return self._rpn(sfcn_output, spatial_mask), self._cpn(sfcn_output, spatial_mask)
+
+    def _call_tiled(self, normalized_image, spatial_mask):
+        """Returns RPN and CPN outputs, computed by tiles if batch exceeds tiling pixels budget.
+
+        Batch is split into tiles along its longer side, so that full resolution
+        activations exist for single tile only. Network, whose projections are
+        along the other side (RPN for tiles along height), is local along tiled
+        side and is computed by tiles. The other network computes projections
+        along the whole image, so only middle result of its first block
+        (which is pooled along tiled side) is computed by tiles and concatenated.
+        """
+        batch_size = tf.shape(normalized_image)[0]
+        height = tf.shape(normalized_image)[1]
+        width = tf.shape(normalized_image)[2]
+
+        def compute_tiled(axis, length, other_length):
+            tiled_direction = ProjectionDirection.Height if axis == 1 else ProjectionDirection.Width
+            other_direction = ProjectionDirection.Width if axis == 1 else ProjectionDirection.Height
+
+            def compute_tile(normalized_image, spatial_mask):
+                sfcn_output = self._sfcn(normalized_image, spatial_mask)
+                if self._fuse_networks:
+                    rpn_middle_result, cpn_middle_result = \
+                        self._projection_networks.compute_block1_middle_results(sfcn_output, spatial_mask)
+                    middle_results = {
+                        ProjectionDirection.Height: rpn_middle_result,
+                        ProjectionDirection.Width: cpn_middle_result
+                    }
+                    tiled_probs = self._projection_networks.call_on_block1_middle_result(
+                        tiled_direction, middle_results[tiled_direction], spatial_mask)
+                    other_middle_result = middle_results[other_direction]
+                else:
+                    tiled_network, other_network = (self._rpn, self._cpn) if axis == 1 else (self._cpn, self._rpn)
+                    tiled_probs = tiled_network(sfcn_output, spatial_mask)
+                    other_middle_result = other_network.compute_block1_middle_result(sfcn_output, spatial_mask)
+                # Predictions are reshaped to B x H x 1 x 1 or B x 1 x W x 1 to be tiled along axis.
+                new_axis = 3 - axis
+                return [tf.expand_dims(probs[:, :, tf.newaxis], new_axis) for probs in tiled_probs] + [other_middle_result]
+
+            tile_length = get_tile_length(
+                length, other_length, batch_size, self._tiling_pixels_budget, TILING_CONTEXT, 2)
+            results = map_tiles(
+                compute_tile, [normalized_image, spatial_mask], axis, tile_length, TILING_CONTEXT, [1, 1, 1, 2],
+                self.compute_dtype)
+            tiled_probs = tuple(tf.reshape(probs, (batch_size, length)) for probs in results[:3])
+            if self._fuse_networks:
+                other_probs = self._projection_networks.call_on_block1_middle_result(
+                    other_direction, results[3], spatial_mask)
+            else:
+                other_network = self._cpn if axis == 1 else self._rpn
+                other_probs = other_network.call_on_block1_middle_result(results[3], spatial_mask)
+            return (tiled_probs, other_probs) if axis == 1 else (other_probs, tiled_probs)
+
+        return tf.cond(
+            batch_size * height * width <= self._tiling_pixels_budget,
+            lambda: self._call_networks(normalized_image, spatial_mask),
+            lambda: tf.cond(
+                height >= width,
+                lambda: compute_tiled(1, height, width),
+                lambda: compute_tiled(2, width, height)))
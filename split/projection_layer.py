@@ -14,11 +14,27 @@ class ProjectionLayer(keras.layers.Layer):
         self._direction = direction
         self._broadcast_to_original_shape = broadcast_to_original_shape
 
-    def call(self, input):
+    def call(self, input, spatial_mask=None):
+        """Projects input on height or width.
+
+        If spatial_mask (B x H x W x 1 tensor of zeros and ones) is specified,
+        then only valid (non-padded) region of each example is averaged.
+        """
         num_of_dims = len(input.shape)
         assert num_of_dims == 4
         axis = 2 if self._direction == ProjectionDirection.Height else 1
-        result = tf.reduce_mean(input, axis=axis, keepdims=True)
+        # Means are accumulated in float32, if input has lower precision (see utils.precision).
+        float_input = tf.cast(input, tf.float32)
+        if spatial_mask is None:
+            result = tf.reduce_mean(float_input, axis=axis, keepdims=True)
+        else:
+            float_spatial_mask = tf.cast(spatial_mask, tf.float32)
+            sums = tf.reduce_sum(float_input * float_spatial_mask, axis=axis, keepdims=True)
+            counts = tf.reduce_sum(float_spatial_mask, axis=axis, keepdims=True)
+            result = sums / tf.maximum(counts, 1)
+        result = tf.cast(result, input.dtype)
         if self._broadcast_to_original_shape:
             result = tf.broadcast_to(result, tf.shape(input))
-        return result
\ No newline at end of file
+            if spatial_mask is not None:
+                result = result * spatial_mask
+        return result
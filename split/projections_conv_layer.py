@@ -0,0 +1,67 @@
+import tensorflow as tf
+import tensorflow.keras as keras
+
+from split.projection_layer import ProjectionDirection
+from utils.outer_product_conv import conv2d_of_outer_products
+
+
+class ProjectionsConvLayer(keras.layers.Layer):
+    """2D convolution with 'same' padding of ProjectionNetworkBlock output.
+
+    Input is either a tensor or [upper_projection, middle_result, lower_projection]
+    list, which stands for their concatenation with projections broadcast
+    along direction and zeroed in padded region. Projections (B x H x 1 x C
+    or B x 1 x W x C) aren't broadcast, their convolution is computed from
+    projections and valid region of each example (see conv2d_of_outer_products).
+    Kernel is the same as kernel of keras.layers.Conv2D applied to concatenation.
+    """
+    def __init__(self, direction, filters, kernel_size, activation=None, dilation_rate=1):
+        super().__init__()
+        self._direction = direction
+        self._filters = filters
+        self._kernel_size = kernel_size
+        self._activation = keras.activations.get(activation)
+        self._dilation_rate = dilation_rate
+
+    def build(self, input_shape):
+        if isinstance(input_shape, (list, tuple)):
+            input_channels = sum(shape[-1] for shape in input_shape)
+        else:
+            input_channels = input_shape[-1]
+        self.kernel = self.add_weight(
+            'kernel', shape=(self._kernel_size, self._kernel_size, input_channels, self._filters),
+            initializer='glorot_uniform')
+        self.bias = self.add_weight('bias', shape=(self._filters,), initializer='zeros')
+
+    def call(self, input, spatial_mask=None):
+        if not isinstance(input, (list, tuple)):
+            result = tf.nn.convolution(input, self.kernel, padding='SAME', dilations=self._dilation_rate)
+            return self._activation(tf.nn.bias_add(result, self.bias))
+
+        upper_projection, middle_result, lower_projection = input
+        upper_channels = upper_projection.shape[-1]
+        middle_channels = middle_result.shape[-1]
+        result = tf.nn.convolution(
+            middle_result, self.kernel[:, :, upper_channels:upper_channels + middle_channels],
+            padding='SAME', dilations=self._dilation_rate)
+
+        projections = tf.concat([upper_projection, lower_projection], axis=3)
+        projections_kernel = tf.concat([
+            self.kernel[:, :, :upper_channels],
+            self.kernel[:, :, upper_channels + middle_channels:]
+        ], axis=2)
+        if self._direction == ProjectionDirection.Height:
+            rows_values = projections[:, :, 0, :]
+            cols_values = self._get_valid_mask(middle_result, spatial_mask, 2)
+        else:
+            rows_values = self._get_valid_mask(middle_result, spatial_mask, 1)
+            cols_values = projections[:, 0, :, :]
+        result += conv2d_of_outer_products(
+            [(rows_values, cols_values, projections_kernel)], self._dilation_rate)
+        return self._activation(tf.nn.bias_add(result, self.bias))
+
+    def _get_valid_mask(self, input, spatial_mask, axis):
+        # Returns B x N x 1 mask of valid rows (axis=1) or cols (axis=2).
+        if spatial_mask is None:
+            return tf.ones((tf.shape(input)[0], tf.shape(input)[axis], 1), input.dtype)
+        return tf.cast(tf.reduce_max(spatial_mask, axis=3 - axis), input.dtype)
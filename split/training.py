@@ -1,14 +1,16 @@
-import tensorflow.keras as keras
+import tensorflow as tf
+
+from utils.losses import MaskedBinaryCrossentropy, TARGETS_PADDING_VALUE
 
 
 def get_losses_dict():
     return {
-        'horz_split_points_probs1': keras.losses.BinaryCrossentropy(from_logits=False),
-        'horz_split_points_probs2': keras.losses.BinaryCrossentropy(from_logits=False),
-        'horz_split_points_probs3': keras.losses.BinaryCrossentropy(from_logits=False),
-        'vert_split_points_probs1': keras.losses.BinaryCrossentropy(from_logits=False),
-        'vert_split_points_probs2': keras.losses.BinaryCrossentropy(from_logits=False),
-        'vert_split_points_probs3': keras.losses.BinaryCrossentropy(from_logits=False),
+        'horz_split_points_probs1': MaskedBinaryCrossentropy(),
+        'horz_split_points_probs2': MaskedBinaryCrossentropy(),
+        'horz_split_points_probs3': MaskedBinaryCrossentropy(),
+        'vert_split_points_probs1': MaskedBinaryCrossentropy(),
+        'vert_split_points_probs2': MaskedBinaryCrossentropy(),
+        'vert_split_points_probs3': MaskedBinaryCrossentropy(),
         'markup_table': None
     }
 
@@ -40,4 +42,53 @@ def convert_ds_element_to_tuple(element):
             'vert_split_points_binary': vert_split_points_mask,
             'markup_table': element['markup_table']   
         }
-    )
\ No newline at end of file
+    )
+
+def convert_ds_element_to_padded_tuple(element):
+    """Same as convert_ds_element_to_tuple, but prepares element for padded batching."""
+
+    image = element['image']
+    horz_split_points_mask = tf.cast(element['horz_split_points_mask'], tf.float32)
+    vert_split_points_mask = tf.cast(element['vert_split_points_mask'], tf.float32)
+    return (
+        {
+            'image': image,
+            'height': tf.shape(image)[0],
+            'width': tf.shape(image)[1]
+        },
+        {
+            'horz_split_points_probs1': horz_split_points_mask,
+            'horz_split_points_probs2': horz_split_points_mask,
+            'horz_split_points_probs3': horz_split_points_mask,
+            'horz_split_points_binary': horz_split_points_mask,
+            'vert_split_points_probs1': vert_split_points_mask,
+            'vert_split_points_probs2': vert_split_points_mask,
+            'vert_split_points_probs3': vert_split_points_mask,
+            'vert_split_points_binary': vert_split_points_mask,
+            'markup_table': element['markup_table']
+        }
+    )
+
+def get_padding_values():
+    """Returns padding values for elements created by convert_ds_element_to_padded_tuple."""
+
+    keys = [
+        'horz_split_points_probs1',
+        'horz_split_points_probs2',
+        'horz_split_points_probs3',
+        'horz_split_points_binary',
+        'vert_split_points_probs1',
+        'vert_split_points_probs2',
+        'vert_split_points_probs3',
+        'vert_split_points_binary'
+    ]
+    targets_padding_values = {key: TARGETS_PADDING_VALUE for key in keys}
+    targets_padding_values['markup_table'] = 0
+    return (
+        {
+            'image': tf.constant(0, tf.uint8),
+            'height': 0,
+            'width': 0
+        },
+        targets_padding_values
+    )
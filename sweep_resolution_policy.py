@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import split.evaluation
+from evaluate_model import load_dataset
+from utils.resolution import ResolutionPolicy
+
+
+def evaluate_policy(model_file_path, ds, resolution_policy):
+    """Returns adjacency F-measure of SPLIT model and mean inference time per batch in ms."""
+    model = split.evaluation.load_model(model_file_path, True, resolution_policy=resolution_policy)
+    batches_count = 0
+    inference_time = 0
+    metric_results = {}
+    for inputs, targets in ds:
+        start_time = time.perf_counter()
+        prediction = model(inputs)
+        inference_time += time.perf_counter() - start_time
+        metric_results = model.compute_metrics(inputs, targets, prediction, None)
+        batches_count += 1
+    f_measure = float(metric_results.get('adjacency_f_measure', 0))
+    return f_measure, 1000 * inference_time / max(batches_count, 1)
+
+def main(args):
+    ds = load_dataset(
+        split.evaluation, 'SPLIT', args.dataset_name, args.split, args.batch_size, args.bucket_size)
+    if args.max_pixels:
+        policies = [('max_pixels', limit, ResolutionPolicy(max_pixels=limit)) for limit in args.max_pixels]
+    else:
+        policies = [('max_side', limit, ResolutionPolicy(max_side=limit)) for limit in args.max_sides]
+    policies.insert(0, ('native', '-', ResolutionPolicy()))
+
+    print('|Policy|Limit|Adj. F-score|Time per batch, ms|')
+    print('|-|-|-|-|')
+    for name, limit, resolution_policy in policies:
+        f_measure, batch_time = evaluate_policy(args.model_file_path, ds, resolution_policy)
+        print(f'|{name}|{limit}|{f_measure:.4f}|{batch_time:.1f}|', flush=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Evaluates accuracy and latency of SPLIT model for several inference resolution limits.")
+    parser.add_argument('model_file_path', help='Path to trained SPLIT model file.')
+    parser.add_argument('dataset_name', help='Name of the dataset to evaluate on.',
+        choices=['icdar', 'fin_tab_net'])
+    parser.add_argument('--split', default='test', choices=['train', 'test'],
+        help='Name of the dataset split to evaluate.')
+    parser.add_argument('--max_sides', default=[640, 512, 448, 384, 320, 256], type=int, nargs='+',
+        help='Limits of longer image side to evaluate.')
+    parser.add_argument('--max_pixels', type=int, nargs='+',
+        help='Limits of image area to evaluate instead of --max_sides.')
+    parser.add_argument('--batch_size', default=1, type=int,
+        help='Number of tables in batch. Tables of similar size are padded and batched together.')
+    parser.add_argument('--bucket_size', default=64, type=int,
+        help='Max padding (in pixels) of table image in each dimension, when batch_size > 1.')
+
+    main(parser.parse_args())
@@ -18,6 +18,12 @@ class GridStructure(object):
     def get_cols_count(self):
         return len(self._v_positions) - 1    
 
+    def get_h_positions(self):
+        return self._h_positions
+
+    def get_v_positions(self):
+        return self._v_positions
+
     def get_cell_rect(self, cell):
         """Convert cell rect from grid coordinates to real coordinates."""
         assert 0 <= cell.top and cell.bottom <= self.get_rows_count()
@@ -7,6 +7,12 @@ from utils.interval import Interval
 from utils.rect import Rect
 
 
+# Table is encoded as N+1 x MARKUP_TABLE_ROW_SIZE int32 tensor, where N is
+# the number of cells. First row is table id, table rect and N. Each of
+# other rows is text rect and grid rect of a cell.
+MARKUP_TABLE_ROW_SIZE = 8
+
+
 class Cell(object):
   def __init__(self, text_rect, grid_rect):
     self.text_rect = text_rect
@@ -33,13 +39,30 @@ class Table(object):
     )
 
   def to_tensor(self):
-    bytes = pickle.dumps(self)
-    return tf.constant(bytes)
+    """Returns int32 tensor of columnar encoding of the table (see MARKUP_TABLE_ROW_SIZE)."""
+    return tf.constant(self._to_array())
 
   @staticmethod
   def from_tensor(tensor):
-    bytes = tensor.numpy()
-    return pickle.loads(bytes)
+    """Returns table encoded by to_tensor.
+
+    Tensor may be padded with arbitrary rows.
+    """
+    array = np.asarray(tensor)
+    id, left, top, right, bottom, cells_count = array[0, :6].tolist()
+    cells = [
+      Cell(Rect(*row[:4]), Rect(*row[4:]))
+      for row in array[1:cells_count + 1].tolist()
+    ]
+    return Table(id, Rect(left, top, right, bottom), cells)
+
+  def _to_array(self):
+    result = np.zeros(shape=(len(self.cells) + 1, MARKUP_TABLE_ROW_SIZE), dtype=np.int32)
+    result[0, :6] = [self.id, *self.rect.as_tuple(), len(self.cells)]
+    for row, cell in zip(result[1:], self.cells):
+      row[:4] = cell.text_rect.as_tuple()
+      row[4:] = cell.grid_rect.as_tuple()
+    return result
 
   def create_horz_split_points_mask(self):
     height = self.rect.bottom - self.rect.top
@@ -199,4 +222,22 @@ class Table(object):
     right = table_rect.right if is_adjacent_to_right_border else self._get_vert_split_point_interval(grid_rect.right).end
     bottom = table_rect.bottom if is_adjacent_to_bottom_border else self._get_horz_split_point_interval(grid_rect.bottom).end
 
-    return Rect(left, top, right, bottom)
\ No newline at end of file
+    return Rect(left, top, right, bottom)
+
+
+def convert_pickled_markup_tables(ds):
+  """Returns dataset with columnar encoding of 'markup_table' feature.
+
+  Datasets built before columnar encoding store pickled tables, which are
+  converted (in Python). Other datasets are returned as is.
+  """
+  if ds.element_spec['markup_table'].dtype != tf.string:
+    return ds
+
+  def convert_element(element):
+    markup_table = tf.numpy_function(
+      lambda bytes: pickle.loads(bytes)._to_array(), [element['markup_table']], tf.int32)
+    markup_table.set_shape((None, MARKUP_TABLE_ROW_SIZE))
+    return dict(element, markup_table=markup_table)
+
+  return ds.map(convert_element)
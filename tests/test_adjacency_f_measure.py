@@ -1,11 +1,14 @@
 from unittest import TestCase, main
 import time
+import numpy as np
 import tensorflow as tf
 
 import context
 from metrics.adjacency_f_measure import AdjacencyFMeasure
 from table.markup_table import Cell, Table
-from table.grid_structure import GridStructure
+from table.grid_structure import GridStructure, GridStructureBuilder
+from utils import tf_ops
+from utils.ops import CUSTOM_IMPLEMENTATION, TF_IMPLEMENTATION
 from utils.rect import Rect
 
 class AdjacencyFMeasureTestCase(TestCase):
@@ -99,5 +102,135 @@ class AdjacencyFMeasureTestCase(TestCase):
 
         self.assertEqual(metric.result(), 1)
 
+    def test_update_state(self):
+        rng = np.random.RandomState(42)
+        for ops_implementation in [CUSTOM_IMPLEMENTATION, TF_IMPLEMENTATION]:
+            for merge_prob in [0, 0.3]:
+                markup_tables, h_binary, v_binary, cells_grid_rects = self._create_random_batch(rng, merge_prob)
+                expected_metric = AdjacencyFMeasure()
+                for i, markup_table in enumerate(markup_tables):
+                    grid = GridStructureBuilder(
+                        markup_table.rect,
+                        h_binary[i][:markup_table.rect.get_height()],
+                        v_binary[i][:markup_table.rect.get_width()]).build()
+                    if merge_prob == 0:
+                        cells = [
+                            Rect(col, row, col + 1, row + 1)
+                            for row in range(grid.get_rows_count()) for col in range(grid.get_cols_count())
+                        ]
+                    else:
+                        cells = [Rect(*rect) for rect in cells_grid_rects[i].numpy().tolist()]
+                    expected_metric.update_state_eager(markup_table, grid, cells)
+
+                metric = AdjacencyFMeasure(ops_implementation)
+                markup_tensors = tf.ragged.stack([markup_table.to_tensor() for markup_table in markup_tables])
+                metric.update_state(
+                    markup_tensors.to_tensor(), h_binary, v_binary,
+                    cells_grid_rects if merge_prob > 0 else None)
+
+                self.assertEqual(
+                    [weight.numpy() for weight in expected_metric.weights],
+                    [weight.numpy() for weight in metric.weights])
+                self.assertEqual(expected_metric.result(), metric.result())
+
+    def test_update_state_degenerate_rects(self):
+        # Empty text rect lies on border of detected cells, first detected row is empty.
+        markup_table = Table(0, Rect(0, 0, 8, 6), [
+            Cell(Rect(1, 1, 3, 2), Rect(0, 0, 1, 1)),
+            Cell(Rect(4, 1, 6, 2), Rect(1, 0, 2, 1)),
+            Cell(Rect(1, 3, 3, 3), Rect(0, 1, 1, 2)),
+            Cell(Rect(5, 4, 7, 5), Rect(1, 1, 2, 2))
+        ])
+        h_binary = [1, 0, 1, 1, 1, 0]
+        v_binary = [0, 0, 0, 1, 1, 0, 0, 0]
+        expected_metric = AdjacencyFMeasure()
+        grid = GridStructureBuilder(markup_table.rect, h_binary, v_binary).build()
+        cells = [
+            Rect(col, row, col + 1, row + 1)
+            for row in range(grid.get_rows_count()) for col in range(grid.get_cols_count())
+        ]
+        expected_metric.update_state_eager(markup_table, grid, cells)
+
+        for ops_implementation in [CUSTOM_IMPLEMENTATION, TF_IMPLEMENTATION]:
+            metric = AdjacencyFMeasure(ops_implementation)
+            metric.update_state(markup_table.to_tensor()[tf.newaxis], [h_binary], [v_binary])
+            self.assertEqual(
+                [weight.numpy() for weight in expected_metric.weights],
+                [weight.numpy() for weight in metric.weights])
+
+    def test_update_state_in_graph(self):
+        markup_table = Table(0, Rect(0, 0, 5, 7), [
+            Cell(Rect(1, 1, 3, 2), Rect(0, 0, 1, 1)),
+            Cell(Rect(4, 3, 5, 4), Rect(0, 1, 1, 2)),
+            Cell(Rect(4, 5, 5, 6), Rect(0, 2, 1, 3))
+        ])
+        metric = AdjacencyFMeasure()
+
+        @tf.function
+        def update_state(markup_tables, h_binary, v_binary):
+            metric.update_state(markup_tables, h_binary, v_binary)
+
+        update_state(
+            markup_table.to_tensor()[tf.newaxis],
+            tf.constant([[0, 0, 1, 0, 1, 0, 0]]), tf.constant([[0, 0, 0, 0, 1]]))
+
+        # Same as test_split_column.
+        self.assertEqual(metric.result(), 2/3)
+
+    def _create_random_batch(self, rng, merge_prob):
+        # Returns markup tables with random grids of cells and texts, padded random
+        # split points masks of detected grids and ragged grid rects of detected cells.
+        batch_size = 4
+        markup_tables = []
+        markup_positions = []
+        for i in range(batch_size):
+            rows_count = rng.randint(1, 6)
+            cols_count = rng.randint(2, 6)
+            # Markup table has at least two cells, so it has adjacency relations.
+            grid_rects = []
+            while len(grid_rects) < 2:
+                merge_right_mask = rng.uniform(size=(1, rows_count, cols_count - 1)) < 0.2
+                merge_down_mask = rng.uniform(size=(1, rows_count - 1, cols_count)) < 0.2
+                grid_rects, _ = tf_ops.batch_infer_cells_grid_rects(
+                    merge_right_mask, merge_down_mask, tf.constant([rows_count]), tf.constant([cols_count]))
+            h_positions = np.cumsum([0] + rng.randint(1, 8, size=rows_count).tolist())
+            v_positions = np.cumsum([0] + rng.randint(1, 8, size=cols_count).tolist())
+            table_rect = Rect(3, 5, 3 + v_positions[-1], 5 + h_positions[-1])
+            cells = []
+            for left, top, right, bottom in grid_rects.numpy().tolist():
+                # Texts may exceed their cells.
+                margin = int(rng.uniform() < 0.1)
+                text_left, text_right = sorted(rng.choice(
+                    np.arange(v_positions[left] - margin, v_positions[right] + 1), size=2, replace=False))
+                text_top, text_bottom = sorted(rng.choice(
+                    np.arange(h_positions[top] - margin, h_positions[bottom] + 1), size=2, replace=False))
+                cells.append(Cell(
+                    Rect(table_rect.left + text_left, table_rect.top + text_top,
+                         table_rect.left + text_right, table_rect.top + text_bottom),
+                    Rect(left, top, right, bottom)))
+            markup_tables.append(Table(i, table_rect, cells))
+            markup_positions.append((h_positions, v_positions))
+
+        # Detected split points are markup ones with random errors.
+        max_height = max(markup_table.rect.get_height() for markup_table in markup_tables) + 2
+        max_width = max(markup_table.rect.get_width() for markup_table in markup_tables) + 2
+        h_binary = (rng.uniform(size=(batch_size, max_height)) < 0.03).astype(np.int32)
+        v_binary = (rng.uniform(size=(batch_size, max_width)) < 0.03).astype(np.int32)
+        for i, (h_positions, v_positions) in enumerate(markup_positions):
+            h_binary[i, h_positions[1:-1]] = 1
+            v_binary[i, v_positions[1:-1]] = 1
+        h_positions, h_row_splits = tf_ops.batch_intervals_centers(
+            h_binary, [markup_table.rect.get_height() for markup_table in markup_tables])
+        v_positions, v_row_splits = tf_ops.batch_intervals_centers(
+            v_binary, [markup_table.rect.get_width() for markup_table in markup_tables])
+        rows_counts = tf.cast(h_row_splits[1:] - h_row_splits[:-1], tf.int32) + 1
+        cols_counts = tf.cast(v_row_splits[1:] - v_row_splits[:-1], tf.int32) + 1
+        rects, row_splits = tf_ops.batch_infer_cells_grid_rects(
+            rng.uniform(size=(batch_size, max_height + 1, max_width)) < merge_prob,
+            rng.uniform(size=(batch_size, max_height, max_width + 1)) < merge_prob,
+            rows_counts, cols_counts)
+        cells_grid_rects = tf.RaggedTensor.from_row_splits(rects, row_splits)
+        return markup_tables, tf.constant(h_binary), tf.constant(v_binary), cells_grid_rects
+
 if __name__ == '__main__':
     main(module='test_adjacency_f_measure')
\ No newline at end of file
@@ -33,6 +33,13 @@ class BinarizeLayerTestCase(TestCase):
         expected_output = tf.cast(input >= 0.5, output.dtype)
         self.assertTrue(tf.reduce_all(expected_output == output))
 
+    def test_padded_batch(self):
+        input = tf.constant([[0.9, 0.1, 0.1, 0.9], [0.9, 0.1, 0.9, 0.9]])
+        lengths = tf.constant([4, 3])
+        expected_output = tf.constant([[1, 0, 0, 1], [1, 1, 1, 0]])
+        output = BinarizeLayer(0.75)(input, lengths)
+        self.assertTrue(tf.reduce_all(expected_output == output))
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+from unittest import TestCase, main
+
+import tensorflow as tf
+import numpy as np
+
+ops_module = tf.load_op_library('ops/ops.so')
+
+
+class GcBinarizeOpTestCase(TestCase):
+    def test_simple(self):
+        input = tf.constant([0.9, 0.2, 0.9, 0.1, 0.1, 0.9])
+        expected_output = tf.constant([1, 1, 1, 0, 0, 1])
+        output = ops_module.gc_binarize(input, 0.75)
+        self.assertTrue(tf.reduce_all(expected_output == output))
+
+    def test_same_as_max_flow(self):
+        rng = np.random.RandomState(42)
+        for length in [1, 2, 3, 10, 100, 500]:
+            for gc_lambda in [0, 0.1, 0.25, 0.5, 0.75, 1.5]:
+                # Coarse probabilities produce many min cuts with equal cost.
+                for probs in [rng.uniform(size=length), rng.randint(0, 9, size=length) / 8]:
+                    probs = tf.constant(probs, dtype='float32')
+                    expected_output = ops_module.gc_binarize(probs, gc_lambda, solver='max_flow')
+                    output = ops_module.gc_binarize(probs, gc_lambda)
+                    self.assertTrue(tf.reduce_all(expected_output == output))
+
+    def test_tall_input(self):
+        probs = tf.random.uniform(shape=(100000,), minval=0, maxval=1, seed=42)
+        output = ops_module.gc_binarize(probs, 0)
+        expected_output = tf.cast(probs >= 0.5, output.dtype)
+        self.assertTrue(tf.reduce_all(expected_output == output))
+
+    def test_batch(self):
+        rng = np.random.RandomState(42)
+        probs = tf.constant(rng.uniform(size=(8, 50)), dtype='float32')
+        lengths = tf.constant([50, 0, 1, 17, 49, 50, 3, 25])
+        output = ops_module.batch_gc_binarize(probs, lengths, 0.5)
+        for i in range(8):
+            length = lengths[i]
+            expected_output = ops_module.gc_binarize(probs[i, :length], 0.5)
+            self.assertTrue(tf.reduce_all(expected_output == output[i, :length]))
+            self.assertTrue(tf.reduce_all(output[i, length:] == 0))
+
+
+if __name__ == '__main__':
+    main()
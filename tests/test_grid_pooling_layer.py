@@ -1,9 +1,10 @@
 from unittest import TestCase, main
 
 import tensorflow as tf
+import numpy as np
 
 import context
-from merge.grid_pooling_layer import GridPoolingLayer
+from merge.grid_pooling_layer import GridPoolingLayer, GridGeometry
 
 
 class GridPoolingLayerTestCase(TestCase):
@@ -38,9 +39,63 @@ class GridPoolingLayerTestCase(TestCase):
         output = self.run_in_graph_mode(layer, self.input, self.h_positions, self.v_positions)
         self.assertTrue(tf.reduce_all(expected_output == output))
 
+    def test_pool_padded_batch(self):
+        # Second example is the top-left 3x4 part of the first one with single split point.
+        input = tf.concat([self.input, self.input], axis=0)
+        h_positions = tf.ragged.constant([[1, 3], [2]])
+        v_positions = tf.ragged.constant([[2, 4], []])
+        spatial_mask = tf.constant([
+            [[[1]] * 5] * 4,
+            [[[1]] * 4 + [[0]]] * 3 + [[[0]] * 5]
+        ], dtype='float32')
+        expected_output = tf.constant([
+            [
+                [[1, 2], [5, 6], [8, 9]],
+                [[16, 17], [20, 21], [23, 24]],
+                [[31, 32], [35, 36], [38, 39]]
+            ],
+            [
+                [[8, 9], [0, 0], [0, 0]],
+                [[23, 24], [0, 0], [0, 0]],
+                [[0, 0], [0, 0], [0, 0]]
+            ]
+        ], dtype = 'float32')
+        layer = GridPoolingLayer(False)
+        grid = GridGeometry(h_positions, v_positions, 4, 5, [4, 3], [5, 4])
+        output = layer(input, grid, spatial_mask)
+        self.assertTrue(tf.reduce_all(expected_output == output))
+
+    def test_pool_keep_size_random_batch(self):
+        rng = np.random.RandomState(42)
+        input = rng.uniform(size=(3, 20, 30, 4)).astype('float32')
+        heights = [20, 13, 7]
+        widths = [30, 30, 11]
+        h_positions = [[3, 4, 15], [12], []]
+        v_positions = [[1, 10, 29], [0, 5], [2, 5, 6]]
+        spatial_mask = np.zeros((3, 20, 30, 1), dtype='float32')
+        for i in range(3):
+            spatial_mask[i, :heights[i], :widths[i]] = 1
+
+        layer = GridPoolingLayer(True)
+        grid = GridGeometry(
+            tf.ragged.constant(h_positions), tf.ragged.constant(v_positions), 20, 30, heights, widths)
+        output = layer(tf.constant(input), grid, tf.constant(spatial_mask))
+
+        expected_output = np.zeros_like(input)
+        for i in range(3):
+            rows = [0] + h_positions[i] + [heights[i]]
+            cols = [0] + v_positions[i] + [widths[i]]
+            for top, bottom in zip(rows[:-1], rows[1:]):
+                for left, right in zip(cols[:-1], cols[1:]):
+                    if top < bottom and left < right:
+                        cell = input[i, top:bottom, left:right]
+                        expected_output[i, top:bottom, left:right] = cell.mean(axis=(0, 1))
+        self.assertTrue(np.allclose(expected_output, output, atol=1e-6))
+
     @tf.function
     def run_in_graph_mode(self, layer, input, h_positions, v_positions):
-        return layer(input, h_positions, v_positions)
+        grid = GridGeometry(h_positions, v_positions, tf.shape(input)[1], tf.shape(input)[2])
+        return layer(input, grid)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,9 +1,14 @@
 """ICDAR dataset."""
 
+import pickle
+from unittest import mock
+
+import tensorflow as tf
 import tensorflow_datasets as tfds
 
 import context
 from datasets.ICDAR.ICDAR import IcdarSplit
+from table.markup_table import Table, MARKUP_TABLE_ROW_SIZE, convert_pickled_markup_tables
 
 
 class IcdarSplitTest(tfds.testing.DatasetBuilderTestCase):
@@ -15,5 +20,28 @@ class IcdarSplitTest(tfds.testing.DatasetBuilderTestCase):
   SKIP_CHECKSUMS = True
 
 
+class IcdarSplitPickledMarkupTableTest(IcdarSplitTest):
+  """Tests for version with pickled markup tables, which are converted on load."""
+  VERSION = '1.0.1'
+  # Markup tables are encoded in eager mode.
+  SKIP_TF1_GRAPH_MODE = True
+
+  def _download_and_prepare_as_dataset(self, builder):
+    # Only current version can be generated, so dataset of earlier version
+    # is generated by builder created as by code before columnar encoding.
+    with mock.patch.object(self.DATASET_CLASS, 'VERSION', tfds.core.Version(self.VERSION)), \
+        mock.patch.object(Table, 'to_tensor', lambda table: tf.constant(pickle.dumps(table))):
+      super()._download_and_prepare_as_dataset(self._make_builder(config=builder.builder_config))
+
+    ds = self._make_builder().as_dataset(split='train')
+    converted_ds = convert_pickled_markup_tables(ds)
+    self.assertEqual(ds.element_spec['markup_table'], tf.TensorSpec((), tf.string))
+    self.assertEqual(
+      converted_ds.element_spec['markup_table'], tf.TensorSpec((None, MARKUP_TABLE_ROW_SIZE), tf.int32))
+    for element, converted_element in zip(ds, converted_ds):
+      self.assertEqual(
+        pickle.loads(element['markup_table'].numpy()), Table.from_tensor(converted_element['markup_table']))
+
+
 if __name__ == '__main__':
   tfds.testing.test_main()
@@ -28,6 +28,31 @@ class TestCellsStructure(TestCase):
         cells = ops_module.infer_cells_grid_rects(merge_right_mask, merge_down_mask)
         self.assertTrue(tf.reduce_all(expected_cells == cells))
 
+    def test_batch(self):
+        merge_right_mask = tf.constant([
+            [[True, True, False, False],
+             [True, False, True, False],
+             [False, False, False, False]],
+            [[True, True, True, True],
+             [True, True, True, True],
+             [True, True, True, True]]
+        ])
+        merge_down_mask = tf.constant([
+            [[True, True, False, False, False],
+             [False, False, False, False, False]],
+            [[False, True, True, True, True],
+             [True, True, True, True, True]]
+        ])
+        rows_counts = tf.constant([3, 2])
+        cols_counts = tf.constant([5, 1])
+        rects, row_splits = ops_module.batch_infer_cells_grid_rects(
+            merge_right_mask, merge_down_mask, rows_counts, cols_counts)
+
+        self.assertEqual([0, 8, 10], row_splits.numpy().tolist())
+        expected_cells = ops_module.infer_cells_grid_rects(merge_right_mask[0], merge_down_mask[0])
+        self.assertTrue(tf.reduce_all(expected_cells == rects[:8]))
+        self.assertEqual([[0, 0, 1, 1], [0, 1, 1, 2]], rects[8:].numpy().tolist())
+
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
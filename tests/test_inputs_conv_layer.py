@@ -0,0 +1,43 @@
+from unittest import TestCase, main
+
+import tensorflow as tf
+import numpy as np
+
+import context
+from merge.concat_inputs_layer import ConcatInputsLayer
+from merge.inputs_conv_layer import InputsConvLayer
+from utils.batching import create_spatial_mask
+
+
+class InputsConvLayerTestCase(TestCase):
+    def test_padded_batch(self):
+        tf.random.set_seed(42)
+        heights = [10, 7]
+        widths = [8, 12]
+        spatial_mask = create_spatial_mask(heights, widths, 10, 12)
+        inputs = [
+            tf.random.uniform(shape=(2, 10, 12, 3)),
+            tf.random.uniform(shape=(2, 10)),
+            tf.random.uniform(shape=(2, 12)),
+            tf.random.uniform(shape=(2, 10), maxval=2, dtype=tf.int32),
+            tf.random.uniform(shape=(2, 12), maxval=2, dtype=tf.int32),
+            tf.ragged.constant([[0, 4, 9], [3]]),
+            tf.ragged.constant([[2, 7], [0, 5, 6, 11]])
+        ]
+
+        layer = InputsConvLayer(5, 3, activation='relu')
+        with tf.GradientTape(persistent=True) as tape:
+            tape.watch(inputs[0])
+            output = layer(*inputs, spatial_mask)
+
+            concatenated_inputs = ConcatInputsLayer()(*inputs, spatial_mask)
+            expected_output = tf.nn.relu(tf.nn.bias_add(
+                tf.nn.conv2d(concatenated_inputs, layer.kernel, 1, 'SAME'), layer.bias))
+        self.assertTrue(np.allclose(output, expected_output, atol=1e-5))
+        for expected_gradient, gradient in zip(
+                tape.gradient(expected_output, [inputs[0], layer.kernel, layer.bias]),
+                tape.gradient(output, [inputs[0], layer.kernel, layer.bias])):
+            self.assertTrue(np.allclose(gradient, expected_gradient, atol=1e-4))
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,16 @@ class IntervalsCentersOpTestCase(TestCase):
         output = ops_module.intervals_centers(input)
 
         self.assertTrue(tf.reduce_all(expected_output == output))
+    def testBatch(self):
+        input = tf.constant([
+            [0, 0, 1, 1, 1, 0, 1, 1],
+            [1, 1, 0, 1, 0, 0, 0, 0],
+            [1, 1, 1, 1, 1, 1, 1, 1]
+        ])
+        lengths = tf.constant([8, 4, 0])
+        centers, row_splits = ops_module.batch_intervals_centers(input, lengths)
+        self.assertEqual([3, 7, 1, 3], centers.numpy().tolist())
+        self.assertEqual([0, 2, 4, 4], row_splits.numpy().tolist())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
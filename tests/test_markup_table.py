@@ -1,10 +1,12 @@
 from unittest import TestCase, main
+import pickle
 
 import numpy as np
+import tensorflow as tf
 
 import context
 from utils.rect import Rect
-from table.markup_table import Cell, Table
+from table.markup_table import Cell, Table, convert_pickled_markup_tables
 from table.grid_structure import GridStructure
 
 
@@ -38,9 +40,21 @@ class TableTest(TestCase):
 
     def test_tensor_conversion(self):
         tensor = self._table.to_tensor()
+        self.assertEqual(tensor.dtype, tf.int32)
+        self.assertEqual(tensor.shape, (18, 8))
         reconstructed_table = Table.from_tensor(tensor)
         self.assertEqual(self._table, reconstructed_table)
 
+        padded_tensor = tf.pad(tensor, [[0, 3], [0, 0]])
+        self.assertEqual(self._table, Table.from_tensor(padded_tensor))
+
+    def test_pickled_tables_conversion(self):
+        ds = tf.data.Dataset.from_tensors({'markup_table': tf.constant(pickle.dumps(self._table))})
+        ds = convert_pickled_markup_tables(ds)
+        self.assertEqual(ds.element_spec['markup_table'], tf.TensorSpec((None, 8), tf.int32))
+        self.assertEqual(self._table, Table.from_tensor(next(iter(ds))['markup_table']))
+        self.assertIs(convert_pickled_markup_tables(ds), ds)
+
     def test_horz_split_points_mask(self):
         mask = self._table.create_horz_split_points_mask()
         expected_mask = np.array(
@@ -1,10 +1,17 @@
 from unittest import TestCase, main
+import os
+import subprocess
+import sys
+import tempfile
 
 import tensorflow as tf
 import numpy as np
 
 import context
 from merge.model import Model
+from merge.grid_pooling_layer import GridGeometry
+from merge.evaluation import load_weights
+from utils.precision import BFLOAT16_PRECISION, precision_policy
 
 
 class ModelTestCase(TestCase):
@@ -15,20 +22,9 @@ class ModelTestCase(TestCase):
         tf.random.set_seed(42)
 
         batch_size = 1
-        height = 200
-        width = 1000
         rows_count = 16
         cols_count = 32
-        h_mask = self._get_binary_vector_with_evenly_spaced_ones(height, rows_count-1)
-        v_mask = self._get_binary_vector_with_evenly_spaced_ones(width, cols_count-1)
-
-        inputs = {
-            'image': tf.random.uniform(shape=(batch_size, height, width, 3), minval=0, maxval=256, dtype='int32'),
-            'horz_split_points_probs': tf.random.uniform(shape=(batch_size, height), dtype='float32'),
-            'vert_split_points_probs': tf.random.uniform(shape=(batch_size, width), dtype='float32'),
-            'horz_split_points_binary': tf.reshape(h_mask, shape=(batch_size, height)),
-            'vert_split_points_binary': tf.reshape(v_mask, shape=(batch_size, width))
-        }
+        inputs = self._create_inputs(batch_size, 200, 1000, rows_count, cols_count)
 
         model = Model()
         outputs = model(inputs)
@@ -45,6 +41,202 @@ class ModelTestCase(TestCase):
         self.assertEqual(
             outputs['merge_right_probs2'].shape, expected_merge_right_shape)
 
+    def test_padded_batch(self):
+        tf.random.set_seed(42)
+
+        table_sizes = [(40, 60, 3, 4), (52, 45, 5, 2)]
+        model = Model()
+
+        examples = []
+        for height, width, rows_count, cols_count in table_sizes:
+            examples.append(self._create_inputs(1, height, width, rows_count, cols_count))
+        expected_outputs = [model(inputs) for inputs in examples]
+
+        max_height = max(size[0] for size in table_sizes)
+        max_width = max(size[1] for size in table_sizes)
+        def pad(tensor, height, width):
+            paddings = [[0, 0], [0, max_height - height], [0, max_width - width], [0, 0]]
+            return tf.pad(tensor, paddings[:len(tensor.shape)])
+        def pad_vert(tensor, width):
+            return tf.pad(tensor, [[0, 0], [0, max_width - width]])
+        inputs = {
+            'image': tf.concat([
+                pad(e['image'], s[0], s[1]) for e, s in zip(examples, table_sizes)], axis=0),
+            'horz_split_points_probs': tf.concat([
+                pad(e['horz_split_points_probs'], s[0], s[1]) for e, s in zip(examples, table_sizes)], axis=0),
+            'vert_split_points_probs': tf.concat([
+                pad_vert(e['vert_split_points_probs'], s[1]) for e, s in zip(examples, table_sizes)], axis=0),
+            'horz_split_points_binary': tf.concat([
+                pad(e['horz_split_points_binary'], s[0], s[1]) for e, s in zip(examples, table_sizes)], axis=0),
+            'vert_split_points_binary': tf.concat([
+                pad_vert(e['vert_split_points_binary'], s[1]) for e, s in zip(examples, table_sizes)], axis=0),
+            'height': tf.constant([size[0] for size in table_sizes]),
+            'width': tf.constant([size[1] for size in table_sizes])
+        }
+        outputs = model(inputs)
+
+        for i, (_, _, rows_count, cols_count) in enumerate(table_sizes):
+            expected = expected_outputs[i]
+            for key in ['merge_down_probs1', 'merge_down_probs2']:
+                self.assertTrue(np.allclose(
+                    outputs[key][i, :rows_count-1, :cols_count], expected[key][0], atol=1e-5))
+            for key in ['merge_right_probs1', 'merge_right_probs2']:
+                self.assertTrue(np.allclose(
+                    outputs[key][i, :rows_count, :cols_count-1], expected[key][0], atol=1e-5))
+            for key in ['h_positions', 'v_positions', 'cells_grid_rects']:
+                self.assertTrue(np.array_equal(outputs[key][i], expected[key][0]))
+
+    def test_tf_ops(self):
+        tf.random.set_seed(42)
+
+        inputs = self._create_inputs(1, 60, 80, 5, 7)
+        model = Model()
+        expected_outputs = model(inputs)
+        tf_ops_model = Model(ops_implementation='tf')
+        tf_ops_model(inputs)
+        tf_ops_model.set_weights(model.get_weights())
+        outputs = tf_ops_model(inputs)
+
+        for key in ['merge_down_probs2', 'merge_right_probs2']:
+            self.assertTrue(np.array_equal(outputs[key], expected_outputs[key]))
+        for key in ['h_positions', 'v_positions', 'cells_grid_rects']:
+            self.assertTrue(np.array_equal(outputs[key][0], expected_outputs[key][0]))
+
+    def test_jit_compile_with_tf_ops(self):
+        tf.random.set_seed(42)
+
+        inputs = self._create_inputs(1, 60, 80, 5, 7)
+        model = Model(ops_implementation='tf')
+        outputs = model(inputs)
+
+        # Grid size depends on split points computed in the same graph,
+        # so the whole model isn't compiled.
+        with self.assertRaises(tf.errors.InvalidArgumentError):
+            tf.function(model, jit_compile=True)(inputs)
+
+        # Its parts are compiled, when grid positions are arguments.
+        height, width = inputs['image'].shape[1:3]
+        h_positions = outputs['h_positions']
+        v_positions = outputs['v_positions']
+        sfcn_inputs = [
+            tf.cast(inputs['image'], tf.float32) / 255,
+            inputs['horz_split_points_probs'], inputs['vert_split_points_probs'],
+            inputs['horz_split_points_binary'], inputs['vert_split_points_binary'],
+            h_positions, v_positions
+        ]
+        sfcn_output = model._sfcn(sfcn_inputs)
+        compiled_sfcn_output = tf.function(lambda *args: model._sfcn(list(args)), jit_compile=True)(*sfcn_inputs)
+        self.assertTrue(np.allclose(compiled_sfcn_output, sfcn_output, atol=1e-5))
+
+        def run_branch(input, h_positions, v_positions):
+            return model._up_branch(input, GridGeometry(h_positions, v_positions, height, width))
+        expected_probs = run_branch(sfcn_output, h_positions, v_positions)
+        probs = tf.function(run_branch, jit_compile=True)(sfcn_output, h_positions, v_positions)
+        for expected_prob, prob in zip(expected_probs, probs):
+            self.assertTrue(np.allclose(prob, expected_prob, atol=1e-5))
+
+    def test_fused_branches(self):
+        tf.random.set_seed(42)
+
+        inputs = self._create_inputs(1, 60, 80, 5, 7)
+        model = Model()
+        expected_outputs = model(inputs)
+        fused_model = Model(fuse_branches=True)
+        fused_model(inputs)
+        with tempfile.TemporaryDirectory() as dir_path:
+            # Checkpoint of unfused model is mapped to fused one.
+            model_file_path = os.path.join(dir_path, 'model.h5')
+            model.save_weights(model_file_path, save_format='h5')
+            load_weights(fused_model, model_file_path)
+            outputs = fused_model(inputs)
+            # Checkpoint of fused model is loaded as is.
+            fused_model_file_path = os.path.join(dir_path, 'fused_model.h5')
+            fused_model.save_weights(fused_model_file_path, save_format='h5')
+            other_fused_model = Model(fuse_branches=True)
+            other_fused_model(inputs)
+            load_weights(other_fused_model, fused_model_file_path)
+            other_outputs = other_fused_model(inputs)
+            # Checkpoint of fused model isn't loaded into unfused one.
+            with self.assertRaises(ValueError):
+                load_weights(model, fused_model_file_path)
+        # Neither is checkpoint of other model.
+        with self.assertRaises(ValueError):
+            load_weights(fused_model, 'checkpoints/split_icdar.ckpt')
+
+        for key in ['merge_down_probs1', 'merge_right_probs1', 'merge_down_probs2', 'merge_right_probs2']:
+            self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=1e-6))
+            self.assertTrue(np.array_equal(other_outputs[key], outputs[key]))
+        for key in ['h_positions', 'v_positions', 'cells_grid_rects']:
+            self.assertTrue(np.array_equal(outputs[key][0], expected_outputs[key][0]))
+
+    def test_fused_branches_gradients(self):
+        tf.random.set_seed(42)
+
+        inputs = self._create_inputs(1, 60, 80, 5, 7)
+        model = Model()
+        model(inputs)
+        fused_model = Model(fuse_branches=True)
+        fused_model(inputs)
+        fused_model.set_unfused_weights([layer.get_weights() for layer in model.layers if layer.weights])
+
+        def get_shared_network_gradients(model):
+            with tf.GradientTape() as tape:
+                outputs = model(inputs)
+                loss = tf.reduce_sum(outputs['merge_down_probs2']) + tf.reduce_sum(outputs['merge_right_probs2'])
+            return tape.gradient(loss, model.layers[0].trainable_weights)
+
+        for expected_gradient, gradient in zip(
+                get_shared_network_gradients(model), get_shared_network_gradients(fused_model)):
+            self.assertTrue(np.allclose(gradient, expected_gradient, atol=1e-5))
+
+    def test_fused_branches_without_onednn(self):
+        # Grouped convolutions of fused branches have no CPU kernels without oneDNN,
+        # which is configured before TensorFlow is imported.
+        env = dict(os.environ, TF_ENABLE_ONEDNN_OPTS='0')
+        tests_folder_path = os.path.dirname(os.path.abspath(__file__))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [tests_folder_path, env.get('PYTHONPATH')]))
+        completed_process = subprocess.run(
+            [sys.executable, '-m', 'unittest',
+             'test_merge_model.ModelTestCase.test_fused_branches',
+             'test_merge_model.ModelTestCase.test_fused_branches_gradients'],
+            env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.assertEqual(completed_process.returncode, 0, completed_process.stdout.decode())
+
+    def test_bfloat16_precision(self):
+        tf.random.set_seed(42)
+
+        inputs = self._create_inputs(2, 60, 80, 5, 7)
+        inputs['height'] = tf.constant([60, 50])
+        inputs['width'] = tf.constant([80, 71])
+        model = Model()
+        expected_outputs = model(inputs)
+        for fuse_branches in [False, True]:
+            with precision_policy(BFLOAT16_PRECISION):
+                bfloat16_model = Model(fuse_branches=fuse_branches)
+            bfloat16_model(inputs)
+            if fuse_branches:
+                bfloat16_model.set_unfused_weights([layer.get_weights() for layer in model.layers if layer.weights])
+            else:
+                bfloat16_model.set_weights(model.get_weights())
+            outputs = bfloat16_model(inputs)
+
+            for key in ['merge_down_probs2', 'merge_right_probs2']:
+                self.assertEqual(outputs[key].dtype, tf.float32)
+                self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=0.05))
+            self.assertEqual(bfloat16_model.trainable_weights[0].dtype, tf.float32)
+
+    def _create_inputs(self, batch_size, height, width, rows_count, cols_count):
+        """Returns random inputs of batch of tables with the same evenly spaced grid."""
+        h_mask = self._get_binary_vector_with_evenly_spaced_ones(height, rows_count-1)
+        v_mask = self._get_binary_vector_with_evenly_spaced_ones(width, cols_count-1)
+        return {
+            'image': tf.random.uniform(shape=(batch_size, height, width, 3), minval=0, maxval=256, dtype='int32'),
+            'horz_split_points_probs': tf.random.uniform(shape=(batch_size, height), dtype='float32'),
+            'vert_split_points_probs': tf.random.uniform(shape=(batch_size, width), dtype='float32'),
+            'horz_split_points_binary': tf.tile(h_mask[tf.newaxis], (batch_size, 1)),
+            'vert_split_points_binary': tf.tile(v_mask[tf.newaxis], (batch_size, 1))
+        }
+
     def _get_binary_vector_with_evenly_spaced_ones(self, length, num_of_ones):
         result = np.zeros((length,), dtype='int32')
         space = (length - num_of_ones) // (num_of_ones + 1)
@@ -0,0 +1,21 @@
+from unittest import TestCase, main
+
+import context
+from utils.parallel import map_method
+
+
+class MapMethodTestCase(TestCase):
+    def test_results_order(self):
+        items = range(50)
+        expected_results = [3 * item for item in items]
+        for workers_count in [1, 3]:
+            results = list(map_method(3, '__mul__', iter(items), workers_count))
+            self.assertEqual(results, expected_results)
+
+    def test_worker_exception(self):
+        with self.assertRaises(ZeroDivisionError):
+            list(map_method(1, '__truediv__', [1, 0, 2], 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -48,5 +48,19 @@ class ProjectionLayerTestCase(TestCase):
         output = layer(self.input)
         self.assertTrue(tf.reduce_all(expected_output == output))
 
+    def test_project_on_height_with_spatial_mask(self):
+        # Last column is padding.
+        spatial_mask = tf.constant([[
+            [[1], [1], [0]],
+            [[1], [1], [0]]
+        ]], dtype = 'float32')
+        expected_output = tf.constant([[
+            [[2, 3], [2, 3], [0, 0]],
+            [[8, 9], [8, 9], [0, 0]]
+        ]], dtype = 'float32')
+        layer = ProjectionLayer(ProjectionDirection.Height, True)
+        output = layer(self.input, spatial_mask)
+        self.assertTrue(tf.reduce_all(expected_output == output))
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,57 @@
+from unittest import TestCase, main
+
+import tensorflow as tf
+import numpy as np
+
+import context
+from split.projection_layer import ProjectionDirection
+from split.projections_conv_layer import ProjectionsConvLayer
+from utils.batching import create_spatial_mask
+
+
+class ProjectionsConvLayerTestCase(TestCase):
+    def test_height_projections(self):
+        self._test_projections(ProjectionDirection.Height)
+
+    def test_width_projections(self):
+        self._test_projections(ProjectionDirection.Width)
+
+    def _test_projections(self, direction):
+        tf.random.set_seed(42)
+        heights = [11, 7]
+        widths = [6, 9]
+        spatial_mask = create_spatial_mask(heights, widths, 11, 9)
+        middle_result = tf.random.uniform(shape=(2, 11, 9, 4)) * spatial_mask
+        projection_axis = 2 if direction == ProjectionDirection.Height else 1
+        upper_projection = tf.reduce_max(
+            tf.random.uniform(shape=(2, 11, 9, 3)) * spatial_mask, axis=projection_axis, keepdims=True)
+        lower_projection = tf.reduce_max(
+            tf.random.uniform(shape=(2, 11, 9, 1)) * spatial_mask, axis=projection_axis, keepdims=True)
+
+        layer = ProjectionsConvLayer(direction, 5, 3, activation='relu', dilation_rate=2)
+        inputs = [upper_projection, middle_result, lower_projection]
+        with tf.GradientTape(persistent=True) as tape:
+            tape.watch(inputs)
+            output = layer(inputs, spatial_mask)
+
+            concatenated_input = tf.concat([
+                tf.broadcast_to(upper_projection, (2, 11, 9, 3)) * spatial_mask,
+                middle_result,
+                tf.broadcast_to(lower_projection, (2, 11, 9, 1)) * spatial_mask
+            ], axis=3)
+            expected_output = tf.nn.relu(tf.nn.bias_add(
+                tf.nn.convolution(concatenated_input, layer.kernel, padding='SAME', dilations=2), layer.bias))
+        self.assertTrue(np.allclose(output, expected_output, atol=1e-5))
+        # Gradients are computed on CPU too. Projections in padded region are zeros
+        # produced by ProjectionLayer, so their gradients are compared in valid region only.
+        projections_mask = tf.reduce_max(spatial_mask, axis=projection_axis, keepdims=True)
+        masks = [projections_mask, 1, projections_mask, 1]
+        for expected_gradient, gradient, mask in zip(
+                tape.gradient(expected_output, inputs + [layer.kernel]),
+                tape.gradient(output, inputs + [layer.kernel]), masks):
+            self.assertTrue(np.allclose(gradient * mask, expected_gradient * mask, atol=1e-4))
+        # Plain tensor input is convolved as is.
+        self.assertTrue(np.allclose(layer(concatenated_input), expected_output, atol=1e-5))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+from unittest import TestCase, main
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+import context
+from datasets.rasterizers import Rasterizer
+from datasets.raster_cache import CachingRasterizer
+from utils.rect import Rect
+
+
+class CountingRasterizer(Rasterizer):
+    """Renders pages filled with page number, and counts rendered pages and clips."""
+    def __init__(self):
+        self.rendered_pages_count = 0
+        self.rendered_clips_count = 0
+
+    def render_page(self, pdf_file_path, page_number, dpi=72, size=None, clip_rect=None):
+        width, height = size or (dpi, 2 * dpi)
+        page = Image.fromarray(np.full((height, width, 3), page_number, dtype=np.uint8))
+        if clip_rect is None:
+            self.rendered_pages_count += 1
+            return page
+        self.rendered_clips_count += 1
+        return page.crop(clip_rect.as_tuple())
+
+
+class CachingRasterizerTestCase(TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._pdf_file_path = os.path.join(self._temp_dir.name, 'table.pdf')
+        with open(self._pdf_file_path, 'wb') as pdf_file:
+            pdf_file.write(b'pdf')
+        self._cache_folder_path = os.path.join(self._temp_dir.name, 'cache')
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def test_cached_pages(self):
+        rasterizer = CountingRasterizer()
+        cache = CachingRasterizer(rasterizer, 'counting', self._cache_folder_path, 2**20)
+        page = cache.render_page(self._pdf_file_path, 2, size=(30, 40))
+        self.assertEqual(page.size, (30, 40))
+        self.assertTrue(np.all(np.asarray(page) == 2))
+
+        clip = cache.render_page(self._pdf_file_path, 2, size=(30, 40), clip_rect=Rect(5, 10, 15, 30))
+        self.assertEqual(clip.size, (10, 20))
+        self.assertEqual(rasterizer.rendered_pages_count, 1)
+
+        # Cache is shared by rasterizers with the same name.
+        other_cache = CachingRasterizer(CountingRasterizer(), 'counting', self._cache_folder_path, 2**20)
+        other_cache.render_page(self._pdf_file_path, 2, size=(30, 40))
+        self.assertEqual(other_cache._rasterizer.rendered_pages_count, 0)
+
+        # Other render parameters and changed PDF content aren't cached.
+        cache.render_page(self._pdf_file_path, 2, dpi=72)
+        cache.render_page(self._pdf_file_path, 1, size=(30, 40))
+        with open(self._pdf_file_path, 'wb') as pdf_file:
+            pdf_file.write(b'other pdf')
+        cache.render_page(self._pdf_file_path, 2, size=(30, 40))
+        self.assertEqual(rasterizer.rendered_pages_count, 4)
+        self.assertEqual(rasterizer.rendered_clips_count, 0)
+
+    def test_cached_clips(self):
+        rasterizer = CountingRasterizer()
+        cache = CachingRasterizer(rasterizer, 'counting', self._cache_folder_path, 2**20)
+        # Only clip is rendered, if page isn't cached.
+        clip_rect = Rect(5, 10, 15, 30)
+        for _ in range(2):
+            clip = cache.render_page(self._pdf_file_path, 2, size=(30, 40), clip_rect=clip_rect)
+            self.assertEqual(clip.size, (10, 20))
+            self.assertTrue(np.all(np.asarray(clip) == 2))
+        self.assertEqual((rasterizer.rendered_pages_count, rasterizer.rendered_clips_count), (0, 1))
+
+        # Other clip of the same page is rendered too.
+        cache.render_page(self._pdf_file_path, 2, size=(30, 40), clip_rect=Rect(0, 0, 10, 10))
+        self.assertEqual((rasterizer.rendered_pages_count, rasterizer.rendered_clips_count), (0, 2))
+        # Page isn't cropped from cached clips.
+        self.assertEqual(cache.render_page(self._pdf_file_path, 2, size=(30, 40)).size, (30, 40))
+        self.assertEqual((rasterizer.rendered_pages_count, rasterizer.rendered_clips_count), (1, 2))
+
+    def test_eviction(self):
+        rasterizer = CountingRasterizer()
+        CachingRasterizer(rasterizer, 'counting', self._cache_folder_path, 2**20).render_page(
+            self._pdf_file_path, 1, size=(30, 40))
+        page_file_size = os.path.getsize(self._get_cache_files_pathes()[0])
+        # Cache fits 3 pages after eviction, but not 4.
+        cache = CachingRasterizer(rasterizer, 'counting', self._cache_folder_path, 3.6 * page_file_size)
+        for page_number in [2, 3]:
+            cache.render_page(self._pdf_file_path, page_number, size=(30, 40))
+        for access_time, path in enumerate(self._get_cache_files_pathes()):
+            os.utime(path, ns=(access_time, access_time))
+        # The first page becomes the most recently used one.
+        cache.render_page(self._pdf_file_path, 1, size=(30, 40))
+        self.assertEqual(rasterizer.rendered_pages_count, 3)
+
+        cache.render_page(self._pdf_file_path, 4, size=(30, 40))
+        self.assertEqual(len(self._get_cache_files_pathes()), 3)
+        cache.render_page(self._pdf_file_path, 1, size=(30, 40))
+        cache.render_page(self._pdf_file_path, 3, size=(30, 40))
+        self.assertEqual(rasterizer.rendered_pages_count, 4)
+        cache.render_page(self._pdf_file_path, 2, size=(30, 40))
+        self.assertEqual(rasterizer.rendered_pages_count, 5)
+
+    def _get_cache_files_pathes(self):
+        # Returns pathes of cache files in order of page numbers.
+        pathes = [
+            os.path.join(self._cache_folder_path, name) for name in os.listdir(self._cache_folder_path)
+        ]
+        return sorted(pathes, key=lambda path: int(os.path.basename(path).split('-')[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+from unittest import TestCase, main
+
+import tensorflow as tf
+import numpy as np
+
+import context
+from utils.resolution import ResolutionPolicy, upscale_values, upscale_positions
+
+
+class ResolutionPolicyTestCase(TestCase):
+    def test_scaled_size(self):
+        self.assertEqual(self._get_scaled_size(ResolutionPolicy(), 300, 1000), (300, 1000))
+        self.assertEqual(self._get_scaled_size(ResolutionPolicy(max_side=500), 300, 1000), (150, 500))
+        self.assertEqual(self._get_scaled_size(ResolutionPolicy(max_side=500), 300, 400), (300, 400))
+        self.assertEqual(self._get_scaled_size(ResolutionPolicy(max_pixels=75000), 300, 1000), (150, 500))
+        self.assertEqual(
+            self._get_scaled_size(ResolutionPolicy(max_side=400, max_pixels=75000), 300, 1000), (120, 400))
+        self.assertEqual(self._get_scaled_size(ResolutionPolicy(max_side=10), 1, 1000), (1, 10))
+
+    def test_downscale_padded_batch(self):
+        image = tf.random.uniform(shape=(2, 60, 100, 3), minval=0, maxval=256, dtype=tf.int32)
+        policy = ResolutionPolicy(max_side=50)
+        scaled_image, heights, widths = policy.downscale_image(image, tf.constant([60, 35]), tf.constant([71, 100]))
+        self.assertEqual(scaled_image.shape, (2, 30, 50, 3))
+        self.assertEqual(scaled_image.dtype, tf.int32)
+        self.assertEqual(heights.numpy().tolist(), [30, 18])
+        self.assertEqual(widths.numpy().tolist(), [36, 50])
+
+    def test_upscale_values(self):
+        values = tf.constant([[True, False, True], [False, True, False]])
+        upscaled_values = upscale_values(values, 7).numpy()
+        self.assertEqual(upscaled_values.tolist(), [
+            [True, True, False, False, False, True, True],
+            [False, False, True, True, True, False, False]
+        ])
+        # Each valid pixel is mapped to valid pixel of downscaled image.
+        heights = np.arange(1, 101)
+        scaled_heights = ResolutionPolicy(max_side=37).downscale_image(
+            tf.zeros((100, 100, 1, 1)), tf.constant(heights), tf.constant(heights))[1]
+        indices = upscale_values(tf.range(37)[tf.newaxis], 100)[0].numpy()
+        for height, scaled_height in zip(heights, scaled_heights.numpy()):
+            self.assertLess(indices[height - 1], scaled_height)
+
+    def test_upscale_positions(self):
+        positions = tf.ragged.constant([[0, 10, 49], []])
+        upscaled_positions = upscale_positions(positions, 50, 100)
+        self.assertEqual(upscaled_positions.to_list(), [[1, 21, 99], []])
+
+    def _get_scaled_size(self, policy, height, width):
+        scaled_height, scaled_width = policy.get_scaled_size(height, width)
+        return int(scaled_height), int(scaled_width)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+from unittest import TestCase, main
+import tempfile
+
+import tensorflow as tf
+import numpy as np
+
+import context
+from utils.shards import write_shards, load_shards
+
+
+class ShardsTestCase(TestCase):
+    def test_write_and_load(self):
+        rng = np.random.default_rng(42)
+        elements = []
+        for height, width in [(3, 5), (7, 2), (1, 1), (4, 6), (2, 9)]:
+            elements.append({
+                'image': rng.integers(0, 256, (height, width, 3), dtype=np.uint8),
+                'horz_split_points_mask': rng.random(height) > 0.5,
+                'vert_split_points_probs': rng.random(width, dtype=np.float32),
+                'vert_split_points_binary': rng.integers(0, 2, width, dtype=np.int32),
+                'merge_right_mask': rng.random((height, width - 1)) > 0.5,
+                'markup_table': bytes(rng.integers(0, 256, height * width, dtype=np.uint8))
+            })
+        ds = tf.data.Dataset.from_generator(
+            lambda: iter(elements),
+            output_signature={
+                'image': tf.TensorSpec((None, None, 3), tf.uint8),
+                'horz_split_points_mask': tf.TensorSpec((None,), tf.bool),
+                'vert_split_points_probs': tf.TensorSpec((None,), tf.float32),
+                'vert_split_points_binary': tf.TensorSpec((None,), tf.int32),
+                'merge_right_mask': tf.TensorSpec((None, None), tf.bool),
+                'markup_table': tf.TensorSpec((), tf.string)
+            })
+
+        with tempfile.TemporaryDirectory() as folder_path:
+            self.assertEqual(write_shards(ds, folder_path, examples_per_shard=2), len(elements))
+            loaded_ds = load_shards(folder_path)
+            self.assertEqual(loaded_ds.element_spec['image'], tf.TensorSpec((None, None, 3), tf.uint8))
+            loaded_elements = list(loaded_ds.as_numpy_iterator())
+
+        self.assertEqual(len(loaded_elements), len(elements))
+        for element, loaded_element in zip(elements, loaded_elements):
+            self.assertEqual(element.keys(), loaded_element.keys())
+            for name in element:
+                self.assertEqual(np.asarray(element[name]).dtype, np.asarray(loaded_element[name]).dtype)
+                self.assertTrue(np.array_equal(element[name], loaded_element[name]))
+
+
+if __name__ == '__main__':
+    main()
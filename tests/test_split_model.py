@@ -1,9 +1,15 @@
 from unittest import TestCase, main
+import os
+import tempfile
 
 import tensorflow as tf
+import numpy as np
 
 import context
 from split.model import Model
+from split.evaluation import load_weights
+from utils.resolution import ResolutionPolicy
+from utils.precision import BFLOAT16_PRECISION, precision_policy
 
 class ModelTestCase(TestCase):
     def test_one_pixel_image(self):
@@ -39,5 +45,193 @@ class ModelTestCase(TestCase):
         self.assertEqual(
             outputs['vert_split_points_binary'].shape, (batch_size, width))
 
+    def test_padded_batch(self):
+        image_sizes = [(30, 50), (41, 37)]
+        images = [
+            tf.random.uniform(shape=(1, height, width, 3), minval=0, maxval=256, dtype='int32', seed=42)
+            for height, width in image_sizes
+        ]
+        m = Model()
+        expected_outputs = [m(image) for image in images]
+
+        max_height = max(height for height, _ in image_sizes)
+        max_width = max(width for _, width in image_sizes)
+        padded_images = [
+            tf.pad(image, [[0, 0], [0, max_height - height], [0, max_width - width], [0, 0]])
+            for image, (height, width) in zip(images, image_sizes)
+        ]
+        outputs = m({
+            'image': tf.concat(padded_images, axis=0),
+            'height': tf.constant([height for height, _ in image_sizes]),
+            'width': tf.constant([width for _, width in image_sizes])
+        })
+
+        for i, (height, width) in enumerate(image_sizes):
+            for key in ['horz_split_points_probs1', 'horz_split_points_probs2', 'horz_split_points_probs3']:
+                self.assertTrue(np.allclose(
+                    outputs[key][i, :height], expected_outputs[i][key][0], atol=1e-5))
+            for key in ['vert_split_points_probs1', 'vert_split_points_probs2', 'vert_split_points_probs3']:
+                self.assertTrue(np.allclose(
+                    outputs[key][i, :width], expected_outputs[i][key][0], atol=1e-5))
+            self.assertTrue(tf.reduce_all(
+                outputs['horz_split_points_binary'][i, :height] == expected_outputs[i]['horz_split_points_binary'][0]))
+            self.assertTrue(tf.reduce_all(
+                outputs['vert_split_points_binary'][i, :width] == expected_outputs[i]['vert_split_points_binary'][0]))
+    def test_jit_compile_with_tf_ops(self):
+        image = tf.random.uniform(shape=(1, 40, 70, 3), minval=0, maxval=256, dtype='int32', seed=42)
+        m = Model()
+        expected_outputs = m(image)
+        tf_ops_model = Model(ops_implementation='tf')
+        tf_ops_model(image)
+        tf_ops_model.set_weights(m.get_weights())
+        outputs = tf.function(tf_ops_model, jit_compile=True)(image)
+
+        for key in ['horz_split_points_probs3', 'vert_split_points_probs3']:
+            self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=1e-5))
+        for key in ['horz_split_points_binary', 'vert_split_points_binary']:
+            self.assertTrue(tf.reduce_all(outputs[key] == expected_outputs[key]))
+
+    def test_fused_networks(self):
+        image = tf.random.uniform(shape=(1, 40, 70, 3), minval=0, maxval=256, dtype='int32', seed=42)
+        m = Model()
+        expected_outputs = m(image)
+        fused_model = Model(fuse_networks=True)
+        fused_model(image)
+        with tempfile.TemporaryDirectory() as dir_path:
+            # Checkpoint of unfused model is mapped to fused one.
+            model_file_path = os.path.join(dir_path, 'model.h5')
+            m.save_weights(model_file_path, save_format='h5')
+            load_weights(fused_model, model_file_path)
+            outputs = fused_model(image)
+            # Checkpoint of fused model is loaded as is.
+            fused_model_file_path = os.path.join(dir_path, 'fused_model.h5')
+            fused_model.save_weights(fused_model_file_path, save_format='h5')
+            other_fused_model = Model(fuse_networks=True)
+            other_fused_model(image)
+            load_weights(other_fused_model, fused_model_file_path)
+            other_outputs = other_fused_model(image)
+            # Checkpoint of fused model isn't loaded into unfused one.
+            with self.assertRaises(ValueError):
+                load_weights(m, fused_model_file_path)
+        # Neither is checkpoint of other model.
+        with self.assertRaises(ValueError):
+            load_weights(fused_model, 'checkpoints/merge_icdar.ckpt')
+
+        for key in ['horz_split_points_probs1', 'horz_split_points_probs2', 'horz_split_points_probs3',
+                    'vert_split_points_probs1', 'vert_split_points_probs2', 'vert_split_points_probs3']:
+            self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=1e-6))
+            self.assertTrue(np.array_equal(other_outputs[key], outputs[key]))
+        for key in ['horz_split_points_binary', 'vert_split_points_binary']:
+            self.assertTrue(tf.reduce_all(outputs[key] == expected_outputs[key]))
+
+    def test_anisotropic_pooling(self):
+        image_sizes = [(30, 50), (41, 37)]
+        images = [
+            tf.random.uniform(shape=(1, height, width, 3), minval=0, maxval=256, dtype='int32', seed=42)
+            for height, width in image_sizes
+        ]
+        m = Model(anisotropic_pool_size=4)
+        expected_outputs = [m(image) for image in images]
+        for (height, width), outputs in zip(image_sizes, expected_outputs):
+            self.assertEqual(outputs['horz_split_points_probs3'].shape, (1, height))
+            self.assertEqual(outputs['vert_split_points_probs3'].shape, (1, width))
+
+        # Pooling of padded batch doesn't mix valid and padded regions.
+        padded_images = [
+            tf.pad(image, [[0, 0], [0, 41 - height], [0, 50 - width], [0, 0]])
+            for image, (height, width) in zip(images, image_sizes)
+        ]
+        outputs = m({
+            'image': tf.concat(padded_images, axis=0),
+            'height': tf.constant([height for height, _ in image_sizes]),
+            'width': tf.constant([width for _, width in image_sizes])
+        })
+        for i, (height, width) in enumerate(image_sizes):
+            self.assertTrue(np.allclose(
+                outputs['horz_split_points_probs3'][i, :height],
+                expected_outputs[i]['horz_split_points_probs3'][0], atol=1e-5))
+            self.assertTrue(np.allclose(
+                outputs['vert_split_points_probs3'][i, :width],
+                expected_outputs[i]['vert_split_points_probs3'][0], atol=1e-5))
+
+    def test_tiling(self):
+        for fuse_networks in [False, True]:
+            m = Model(fuse_networks=fuse_networks)
+            # Budget allows 4 tiles of 32 pixels along longer side with TILING_CONTEXT (32) pixels of context.
+            tiled_model = Model(fuse_networks=fuse_networks, tiling_pixels_budget=96 * 60)
+            for image_size in [(121, 60), (60, 121)]:
+                image = tf.random.uniform(shape=(1, *image_size, 3), minval=0, maxval=256, dtype='int32', seed=42)
+                expected_outputs = m(image)
+                tiled_model(image)
+                tiled_model.set_weights(m.get_weights())
+                outputs = tiled_model(image)
+                for key in ['horz_split_points_probs3', 'vert_split_points_probs3']:
+                    self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=1e-5))
+
+        # Padded batch is tiled with the same budget per batch.
+        image_sizes = [(121, 50), (97, 60)]
+        padded_images = [
+            tf.pad(
+                tf.random.uniform(shape=(1, height, width, 3), minval=0, maxval=256, dtype='int32', seed=42),
+                [[0, 0], [0, 121 - height], [0, 60 - width], [0, 0]])
+            for height, width in image_sizes
+        ]
+        input = {
+            'image': tf.concat(padded_images, axis=0),
+            'height': tf.constant([height for height, _ in image_sizes]),
+            'width': tf.constant([width for _, width in image_sizes])
+        }
+        m = Model()
+        expected_outputs = m(input)
+        tiled_model = Model(tiling_pixels_budget=2 * 96 * 60)
+        tiled_model(input)
+        tiled_model.set_weights(m.get_weights())
+        outputs = tf.function(tiled_model)(input)
+        for key in ['horz_split_points_probs3', 'vert_split_points_probs3']:
+            self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=1e-5))
+
+    def test_bfloat16_precision(self):
+        image = tf.random.uniform(shape=(2, 40, 70, 3), minval=0, maxval=256, dtype='int32', seed=42)
+        input = {'image': image, 'height': tf.constant([40, 33]), 'width': tf.constant([70, 51])}
+        m = Model()
+        expected_outputs = m(input)
+        for kwargs in [{}, {'fuse_networks': True}, {'tiling_pixels_budget': 2 * 96 * 40}]:
+            with precision_policy(BFLOAT16_PRECISION):
+                bfloat16_model = Model(**kwargs)
+            bfloat16_model(input)
+            if kwargs.get('fuse_networks'):
+                bfloat16_model.set_unfused_weights([layer.get_weights() for layer in m.layers if layer.weights])
+            else:
+                bfloat16_model.set_weights(m.get_weights())
+            outputs = bfloat16_model(input)
+
+            for key in ['horz_split_points_probs3', 'vert_split_points_probs3']:
+                self.assertEqual(outputs[key].dtype, tf.float32)
+                self.assertTrue(np.allclose(outputs[key], expected_outputs[key], atol=0.05))
+            self.assertEqual(bfloat16_model.trainable_weights[0].dtype, tf.float32)
+
+    def test_resolution_policy(self):
+        image = tf.random.uniform(shape=(1, 40, 70, 3), minval=0, maxval=256, dtype='int32', seed=42)
+        m = Model(resolution_policy=ResolutionPolicy(max_side=35))
+        outputs = m(image)
+        scaled_outputs = Model()
+        scaled_outputs(image)
+        scaled_outputs.set_weights(m.get_weights())
+        scaled_outputs = scaled_outputs(tf.cast(tf.round(tf.image.resize(image, (20, 35), 'area')), tf.int32))
+
+        # Predictions on downscaled image are upscaled to original size.
+        for key in ['horz_split_points_probs3', 'horz_split_points_binary']:
+            self.assertEqual(outputs[key].shape, (1, 40))
+            self.assertTrue(np.array_equal(outputs[key][0, ::2], scaled_outputs[key][0]))
+        for key in ['vert_split_points_probs3', 'vert_split_points_binary']:
+            self.assertEqual(outputs[key].shape, (1, 70))
+            self.assertTrue(np.array_equal(outputs[key][0, ::2], scaled_outputs[key][0]))
+
+        # Padded batch is downscaled as a whole.
+        padded_image = tf.pad(image, [[0, 0], [0, 10], [0, 0], [0, 0]])
+        padded_outputs = m({'image': padded_image, 'height': tf.constant([40]), 'width': tf.constant([70])})
+        self.assertEqual(padded_outputs['horz_split_points_binary'].shape, (1, 50))
+        self.assertFalse(np.any(padded_outputs['horz_split_points_binary'][0, 40:]))
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,119 @@
+from unittest import TestCase, main
+
+import tensorflow as tf
+import numpy as np
+
+ops_module = tf.load_op_library('ops/ops.so')
+
+import context
+from utils import tf_ops
+
+
+class TfOpsTestCase(TestCase):
+    def setUp(self):
+        self._rng = np.random.RandomState(42)
+
+    def test_gc_binarize(self):
+        for gc_lambda in [0, 0.1, 0.75, 1.5]:
+            # Coarse probabilities produce many min cuts with equal cost.
+            for probs in [self._rng.uniform(size=(4, 50)), self._rng.randint(0, 9, size=(4, 50)) / 8]:
+                probs = tf.constant(probs, dtype='float32')
+                lengths = tf.constant([50, 0, 1, 23])
+                self._assert_equal(
+                    ops_module.batch_gc_binarize(probs, lengths, gc_lambda),
+                    tf_ops.batch_gc_binarize(probs, lengths, gc_lambda))
+
+    def test_intervals_centers(self):
+        mask = tf.constant(self._rng.randint(0, 2, size=(4, 50)), dtype='int32')
+        lengths = tf.constant([50, 0, 1, 23])
+        self._assert_equal(
+            ops_module.batch_intervals_centers(mask, lengths),
+            tf_ops.batch_intervals_centers(mask, lengths))
+
+    def test_grid_ops(self):
+        h_positions = tf.ragged.constant([[3, 7], [], [1, 1, 9]], row_splits_dtype='int64')
+        v_positions = tf.ragged.constant([[5], [2, 4], [0]], row_splits_dtype='int64')
+        args = (
+            12, 9, tf.constant([12, 5, 10]), tf.constant([9, 9, 3]),
+            h_positions.flat_values, h_positions.row_splits,
+            v_positions.flat_values, v_positions.row_splits
+        )
+        self._assert_equal(
+            ops_module.batch_indices_cube(*args),
+            tf_ops.batch_indices_cube(*args))
+        self._assert_equal(
+            ops_module.batch_reciprocal_cells_areas_matrix(*args),
+            tf_ops.batch_reciprocal_cells_areas_matrix(*args))
+
+    def test_infer_cells_grid_rects(self):
+        for merge_prob in [0.1, 0.3, 0.5]:
+            merge_right_mask = tf.constant(self._rng.uniform(size=(4, 10, 11)) < merge_prob)
+            merge_down_mask = tf.constant(self._rng.uniform(size=(4, 9, 12)) < merge_prob)
+            rows_counts = tf.constant([10, 1, 4, 7])
+            cols_counts = tf.constant([12, 5, 1, 9])
+            self._assert_equal(
+                ops_module.batch_infer_cells_grid_rects(
+                    merge_right_mask, merge_down_mask, rows_counts, cols_counts),
+                tf_ops.batch_infer_cells_grid_rects(
+                    merge_right_mask, merge_down_mask, rows_counts, cols_counts))
+
+    def test_adjacency_relations_counts(self):
+        # Second table has no detected cells.
+        markup_tables = tf.constant([
+            [[0, 0, 0, 12, 9, 3, 0, 0],
+             [1, 1, 3, 2, 0, 0, 1, 1],
+             [5, 1, 11, 2, 1, 0, 3, 1],
+             [1, 4, 11, 8, 0, 1, 3, 2]],
+            [[1, 2, 3, 7, 8, 2, 0, 0],
+             [2, 3, 4, 4, 0, 0, 1, 1],
+             [5, 3, 6, 4, 1, 0, 2, 1],
+             [0, 0, 0, 0, 0, 0, 0, 0]]
+        ])
+        h_positions = tf.ragged.constant([[0, 3, 9], [3, 8]], row_splits_dtype='int64')
+        v_positions = tf.ragged.constant([[0, 4, 8, 12], [2, 7]], row_splits_dtype='int64')
+        cells_grid_rects = tf.ragged.constant(
+            [[[0, 0, 1, 1], [1, 0, 3, 1], [0, 1, 2, 2], [2, 1, 3, 2]], []],
+            ragged_rank=1, inner_shape=(4,), row_splits_dtype='int64')
+        args = (
+            markup_tables,
+            h_positions.flat_values, h_positions.row_splits,
+            v_positions.flat_values, v_positions.row_splits,
+            cells_grid_rects.flat_values, cells_grid_rects.row_splits
+        )
+        self._assert_equal(
+            ops_module.batch_adjacency_relations_counts(*args),
+            tf_ops.batch_adjacency_relations_counts(*args))
+        compiled_op = tf.function(tf_ops.batch_adjacency_relations_counts, jit_compile=True)
+        self._assert_equal(
+            ops_module.batch_adjacency_relations_counts(*args),
+            compiled_op(*args))
+
+    def test_jit_compile(self):
+        mask = tf.constant(self._rng.randint(0, 2, size=(2, 30)), dtype='int32')
+        lengths = tf.constant([30, 17])
+        compiled_op = tf.function(tf_ops.batch_intervals_centers, jit_compile=True)
+        self._assert_equal(
+            ops_module.batch_intervals_centers(mask, lengths),
+            compiled_op(mask, lengths))
+
+        merge_right_mask = tf.constant(self._rng.uniform(size=(2, 6, 7)) < 0.3)
+        merge_down_mask = tf.constant(self._rng.uniform(size=(2, 5, 8)) < 0.3)
+        rows_counts = tf.constant([6, 3])
+        cols_counts = tf.constant([8, 2])
+        compiled_op = tf.function(tf_ops.batch_infer_cells_grid_rects, jit_compile=True)
+        self._assert_equal(
+            ops_module.batch_infer_cells_grid_rects(
+                merge_right_mask, merge_down_mask, rows_counts, cols_counts),
+            compiled_op(merge_right_mask, merge_down_mask, rows_counts, cols_counts))
+
+    def _assert_equal(self, expected_outputs, outputs):
+        if not isinstance(outputs, tuple):
+            expected_outputs = (expected_outputs,)
+            outputs = (outputs,)
+        for expected_output, output in zip(expected_outputs, outputs):
+            self.assertEqual(expected_output.dtype, output.dtype)
+            self.assertTrue(np.array_equal(expected_output.numpy(), output.numpy()))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,10 @@ import merge.model
 import split
 import split.training
 import split.model
+from table.markup_table import convert_pickled_markup_tables
+from utils.batching import bucket_by_image_size
+from utils.precision import PRECISIONS, FLOAT32_PRECISION, precision_policy
+from utils.shards import load_shards
 
 
 def get_tensorboard_callback(model_type):
@@ -31,7 +35,11 @@ def main(args):
 
     module = split if args.model_type == 'SPLIT' else merge
 
-    model = module.model.Model(False)
+    with precision_policy(args.precision):
+        if args.model_type == 'SPLIT':
+            model = split.model.Model(False, anisotropic_pool_size=args.anisotropic_pool_size)
+        else:
+            model = merge.model.Model(False)
     lr_schedule = keras.optimizers.schedules.ExponentialDecay(
         args.initial_learning_rate,
         decay_steps=80000,
@@ -44,17 +52,28 @@ def main(args):
         loss_weights=module.training.get_losses_weights(),
         run_eagerly=False)
 
-    ds_suffix = '_split' if args.model_type == 'SPLIT' else '_merge'
-    ds = tfds.load(args.dataset_name + ds_suffix, split='train')
+    if args.shards_folder_path is not None:
+        ds = load_shards(args.shards_folder_path)
+    else:
+        ds_suffix = '_split' if args.model_type == 'SPLIT' else '_merge'
+        ds_version = ':' + args.dataset_version if args.dataset_version else ''
+        ds = tfds.load(args.dataset_name + ds_suffix + ds_version, split='train')
+    ds = convert_pickled_markup_tables(ds)
     
     if args.model_type == 'MERGE':
         # MERGE model output is empty for table with 1 row or 1 column,
         # which leads to nan loss.
         ds = ds.filter(merge.training.has_more_than_one_row_and_column)
 
-    ds = ds.map(module.training.convert_ds_element_to_tuple)
-    ds = ds.shuffle(128)
-    ds = ds.batch(1)
+    if args.batch_size > 1:
+        ds = ds.map(module.training.convert_ds_element_to_padded_tuple)
+        ds = ds.shuffle(128)
+        ds = bucket_by_image_size(
+            ds, args.batch_size, args.bucket_size, module.training.get_padding_values())
+    else:
+        ds = ds.map(module.training.convert_ds_element_to_tuple)
+        ds = ds.shuffle(128)
+        ds = ds.batch(1)
     ds = ds.prefetch(tf.data.AUTOTUNE)
 
     model.fit(
@@ -68,9 +87,22 @@ if __name__ == '__main__':
     parser.add_argument('model_type', help='Type of model', choices=['SPLIT', 'MERGE'])
     parser.add_argument('dataset_name', help='Name of the dataset to train on.', 
         choices=['icdar', 'fin_tab_net'])
+    parser.add_argument('--dataset_version',
+        help='Version of the dataset, e.g. 1.0.1 for dataset built with pickled markup tables. Latest by default.')
     parser.add_argument('result_file_path', help='Path to the file, where trained model will be serialized.')
     parser.add_argument('--epochs_count', default=10, type=int, help='Number of epochs to train.')
     parser.add_argument('--initial_learning_rate', default=0.00075, help='Initial value of learning rate.')
     parser.add_argument('--steps_per_epoch', default=None, type=int, 
         help='Steps per epoch. May be used for debug purposes.')
+    parser.add_argument('--batch_size', default=1, type=int,
+        help='Number of tables in batch. Tables of similar size are padded and batched together.')
+    parser.add_argument('--bucket_size', default=64, type=int,
+        help='Max padding (in pixels) of table image in each dimension, when batch_size > 1.')
+    parser.add_argument('--anisotropic_pool_size', default=None, type=int,
+        help='SPLIT only. Downsample RPN input along width and CPN input along height by this factor.')
+    parser.add_argument('--shards_folder_path',
+        help='Train on shards of train split exported by export_dataset_shards.py instead of tfds dataset.')
+    parser.add_argument('--precision', default=FLOAT32_PRECISION, choices=PRECISIONS,
+        help='Precision of activations. Variables and losses are float32 in any case. '
+            'Falls back to float32, if bfloat16 is not supported natively.')
     main(parser.parse_args())
\ No newline at end of file
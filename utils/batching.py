@@ -0,0 +1,29 @@
+import tensorflow as tf
+
+
+def bucket_by_image_size(ds, batch_size, bucket_size, padding_values):
+    """Groups elements with images of similar size into padded batches.
+
+    Elements of ds should be (inputs, targets) tuples, where inputs is a dict
+    with 'height' and 'width' of the image. Images, whose height and width
+    fall into the same bucket_size x bucket_size cell, are batched together,
+    so padding of each image doesn't exceed bucket_size-1 pixels in each dimension.
+    """
+    assert batch_size > 0
+    assert bucket_size > 0
+
+    def get_bucket_id(inputs, targets):
+        rows_bucket = tf.cast((inputs['height'] - 1) // bucket_size, tf.int64)
+        cols_bucket = tf.cast((inputs['width'] - 1) // bucket_size, tf.int64)
+        return rows_bucket * (2**32) + cols_bucket
+
+    def create_padded_batch(bucket_id, window):
+        return window.padded_batch(batch_size, padding_values=padding_values)
+
+    return ds.group_by_window(get_bucket_id, create_padded_batch, window_size=batch_size)
+
+def create_spatial_mask(heights, widths, max_height, max_width, dtype=tf.float32):
+    """Returns B x H x W x 1 mask of valid (non-padded) region of images in batch."""
+    rows_mask = tf.sequence_mask(heights, max_height, dtype=dtype)
+    cols_mask = tf.sequence_mask(widths, max_width, dtype=dtype)
+    return rows_mask[:, :, tf.newaxis, tf.newaxis] * cols_mask[:, tf.newaxis, :, tf.newaxis]
@@ -0,0 +1,40 @@
+import re
+
+import h5py
+import numpy as np
+
+
+def read_h5_layers_weights(file_path):
+    """Returns dict with weights of each layer with weights from file saved by keras with save_format='h5'.
+
+    Allows to map weights of model to weights of model with other structure.
+    Layers are ordered as in file.
+    """
+    def decode(name):
+        return name.decode('utf8') if isinstance(name, bytes) else name
+
+    result = {}
+    with h5py.File(file_path, 'r') as f:
+        for layer_name in f.attrs['layer_names']:
+            group = f[decode(layer_name)]
+            weights_names = group.attrs['weight_names']
+            if len(weights_names) > 0:
+                result[decode(layer_name)] = [np.asarray(group[decode(name)]) for name in weights_names]
+    return result
+
+def get_layers_weights(layers_weights, layers_names, file_path):
+    """Returns list of weights of layers with specified names (see read_h5_layers_weights).
+
+    Layer, which isn't named explicitly, may have numeric suffix in file (like 'layer_1'),
+    if several models were created by process, which saved it. Raises ValueError,
+    if some layer isn't found exactly once.
+    """
+    result = []
+    for layer_name in layers_names:
+        pattern = re.compile(re.escape(layer_name) + r'(_\d+)?')
+        matching_names = [name for name in layers_weights if pattern.fullmatch(name)]
+        if len(matching_names) != 1:
+            raise ValueError('Expected single layer {} in {}, found: {}'.format(
+                layer_name, file_path, matching_names))
+        result.append(layers_weights[matching_names[0]])
+    return result
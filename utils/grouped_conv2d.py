@@ -0,0 +1,100 @@
+import tensorflow as tf
+import tensorflow.keras as keras
+
+
+_is_native_grouped_conv_supported = None
+
+
+def is_native_grouped_conv_supported():
+    """Returns whether grouped convolution and its gradient run on default device.
+
+    TensorFlow 2.8 has no CPU kernel for gradient of grouped convolution,
+    and CPU kernel of grouped convolution itself requires oneDNN on some
+    builds, so it's checked once on tiny inputs.
+    """
+    global _is_native_grouped_conv_supported
+    if _is_native_grouped_conv_supported is None:
+        with tf.init_scope():
+            input = tf.ones((1, 3, 3, 2))
+            kernel = tf.ones((1, 1, 1, 2))
+            try:
+                # Gradient kernels are run directly, since layers may be called with gradient recording stopped.
+                result = tf.nn.convolution(input, kernel, padding='SAME')
+                tf.raw_ops.Conv2DBackpropInput(
+                    input_sizes=tf.shape(input), filter=kernel, out_backprop=result,
+                    strides=[1, 1, 1, 1], padding='SAME')
+                tf.raw_ops.Conv2DBackpropFilter(
+                    input=input, filter_sizes=tf.shape(kernel), out_backprop=result,
+                    strides=[1, 1, 1, 1], padding='SAME')
+                _is_native_grouped_conv_supported = True
+            except (tf.errors.InvalidArgumentError, tf.errors.UnimplementedError, tf.errors.NotFoundError):
+                _is_native_grouped_conv_supported = False
+    return _is_native_grouped_conv_supported
+
+
+class GroupedInitializer(keras.initializers.Initializer):
+    """Initializes each of groups of weight (along its last axis) as a separate weight.
+
+    So that weights of several layers fused into a single one
+    are initialized the same way as weights of original layers.
+    groups is either a number of equal groups or a list of groups sizes.
+    """
+    def __init__(self, groups, initializer='glorot_uniform'):
+        self._groups = groups
+        self._initializer = initializer
+
+    def __call__(self, shape, dtype=None, **kwargs):
+        groups_sizes = self._groups
+        if isinstance(groups_sizes, int):
+            assert shape[-1] % groups_sizes == 0
+            groups_sizes = [shape[-1] // groups_sizes] * groups_sizes
+        assert sum(groups_sizes) == shape[-1]
+        return tf.concat([
+            keras.initializers.get(self._initializer)(list(shape[:-1]) + [size], dtype)
+            for size in groups_sizes
+        ], axis=-1)
+
+    def get_config(self):
+        return {'groups': self._groups, 'initializer': self._initializer}
+
+
+class GroupedConv2D(keras.layers.Layer):
+    """2D convolution with 'same' padding, whose channels are split into independent groups.
+
+    Unlike keras.layers.Conv2D with groups, convolution isn't compiled with XLA,
+    which is several times slower on CPU than native grouped convolution.
+    If native grouped convolution isn't supported (see is_native_grouped_conv_supported),
+    then each group is convolved separately.
+    Kernel has the same shape as kernel of keras.layers.Conv2D with groups:
+    kernel_size x kernel_size x (input channels / groups) x filters, so output
+    channels of each group are contiguous.
+    """
+    def __init__(self, filters, kernel_size, groups, activation=None, dilation_rate=1, name=None):
+        super().__init__(name=name)
+        assert filters % groups == 0
+        self._filters = filters
+        self._kernel_size = kernel_size
+        self._groups = groups
+        self._activation = keras.activations.get(activation)
+        self._dilation_rate = dilation_rate
+
+    def build(self, input_shape):
+        input_channels = input_shape[-1]
+        assert input_channels % self._groups == 0
+        self.kernel = self.add_weight(
+            'kernel',
+            shape=(self._kernel_size, self._kernel_size, input_channels // self._groups, self._filters),
+            initializer=GroupedInitializer(self._groups))
+        self.bias = self.add_weight('bias', shape=(self._filters,), initializer='zeros')
+
+    def call(self, input):
+        if is_native_grouped_conv_supported():
+            result = tf.nn.convolution(input, self.kernel, padding='SAME', dilations=self._dilation_rate)
+        else:
+            result = tf.concat([
+                tf.nn.convolution(group_input, group_kernel, padding='SAME', dilations=self._dilation_rate)
+                for group_input, group_kernel in zip(
+                    tf.split(input, self._groups, axis=3), tf.split(self.kernel, self._groups, axis=3))
+            ], axis=3)
+        result = tf.nn.bias_add(result, self.bias)
+        return self._activation(result)
@@ -0,0 +1,22 @@
+import tensorflow as tf
+import tensorflow.keras as keras
+
+
+# Value of padded elements in targets, which should be ignored by losses.
+TARGETS_PADDING_VALUE = -1.
+
+
+class MaskedBinaryCrossentropy(keras.losses.Loss):
+    """Binary crossentropy, which ignores padded elements of targets."""
+
+    def __init__(self, axis=-1, **kwargs):
+        super().__init__(**kwargs)
+        self._axis = axis
+
+    def call(self, y_true, y_pred):
+        y_pred = tf.convert_to_tensor(y_pred)
+        y_true = tf.cast(y_true, y_pred.dtype)
+        valid_mask = tf.cast(y_true != TARGETS_PADDING_VALUE, y_pred.dtype)
+        losses = keras.backend.binary_crossentropy(y_true * valid_mask, y_pred) * valid_mask
+        valid_counts = tf.maximum(tf.reduce_sum(valid_mask, axis=self._axis), 1)
+        return tf.reduce_sum(losses, axis=self._axis) / valid_counts
@@ -0,0 +1,48 @@
+"""Selection between implementations of batched SPLERGE ops.
+
+Each op is implemented both as a custom op in ops/ops.so ('custom')
+and in pure TensorFlow in utils/tf_ops.py ('tf'). Custom ops library
+is loaded only when some custom op is requested.
+"""
+
+import tensorflow as tf
+
+from utils import tf_ops
+
+
+CUSTOM_IMPLEMENTATION = 'custom'
+TF_IMPLEMENTATION = 'tf'
+
+OPS_NAMES = [
+    'batch_gc_binarize',
+    'batch_intervals_centers',
+    'batch_indices_cube',
+    'batch_reciprocal_cells_areas_matrix',
+    'batch_infer_cells_grid_rects',
+    'batch_adjacency_relations_counts'
+]
+
+_custom_ops_module = None
+
+
+def get_op(name, ops_implementation=CUSTOM_IMPLEMENTATION):
+    """Returns batched op with specified name.
+
+    ops_implementation is either the name of implementation of all ops,
+    or a dict with implementation of specific ops (custom by default).
+    """
+    assert name in OPS_NAMES
+    if isinstance(ops_implementation, dict):
+        assert all(key in OPS_NAMES for key in ops_implementation)
+        ops_implementation = ops_implementation.get(name, CUSTOM_IMPLEMENTATION)
+
+    if ops_implementation == TF_IMPLEMENTATION:
+        return getattr(tf_ops, name)
+    assert ops_implementation == CUSTOM_IMPLEMENTATION
+    return getattr(_get_custom_ops_module(), name)
+
+def _get_custom_ops_module():
+    global _custom_ops_module
+    if _custom_ops_module is None:
+        _custom_ops_module = tf.load_op_library('ops/ops.so')
+    return _custom_ops_module
@@ -0,0 +1,62 @@
+import tensorflow as tf
+
+
+def conv2d_of_outer_products(terms, dilation_rate=1):
+    """Returns sum of 'same' convolutions of B x H x W x C inputs, which are outer products of rows and cols values.
+
+    terms is a list of (rows_values, cols_values, kernel) tuples. Input of
+    each term is rows_values[:, :, tf.newaxis, :] * cols_values[:, tf.newaxis, :, :],
+    where rows_values is B x H x C and cols_values is B x W x 1, or rows_values
+    is B x H x 1 and cols_values is B x W x C. Kernel is KH x KW x C x F.
+    Inputs aren't materialized: rows values are shifted by each kernel row
+    offset, and cols values are convolved with each row of kernel, so that
+    each factor is contracted with its kernel slice before their product.
+    Sum is computed as a single matmul of B x H x K and B x K x (W * F) tensors,
+    where K is the sum of KH * (rows values channels) of terms, so that
+    B x H x W x F result is the only tensor of full size both in forward and backward pass.
+    """
+    rows_factors = []
+    cols_factors = []
+    for rows_values, cols_values, kernel in terms:
+        kernel_height, kernel_width, channels, filters = kernel.shape
+        assert kernel_height % 2 == 1 and kernel_width % 2 == 1
+        rows_channels = rows_values.shape[-1]
+        cols_channels = cols_values.shape[-1]
+        assert min(rows_channels, cols_channels) == 1 and max(rows_channels, cols_channels) == channels
+        batch_size = tf.shape(rows_values)[0]
+        height = tf.shape(rows_values)[1]
+        width = tf.shape(cols_values)[1]
+        rows_factors.append(tf.reshape(
+            _shift(rows_values, kernel_height, dilation_rate),
+            (batch_size, height, kernel_height * rows_channels)))
+        convolved_cols_values = _convolve(
+            cols_values, tf.reshape(kernel, (kernel_height, kernel_width, rows_channels, cols_channels, filters)),
+            dilation_rate)
+        cols_factors.append(tf.reshape(
+            tf.transpose(convolved_cols_values, [0, 2, 1, 3]),
+            (batch_size, kernel_height * rows_channels, width * filters)))
+
+    result = tf.matmul(tf.concat(rows_factors, axis=2), tf.concat(cols_factors, axis=1))
+    return tf.reshape(result, (batch_size, height, width, filters))
+
+def _convolve(values, kernel, dilation_rate):
+    # Convolves B x N x C2 values along N with each row of K1 x K2 x C1 x C2 x F kernel,
+    # result is B x N x (K1 * C1) x F.
+    kernel_height, kernel_width, rows_channels, cols_channels, filters = kernel.shape
+    rows_kernel = tf.reshape(
+        tf.transpose(kernel, [1, 3, 0, 2, 4]),
+        (kernel_width, 1, cols_channels, kernel_height * rows_channels * filters))
+    result = tf.nn.convolution(
+        values[:, :, tf.newaxis, :], rows_kernel, padding='SAME', dilations=(dilation_rate, 1))
+    return tf.reshape(
+        result, (tf.shape(values)[0], tf.shape(values)[1], kernel_height * rows_channels, filters))
+
+def _shift(values, kernel_size, dilation_rate):
+    # Returns B x N x K x C values at offset of each kernel element, padded with zeros.
+    length = tf.shape(values)[1]
+    padding = (kernel_size // 2) * dilation_rate
+    padded_values = tf.pad(values, [[0, 0], [padding, padding], [0, 0]])
+    return tf.stack([
+        padded_values[:, i * dilation_rate:i * dilation_rate + length]
+        for i in range(kernel_size)
+    ], axis=2)
@@ -0,0 +1,45 @@
+"""Order-preserving process pool for CPU-bound generation of dataset examples."""
+
+from collections import deque
+import concurrent.futures
+import multiprocessing
+
+
+# Number of items submitted to each worker ahead of consumer.
+_PENDING_ITEMS_PER_WORKER = 4
+
+# Copy of object, which methods are called in worker process.
+_worker_object = None
+
+
+def map_method(obj, method_name, items, workers_count=1):
+    """Yields obj.method_name(item) for each item, in order of items.
+
+    If workers_count > 1, then items are processed by workers_count processes,
+    each of which receives pickled copy of obj once. Items are submitted
+    lazily, so items may be a long iterator.
+    """
+    if workers_count <= 1:
+        method = getattr(obj, method_name)
+        for item in items:
+            yield method(item)
+        return
+
+    # Spawned workers don't inherit state of TensorFlow runtime, which isn't fork-safe.
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(
+            workers_count, context, initializer=_init_worker, initargs=(obj,)) as executor:
+        pending_results = deque()
+        for item in items:
+            pending_results.append(executor.submit(_call_worker_method, method_name, item))
+            if len(pending_results) >= _PENDING_ITEMS_PER_WORKER * workers_count:
+                yield pending_results.popleft().result()
+        while pending_results:
+            yield pending_results.popleft().result()
+
+def _init_worker(obj):
+    global _worker_object
+    _worker_object = obj
+
+def _call_worker_method(method_name, item):
+    return getattr(_worker_object, method_name)(item)
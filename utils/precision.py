@@ -0,0 +1,66 @@
+"""Selection of precision of models' computations.
+
+Models created with 'bfloat16' precision compute activations in bfloat16,
+while their variables, outputs and losses are float32 (see Keras mixed
+precision). Custom ops get float32 inputs in both cases.
+"""
+
+from contextlib import contextmanager
+import logging
+
+import tensorflow as tf
+import tensorflow.keras as keras
+
+
+FLOAT32_PRECISION = 'float32'
+BFLOAT16_PRECISION = 'bfloat16'
+
+PRECISIONS = [FLOAT32_PRECISION, BFLOAT16_PRECISION]
+
+_POLICIES_NAMES = {
+    FLOAT32_PRECISION: 'float32',
+    BFLOAT16_PRECISION: 'mixed_bfloat16'
+}
+
+
+def is_bfloat16_supported():
+    """Returns True if host has GPU or CPU with native bfloat16 arithmetic."""
+    for device in tf.config.list_physical_devices('GPU'):
+        compute_capability = tf.config.experimental.get_device_details(device).get('compute_capability')
+        if compute_capability is not None and compute_capability >= (8, 0):
+            return True
+    try:
+        with open('/proc/cpuinfo') as cpuinfo_file:
+            flags = set(cpuinfo_file.read().split())
+    except OSError:
+        return False
+    return ('avx512_bf16' in flags or 'amx_bf16' in flags) and _is_bfloat16_conv_supported_on_cpu()
+
+def _is_bfloat16_conv_supported_on_cpu():
+    # TensorFlow before 2.9 has bfloat16 convolution on CPU only with oneDNN
+    # (TF_ENABLE_ONEDNN_OPTS=1), otherwise it returns an empty float32 tensor.
+    with tf.init_scope(), tf.device('CPU:0'):
+        try:
+            result = tf.nn.conv2d(
+                tf.ones((1, 3, 3, 1), tf.bfloat16), tf.ones((1, 1, 1, 1), tf.bfloat16), 1, 'SAME')
+        except (tf.errors.InvalidArgumentError, tf.errors.UnimplementedError, tf.errors.NotFoundError):
+            return False
+    return result.dtype == tf.bfloat16 and result.shape == (1, 3, 3, 1)
+
+def get_supported_precision(precision):
+    """Returns precision, or float32 with a warning if it isn't supported on this host."""
+    assert precision in PRECISIONS
+    if precision == BFLOAT16_PRECISION and not is_bfloat16_supported():
+        logging.warning('bfloat16 is not supported natively on this host, float32 precision is used instead.')
+        return FLOAT32_PRECISION
+    return precision
+
+@contextmanager
+def precision_policy(precision):
+    """Sets Keras global policy of given precision for layers created within context."""
+    previous_policy = keras.mixed_precision.global_policy()
+    keras.mixed_precision.set_global_policy(_POLICIES_NAMES[get_supported_precision(precision)])
+    try:
+        yield
+    finally:
+        keras.mixed_precision.set_global_policy(previous_policy)
@@ -0,0 +1,76 @@
+import tensorflow as tf
+
+
+class ResolutionPolicy:
+    """Limits resolution of images fed to models at inference.
+
+    Images are downscaled with preserved aspect ratio, so that the longer side
+    doesn't exceed max_side and the area doesn't exceed max_pixels. Images
+    within limits aren't changed. Predictions made on downscaled image are
+    mapped back to original coordinates with upscale_values and upscale_positions.
+    """
+    def __init__(self, max_side=None, max_pixels=None):
+        assert max_side is None or max_side > 0
+        assert max_pixels is None or max_pixels > 0
+        self._max_side = max_side
+        self._max_pixels = max_pixels
+
+    @property
+    def is_limited(self):
+        return self._max_side is not None or self._max_pixels is not None
+
+    def get_scaled_size(self, height, width):
+        """Returns height and width of downscaled image."""
+        height = tf.cast(height, tf.float32)
+        width = tf.cast(width, tf.float32)
+        scale = tf.constant(1.0)
+        if self._max_side is not None:
+            scale = tf.minimum(scale, self._max_side / tf.maximum(height, width))
+        if self._max_pixels is not None:
+            scale = tf.minimum(scale, tf.sqrt(self._max_pixels / (height * width)))
+        scaled_height = tf.maximum(tf.cast(tf.floor(height * scale), tf.int32), 1)
+        scaled_width = tf.maximum(tf.cast(tf.floor(width * scale), tf.int32), 1)
+        return scaled_height, scaled_width
+
+    def downscale_image(self, image, heights=None, widths=None):
+        """Returns downscaled B x H x W x C image batch, and scaled heights and widths.
+
+        If batch is padded, then valid heights and widths of its images are
+        scaled with the same factors as the batch.
+        """
+        if not self.is_limited:
+            return image, heights, widths
+
+        height = tf.shape(image)[1]
+        width = tf.shape(image)[2]
+        scaled_height, scaled_width = self.get_scaled_size(height, width)
+        image = tf.cond(
+            tf.logical_and(scaled_height == height, scaled_width == width),
+            lambda: image,
+            lambda: tf.cast(tf.round(tf.image.resize(image, (scaled_height, scaled_width), 'area')), image.dtype))
+        if heights is not None:
+            heights = _scale_lengths(heights, height, scaled_height)
+            widths = _scale_lengths(widths, width, scaled_width)
+        return image, heights, widths
+
+
+def upscale_values(values, length):
+    """Resizes B x N values along rows or cols of downscaled image to B x length with nearest neighbor."""
+    scaled_length = tf.shape(values)[1]
+    scale = tf.cast(scaled_length, tf.float32) / tf.cast(length, tf.float32)
+    indices = tf.cast((tf.range(length, dtype=tf.float32) + 0.5) * scale, tf.int32)
+    return tf.gather(values, tf.minimum(indices, scaled_length - 1), axis=1)
+
+def upscale_positions(positions, scaled_length, length):
+    """Maps ragged positions of split points in downscaled image to original coordinates."""
+    scale = tf.cast(length, tf.float32) / tf.cast(scaled_length, tf.float32)
+    return tf.ragged.map_flat_values(
+        lambda positions: tf.cast((tf.cast(positions, tf.float32) + 0.5) * scale, positions.dtype),
+        positions)
+
+def _scale_lengths(lengths, length, scaled_length):
+    # Valid region is rounded up, so that each valid pixel is mapped back
+    # to valid pixel of downscaled image by upscale_values.
+    scale = tf.cast(scaled_length, tf.float32) / tf.cast(length, tf.float32)
+    scaled_lengths = tf.cast(tf.math.ceil(tf.cast(lengths, tf.float32) * scale), lengths.dtype)
+    return tf.minimum(scaled_lengths, tf.cast(scaled_length, lengths.dtype))
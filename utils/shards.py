@@ -0,0 +1,109 @@
+"""Memory-mapped shards of decoded dataset elements.
+
+Each shard is a pair of files: shard-NNNNN.bin with raw values of features
+of its elements, and shard-NNNNN.index.npy with offset and shape of each
+feature of each element. Values are aligned to 64 bytes, so that features
+of element are views of memory-mapped shard, which TensorFlow wraps into
+tensors without copying (arrays with smaller alignment are copied).
+spec.json stores names, dtypes and shapes of features. Elements read from
+shards are equal to elements of original dataset, so they are converted
+to model inputs in the same way. Values are stored decoded, so shards take
+several times more disk space than dataset with PNG-encoded images.
+"""
+
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+
+_SPEC_FILE_NAME = 'spec.json'
+_MAX_RANK = 3
+_ALIGNMENT = 64
+
+
+def write_shards(ds, folder_path, examples_per_shard=1024):
+    """Writes elements of ds (dicts of tensors of rank up to 3) to shards in folder.
+
+    Returns number of written elements.
+    """
+    assert examples_per_shard > 0
+    os.makedirs(folder_path, exist_ok=True)
+    spec = [
+        {'name': name, 'dtype': tensor_spec.dtype.name, 'shape': tensor_spec.shape.as_list()}
+        for name, tensor_spec in ds.element_spec.items()
+    ]
+    assert all(len(feature['shape']) <= _MAX_RANK for feature in spec)
+    assert all(not feature['shape'] for feature in spec if feature['dtype'] == 'string')
+    with open(os.path.join(folder_path, _SPEC_FILE_NAME), 'w') as spec_file:
+        json.dump(spec, spec_file)
+
+    elements_count = 0
+    shard_file = None
+    for element in ds.as_numpy_iterator():
+        if elements_count % examples_per_shard == 0:
+            if shard_file is not None:
+                _close_shard(shard_file, index, shard_path)
+            shard_path = os.path.join(folder_path, 'shard-{:05d}'.format(elements_count // examples_per_shard))
+            shard_file = open(shard_path + '.bin', 'wb')
+            index = []
+
+        element_index = []
+        for feature in spec:
+            value = element[feature['name']]
+            if feature['dtype'] == 'string':
+                # Scalar string is stored as its bytes.
+                data, shape = value, (len(value),)
+            else:
+                data, shape = np.ascontiguousarray(value).tobytes(), value.shape
+            shard_file.write(b'\0' * (-shard_file.tell() % _ALIGNMENT))
+            element_index.append([shard_file.tell(), *shape, *[0] * (_MAX_RANK - len(shape))])
+            shard_file.write(data)
+        index.append(element_index)
+        elements_count += 1
+
+    if shard_file is not None:
+        _close_shard(shard_file, index, shard_path)
+    return elements_count
+
+def load_shards(folder_path, num_parallel_calls=tf.data.AUTOTUNE):
+    """Returns dataset of elements written to folder by write_shards, in the same order."""
+    with open(os.path.join(folder_path, _SPEC_FILE_NAME)) as spec_file:
+        spec = json.load(spec_file)
+    shards_pathes = sorted(
+        os.path.join(folder_path, file_name[:-len('.bin')])
+        for file_name in os.listdir(folder_path) if file_name.endswith('.bin'))
+    indexes = [np.load(shard_path + '.index.npy') for shard_path in shards_pathes]
+    # Shards are memory-mapped on first access.
+    shards = {}
+
+    def read_element(shard_number, element_number):
+        if shard_number not in shards:
+            shards[shard_number] = np.memmap(shards_pathes[shard_number] + '.bin', dtype=np.uint8, mode='r')
+        shard = shards[shard_number]
+        values = []
+        for feature, (offset, *shape) in zip(spec, indexes[shard_number][element_number]):
+            if feature['dtype'] == 'string':
+                values.append(shard[offset:offset + shape[0]].tobytes())
+            else:
+                values.append(np.ndarray(shape[:len(feature['shape'])], np.dtype(feature['dtype']), shard, offset))
+        return values
+
+    def read_element_tensors(shard_number, element_number):
+        values = tf.numpy_function(
+            read_element, [shard_number, element_number], [tf.as_dtype(feature['dtype']) for feature in spec])
+        element = {}
+        for feature, value in zip(spec, values):
+            value.set_shape(feature['shape'])
+            element[feature['name']] = value
+        return element
+
+    elements_numbers = np.array(
+        [(i, j) for i, index in enumerate(indexes) for j in range(len(index))], dtype=np.int64).reshape(-1, 2)
+    return tf.data.Dataset.from_tensor_slices((elements_numbers[:, 0], elements_numbers[:, 1])).map(
+        read_element_tensors, num_parallel_calls=num_parallel_calls, deterministic=True)
+
+def _close_shard(shard_file, index, shard_path):
+    shard_file.close()
+    np.save(shard_path + '.index.npy', np.array(index, dtype=np.int64).reshape(-1, len(index[0]), 1 + _MAX_RANK))
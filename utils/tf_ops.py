@@ -0,0 +1,346 @@
+"""Pure TensorFlow implementations of batched ops from ops/ops.so.
+
+Functions have the same inputs and outputs as corresponding custom ops
+and produce equal results, but don't require native build and may be
+compiled with XLA. Ragged inputs and outputs are represented with values
+and int64 row splits.
+"""
+
+import tensorflow as tf
+
+
+def batch_gc_binarize(to_binarize, lengths, gc_lambda):
+    """Same as BatchGcBinarize op with 'chain' solver."""
+    to_binarize = tf.convert_to_tensor(to_binarize, tf.float32)
+    max_length = tf.shape(to_binarize)[1]
+    valid_mask = tf.sequence_mask(lengths, max_length)
+
+    # Costs are computed the same way as capacities of graph in the custom op.
+    source_capacities = _get_capacity(to_binarize)
+    sink_capacities = _get_capacity(1 - to_binarize)
+    pairwise_capacity = _get_capacity(tf.cast(gc_lambda, tf.float32))
+    # unary_costs[i, b, label] is the cost of assigning label to i-th node of b-th example.
+    unary_costs = tf.transpose(tf.stack([source_capacities, sink_capacities], axis=2), [1, 0, 2])
+
+    def propagate(costs, unary_cost):
+        return unary_cost + tf.minimum(costs, tf.reverse(costs, axis=[1]) + pairwise_capacity)
+
+    # prefix_costs[i, b, label] is the min cost of nodes 0..i, given that node i has label.
+    initial_costs = tf.zeros_like(unary_costs[0])
+    prefix_costs = tf.scan(propagate, unary_costs, initializer=initial_costs)
+
+    # suffix_costs[i, b, label] is the min cost of nodes i+1..length-1, given that node i has label.
+    next_unary_costs = tf.concat([unary_costs[1:], tf.zeros_like(unary_costs[:1])], axis=0)
+    has_next = tf.transpose(tf.concat([valid_mask[:, 1:], tf.zeros_like(valid_mask[:, :1])], axis=1))
+
+    def propagate_back(costs, elements):
+        unary_cost, is_valid = elements
+        costs = tf.minimum(costs + unary_cost, tf.reverse(costs + unary_cost, axis=[1]) + pairwise_capacity)
+        return tf.where(is_valid[:, tf.newaxis], costs, tf.zeros_like(costs))
+
+    suffix_costs = tf.scan(
+        propagate_back, (next_unary_costs, has_next), initializer=initial_costs, reverse=True)
+
+    total_costs = tf.transpose(prefix_costs + suffix_costs, [1, 0, 2])
+    # Node belongs to the smallest source side of min cut
+    # iff it belongs to the source side of every min cut.
+    result = tf.logical_and(total_costs[:, :, 1] < total_costs[:, :, 0], valid_mask)
+    return tf.cast(result, tf.int32)
+
+
+def batch_intervals_centers(mask, lengths):
+    """Same as BatchIntervalsCenters op."""
+    is_inside, starts, ends = _get_intervals_bounds(mask, lengths)
+    positions = tf.range(tf.shape(mask)[1])[tf.newaxis, :]
+    is_center = tf.logical_and(is_inside, positions == (starts + ends) // 2)
+    return _dense_mask_to_ragged(is_center, positions)
+
+
+def batch_indices_cube(height, width, heights, widths,
+        h_positions, h_row_splits, v_positions, v_row_splits):
+    """Same as BatchIndicesCube op."""
+    rows, _ = _get_cells_spans(height, heights, h_positions, h_row_splits)
+    cols, _ = _get_cells_spans(width, widths, v_positions, v_row_splits)
+    valid_mask = _get_valid_mask(height, width, heights, widths)
+    batch_size = tf.size(heights)
+
+    examples = tf.broadcast_to(
+        tf.range(batch_size)[:, tf.newaxis, tf.newaxis], (batch_size, height, width))
+    rows = tf.where(valid_mask, tf.broadcast_to(rows[:, :, tf.newaxis], (batch_size, height, width)), 0)
+    cols = tf.where(valid_mask, tf.broadcast_to(cols[:, tf.newaxis, :], (batch_size, height, width)), 0)
+    return tf.stack([examples, rows, cols], axis=3)
+
+
+def batch_reciprocal_cells_areas_matrix(height, width, heights, widths,
+        h_positions, h_row_splits, v_positions, v_row_splits):
+    """Same as BatchReciprocalCellsAreasMatrix op."""
+    _, rows_heights = _get_cells_spans(height, heights, h_positions, h_row_splits)
+    _, cols_widths = _get_cells_spans(width, widths, v_positions, v_row_splits)
+    valid_mask = _get_valid_mask(height, width, heights, widths)
+
+    areas = rows_heights[:, :, tf.newaxis] * cols_widths[:, tf.newaxis, :]
+    areas = tf.where(valid_mask, areas, 1)
+    return tf.where(valid_mask, 1. / tf.cast(areas, tf.float32), 0.)
+
+
+def batch_infer_cells_grid_rects(merge_right_mask, merge_down_mask, rows_counts, cols_counts):
+    """Same as BatchInferCellsGridRects op.
+
+    Cells are found as connected components of grid graph, whose bounding
+    rects are merged while they intersect. Each cell is labeled with
+    row-major index of top-left element of its rect.
+    """
+    batch_size = tf.shape(merge_right_mask)[0]
+    max_rows_count = tf.shape(merge_right_mask)[1]
+    max_cols_count = tf.shape(merge_down_mask)[2]
+    elements_count = max_rows_count * max_cols_count
+
+    rows = tf.broadcast_to(
+        tf.range(max_rows_count)[tf.newaxis, :, tf.newaxis],
+        (batch_size, max_rows_count, max_cols_count))
+    cols = tf.broadcast_to(
+        tf.range(max_cols_count)[tf.newaxis, tf.newaxis, :],
+        (batch_size, max_rows_count, max_cols_count))
+    valid_mask = tf.logical_and(
+        rows < rows_counts[:, tf.newaxis, tf.newaxis],
+        cols < cols_counts[:, tf.newaxis, tf.newaxis])
+    # Padded elements get labels, which are greater than any valid one.
+    initial_labels = tf.where(
+        valid_mask, rows * max_cols_count + cols, elements_count + rows * max_cols_count + cols)
+    # Segment ids of elements for computing rects of each label.
+    batch_offsets = tf.range(batch_size)[:, tf.newaxis, tf.newaxis] * 2 * elements_count
+
+    def get_labels_rects(labels):
+        segment_ids = tf.reshape(labels + batch_offsets, [-1])
+        segments_count = batch_size * 2 * elements_count
+        lefts = tf.math.unsorted_segment_min(tf.reshape(cols, [-1]), segment_ids, segments_count)
+        tops = tf.math.unsorted_segment_min(tf.reshape(rows, [-1]), segment_ids, segments_count)
+        rights = tf.math.unsorted_segment_max(tf.reshape(cols, [-1]), segment_ids, segments_count) + 1
+        bottoms = tf.math.unsorted_segment_max(tf.reshape(rows, [-1]), segment_ids, segments_count) + 1
+        rects = tf.stack([lefts, tops, rights, bottoms], axis=1)
+        return tf.gather(rects, segment_ids)
+
+    def step(labels):
+        # Neighbours are connected, if they should be merged,
+        # or if one of them lies inside the rect of another's label.
+        rects = tf.reshape(get_labels_rects(labels), (batch_size, max_rows_count, max_cols_count, 4))
+        is_right_inside = cols[:, :, 1:] < rects[:, :, :-1, 2]
+        is_left_inside = rects[:, :, 1:, 0] <= cols[:, :, :-1]
+        is_down_inside = rows[:, 1:, :] < rects[:, :-1, :, 3]
+        is_up_inside = rects[:, 1:, :, 1] <= rows[:, :-1, :]
+        connected_right = tf.logical_and(
+            merge_right_mask | is_right_inside | is_left_inside,
+            valid_mask[:, :, :-1] & valid_mask[:, :, 1:])
+        connected_down = tf.logical_and(
+            merge_down_mask | is_down_inside | is_up_inside,
+            valid_mask[:, :-1, :] & valid_mask[:, 1:, :])
+
+        max_label = 2 * elements_count
+        result = labels
+        result = tf.minimum(result, tf.pad(
+            tf.where(connected_right, labels[:, :, 1:], max_label),
+            [[0, 0], [0, 0], [0, 1]], constant_values=max_label))
+        result = tf.minimum(result, tf.pad(
+            tf.where(connected_right, labels[:, :, :-1], max_label),
+            [[0, 0], [0, 0], [1, 0]], constant_values=max_label))
+        result = tf.minimum(result, tf.pad(
+            tf.where(connected_down, labels[:, 1:, :], max_label),
+            [[0, 0], [0, 1], [0, 0]], constant_values=max_label))
+        result = tf.minimum(result, tf.pad(
+            tf.where(connected_down, labels[:, :-1, :], max_label),
+            [[0, 0], [1, 0], [0, 0]], constant_values=max_label))
+        return result
+
+    # Labels only decrease, so propagation stops at fixed point, where
+    # each label covers its rect and rects of different labels don't intersect.
+    def body(labels, has_changed):
+        new_labels = tf.ensure_shape(step(labels), labels.shape)
+        return new_labels, tf.reduce_any(new_labels != labels)
+
+    labels, _ = tf.while_loop(
+        lambda labels, has_changed: has_changed, body, (initial_labels, tf.constant(True)))
+
+    rects = tf.reshape(get_labels_rects(labels), (batch_size, -1, 4))
+    is_top_left = tf.logical_and(labels == initial_labels, valid_mask)
+    return _dense_mask_to_ragged(tf.reshape(is_top_left, (batch_size, -1)), rects)
+
+
+def batch_adjacency_relations_counts(markup_tables, h_positions, h_row_splits,
+        v_positions, v_row_splits, cells_grid_rects, cells_row_splits):
+    """Same as BatchAdjacencyRelationsCounts op.
+
+    Cells are compared with all cells of the batch at once, so memory
+    is quadratic in the number of cells.
+    """
+    markup_tables = tf.convert_to_tensor(markup_tables, tf.int32)
+    batch_size = tf.shape(markup_tables)[0]
+    markup_valid_mask = tf.sequence_mask(markup_tables[:, 0, 5], tf.shape(markup_tables)[1] - 1)
+    text_rects = markup_tables[:, 1:, :4]
+    markup_grid_rects = markup_tables[:, 1:, 4:]
+
+    # Real rects of detected cells are computed from positions of their grids.
+    cells_count = tf.shape(cells_grid_rects)[0]
+    examples = tf.cast(value_rowids(cells_row_splits, tf.cast(cells_count, tf.int64)), tf.int32)
+    h_offsets = tf.cast(tf.gather(h_row_splits, examples), tf.int32)
+    v_offsets = tf.cast(tf.gather(v_row_splits, examples), tf.int32)
+    cells_rects = tf.stack([
+        tf.gather(v_positions, v_offsets + cells_grid_rects[:, 0]),
+        tf.gather(h_positions, h_offsets + cells_grid_rects[:, 1]),
+        tf.gather(v_positions, v_offsets + cells_grid_rects[:, 2]),
+        tf.gather(h_positions, h_offsets + cells_grid_rects[:, 3])
+    ], axis=1)
+    # B x K mask of detected cells of each example.
+    cells_mask = examples[tf.newaxis] == tf.range(batch_size)[:, tf.newaxis]
+
+    markup_directions = _get_adjacency_directions(
+        markup_grid_rects[:, :, tf.newaxis], markup_grid_rects[:, tf.newaxis])
+    markup_relations_mask = tf.logical_and(_get_ordered_pairs_mask(markup_valid_mask), markup_directions > 0)
+
+    # Number of text rects intersecting each detected cell.
+    intersections_mask = tf.logical_and(
+        markup_valid_mask[:, :, tf.newaxis] & cells_mask[:, tf.newaxis],
+        _intersect(text_rects[:, :, tf.newaxis], cells_rects[tf.newaxis, tf.newaxis]))
+    intersections_counts = tf.reduce_sum(tf.cast(intersections_mask, tf.int32), axis=[0, 1])
+
+    # Each text rect is mapped to the last detected cell, which contains it
+    # and doesn't intersect other text rects, or to -1.
+    containment_mask = tf.logical_and(
+        cells_mask[:, tf.newaxis] & (intersections_counts == 1)[tf.newaxis, tf.newaxis],
+        _contains(cells_rects[tf.newaxis, tf.newaxis], text_rects[:, :, tf.newaxis]))
+    mapped_cells = tf.reduce_max(tf.where(containment_mask, tf.range(cells_count), -1), axis=2)
+    is_mapped = mapped_cells >= 0
+    # Grid rects are padded, so that they may be gathered when there are no detected cells.
+    mapped_grid_rects = tf.gather(tf.pad(cells_grid_rects, [[0, 1], [0, 0]]), tf.maximum(mapped_cells, 0))
+    correct_relations_mask = tf.logical_and(
+        markup_relations_mask & is_mapped[:, :, tf.newaxis] & is_mapped[:, tf.newaxis],
+        _get_adjacency_directions(
+            mapped_grid_rects[:, :, tf.newaxis], mapped_grid_rects[:, tf.newaxis]) == markup_directions)
+
+    is_intersected = intersections_counts > 0
+    detected_relations_mask = tf.logical_and(
+        _get_ordered_pairs_mask(is_intersected[tf.newaxis])[0] & (examples[:, tf.newaxis] == examples[tf.newaxis]),
+        _get_adjacency_directions(cells_grid_rects[:, tf.newaxis], cells_grid_rects[tf.newaxis]) > 0)
+    detected_relations_counts = tf.math.unsorted_segment_sum(
+        tf.reduce_sum(tf.cast(detected_relations_mask, tf.int32), axis=1), examples, batch_size)
+
+    return tf.stack([
+        tf.reduce_sum(tf.cast(markup_relations_mask, tf.int32), axis=[1, 2]),
+        tf.reduce_sum(tf.cast(correct_relations_mask, tf.int32), axis=[1, 2]),
+        detected_relations_counts
+    ], axis=1)
+
+
+def get_cells_indices(length, positions, row_splits):
+    """Returns B x length matrix with index of grid cell, containing each element.
+
+    Cells of b-th example are separated by positions[row_splits[b]:row_splits[b+1]],
+    i-th cell spans [positions[i-1], positions[i]).
+    """
+    batch_size = tf.size(row_splits) - 1
+    examples = tf.cast(value_rowids(row_splits, tf.size(positions)), tf.int32)
+
+    # Number of positions less than or equal to each element.
+    histogram = tf.tensor_scatter_nd_add(
+        tf.zeros((batch_size, length + 1), tf.int32),
+        tf.stack([examples, positions], axis=1),
+        tf.ones_like(positions))
+    return tf.cumsum(histogram, axis=1)[:, :-1]
+
+
+def value_rowids(row_splits, values_count):
+    """Same as tf.RaggedTensor.value_rowids, but may be compiled with XLA."""
+    values_indices = tf.range(values_count, dtype=row_splits.dtype)
+    return tf.searchsorted(row_splits[1:], values_indices, side='right', out_type=row_splits.dtype)
+
+
+def _get_capacity(value):
+    return tf.cast(tf.cast(1024 * value, tf.int32), tf.int64)
+
+
+def _get_intervals_bounds(mask, lengths):
+    # Returns mask of elements inside intervals of ones and start (inclusive)
+    # and end (exclusive) of interval, which contains each element.
+    batch_size = tf.shape(mask)[0]
+    max_length = tf.shape(mask)[1]
+    positions = tf.broadcast_to(tf.range(max_length)[tf.newaxis, :], (batch_size, max_length))
+    is_inside = tf.logical_and(mask == 1, tf.sequence_mask(lengths, max_length))
+    is_start = tf.logical_and(
+        is_inside, tf.pad(tf.logical_not(is_inside[:, :-1]), [[0, 0], [1, 0]], constant_values=True))
+
+    # Intervals are numbered from 1 in each example, outside elements get 0.
+    intervals_ids = tf.where(is_inside, tf.cumsum(tf.cast(is_start, tf.int32), axis=1), 0)
+    segment_ids = intervals_ids + tf.range(batch_size)[:, tf.newaxis] * (max_length + 1)
+    segments_count = batch_size * (max_length + 1)
+    starts = tf.math.unsorted_segment_min(positions, segment_ids, segments_count)
+    ends = tf.math.unsorted_segment_max(positions, segment_ids, segments_count) + 1
+    return is_inside, tf.gather(starts, segment_ids), tf.gather(ends, segment_ids)
+
+
+def _get_cells_spans(length, lengths, positions, row_splits):
+    """Returns index of grid cell, containing each element, and size of this cell.
+
+    Grid of b-th example is defined by positions[row_splits[b]:row_splits[b+1]]
+    and its length. Results are B x length matrices.
+    """
+    positions_counts = tf.cast(row_splits[1:] - row_splits[:-1], tf.int32)
+    cells = get_cells_indices(length, positions, row_splits)
+
+    # Cell i of b-th example spans [positions[i-1], positions[i]),
+    # where first and last positions are 0 and lengths[b].
+    offsets = tf.cast(row_splits[:-1], tf.int32)[:, tf.newaxis]
+    last_index = tf.maximum(tf.size(positions) - 1, 0)
+    padded_positions = tf.pad(positions, [[0, 1]])
+    starts = tf.where(
+        cells > 0,
+        tf.gather(padded_positions, tf.clip_by_value(offsets + cells - 1, 0, last_index)),
+        0)
+    ends = tf.where(
+        cells < positions_counts[:, tf.newaxis],
+        tf.gather(padded_positions, tf.clip_by_value(offsets + cells, 0, last_index)),
+        lengths[:, tf.newaxis])
+    return cells, ends - starts
+
+
+def _get_valid_mask(height, width, heights, widths):
+    rows_mask = tf.sequence_mask(heights, height)
+    cols_mask = tf.sequence_mask(widths, width)
+    return tf.logical_and(rows_mask[:, :, tf.newaxis], cols_mask[:, tf.newaxis, :])
+
+
+def _get_adjacency_directions(first_rects, second_rects):
+    # Returns direction of adjacency relation of each pair of rects: 0 if they aren't
+    # adjacent, 1 if second rect is to the right of first one, 2 if it's below.
+    left1, top1, right1, bottom1 = tf.unstack(first_rects, axis=-1)
+    left2, top2, right2, bottom2 = tf.unstack(second_rects, axis=-1)
+    is_horizontal = (right1 == left2) & (top1 < bottom2) & (top2 < bottom1)
+    is_vertical = (bottom1 == top2) & (left1 < right2) & (left2 < right1)
+    return tf.where(is_horizontal, 1, tf.where(is_vertical, 2, 0))
+
+
+def _get_ordered_pairs_mask(mask):
+    # Returns B x N x N mask of pairs i < j of elements, which are set in B x N mask.
+    indices = tf.range(tf.shape(mask)[1])
+    return tf.logical_and(
+        mask[:, :, tf.newaxis] & mask[:, tf.newaxis],
+        (indices[:, tf.newaxis] < indices[tf.newaxis])[tf.newaxis])
+
+
+def _intersect(first_rects, second_rects):
+    left1, top1, right1, bottom1 = tf.unstack(first_rects, axis=-1)
+    left2, top2, right2, bottom2 = tf.unstack(second_rects, axis=-1)
+    return (left1 < right2) & (left2 < right1) & (top1 < bottom2) & (top2 < bottom1)
+
+
+def _contains(outer_rects, inner_rects):
+    left1, top1, right1, bottom1 = tf.unstack(outer_rects, axis=-1)
+    left2, top2, right2, bottom2 = tf.unstack(inner_rects, axis=-1)
+    return (left1 <= left2) & (right2 <= right1) & (top1 <= top2) & (bottom2 <= bottom1)
+
+
+def _dense_mask_to_ragged(mask, values):
+    # Returns values and row splits of ragged tensor, which contains
+    # values[b, i] for each b-th example and each i, where mask[b, i] is set.
+    values = tf.broadcast_to(values, tf.concat([tf.shape(mask), tf.shape(values)[2:]], axis=0))
+    row_lengths = tf.reduce_sum(tf.cast(mask, tf.int64), axis=1)
+    row_splits = tf.concat([tf.zeros((1,), tf.int64), tf.cumsum(row_lengths)], axis=0)
+    return tf.boolean_mask(values, mask), row_splits
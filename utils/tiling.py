@@ -0,0 +1,64 @@
+import tensorflow as tf
+
+
+def map_tiles(fn, inputs, axis, tile_length, context, reduction_factors, dtype=tf.float32):
+    """Applies fn to overlapping tiles of B x H x W x C inputs along axis (1 or 2), and concatenates its outputs.
+
+    Each tile is extended by context pixels on both sides (within input),
+    and the corresponding part of each output is cropped. If context isn't
+    less than receptive field of fn, then result is the same as fn(*inputs).
+    fn returns a list of B x H x W x C tensors, i-th of which is reduced along
+    axis by reduction_factors[i] with 'same' padding. tile_length and context
+    should be multiples of each reduction factor. Inputs may contain None.
+    All outputs have the same dtype.
+    """
+    assert axis in [1, 2]
+    assert all(context % factor == 0 for factor in reduction_factors)
+    # Permutation, which moves axis to the front and back, as TensorArray concatenates along first axis.
+    permutation = [1, 0, 2, 3] if axis == 1 else [2, 1, 0, 3]
+    length = tf.shape(next(input for input in inputs if input is not None))[axis]
+    tiles_count = (length + tile_length - 1) // tile_length
+    outputs_shapes = []
+
+    def compute_tile(index, arrays):
+        start = index * tile_length
+        end = tf.minimum(start + tile_length, length)
+        context_start = tf.maximum(start - context, 0)
+        context_end = tf.minimum(end + context, length)
+        outputs = fn(*[_slice(input, axis, context_start, context_end) for input in inputs])
+        if not outputs_shapes:
+            outputs_shapes.extend(output.shape for output in outputs)
+        result = []
+        for array, output, factor in zip(arrays, outputs, reduction_factors):
+            output_start = (start - context_start) // factor
+            output_end = output_start + (end - start + factor - 1) // factor
+            result.append(array.write(index, tf.transpose(_slice(output, axis, output_start, output_end), permutation)))
+        return index + 1, result
+
+    arrays = [
+        tf.TensorArray(dtype, size=tiles_count, infer_shape=False)
+        for _ in reduction_factors
+    ]
+    _, arrays = tf.while_loop(lambda index, _: index < tiles_count, compute_tile, (0, arrays))
+    results = []
+    for array, shape in zip(arrays, outputs_shapes):
+        result = tf.transpose(array.concat(), permutation)
+        result.set_shape(shape[:axis].concatenate([None]).concatenate(shape[axis + 1:]))
+        results.append(result)
+    return results
+
+def get_tile_length(length, other_length, batch_size, pixels_budget, context, alignment):
+    """Returns length of tiles along axis of given length, so that tile with context fits pixels_budget.
+
+    Tile length is a multiple of alignment and isn't less than context.
+    """
+    tile_length = pixels_budget // tf.maximum(batch_size * other_length, 1) - 2 * context
+    tile_length = tf.maximum(tile_length // alignment * alignment, context)
+    return tf.minimum(tile_length, (length + alignment - 1) // alignment * alignment)
+
+def _slice(input, axis, start, end):
+    if input is None:
+        return None
+    if axis == 1:
+        return input[:, start:end]
+    return input[:, :, start:end]